@@ -0,0 +1,58 @@
+"""
+bench_spatial.py: spatial index update cost during interactive editing.
+
+Builds a large deployment, then repeatedly adds a small cluster,
+strikes a few nodes and runs the neighbourhood query that
+the live graph needs after every edit.
+"rebuild" reproduces the old behaviour of rebuilding the KDTree
+after every edit, the other rows use the indexes in `spatial`.
+
+Run with `python benchmarks/bench_spatial.py [num_nodes]`.
+"""
+
+import sys
+import time
+
+import numpy as np
+
+from bapmesim_tk.sim import Sim
+
+
+def deployment(sim, num_nodes, rng):
+    for loc in rng.uniform(-20, 20, size=(num_nodes // 1000, 2)):
+        sim.add_cluster(rng.normal(loc, 1, size=(1000, 2)))
+
+
+def edits(sim, rng, rebuild):
+    for _ in range(50):
+        loc = rng.uniform(-20, 20, size=2)
+        start = sim.add_cluster(rng.normal(loc, 0.1, size=(10, 2)))
+        if rebuild:
+            sim.make_tree()
+        sim.query_ball(sim.nodes_pos[start:], 0.05)
+
+        sim.strike(rng.uniform(-20, 20, size=(1, 2)), 0.02)
+        if rebuild:
+            sim.make_tree()
+        sim.query_ball(rng.uniform(-20, 20, size=(3, 2)), 0.05)
+
+
+def bench(num_nodes):
+    for name, index, rebuild in (
+            ('rebuild', 'kdtree', True),
+            ('kdtree', 'kdtree', False),
+            ('grid', 'grid', False),
+            ):
+        rng = np.random.default_rng(0)
+        sim = Sim(index=index, cell_size=0.05)
+        deployment(sim, num_nodes, rng)
+        sim.query_ball([(0, 0)], 0.05)
+
+        start = time.perf_counter()
+        edits(sim, rng, rebuild)
+        elapsed = time.perf_counter() - start
+        print(f"{name:>8}: {elapsed * 1000 / 50:8.2f} ms per edit round")
+
+
+if __name__ == '__main__':
+    bench(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
@@ -1,3 +1,9 @@
-from bapmesim_tk.bapmesim_tk import cli
-cli()
+import multiprocessing
 
+from bapmesim_tk.commands import main
+
+# Worker processes that are spawned import the main module again
+if __name__ == '__main__':
+    # Lets workers start from frozen (PyInstaller) executables
+    multiprocessing.freeze_support()
+    main()
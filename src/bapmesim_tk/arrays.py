@@ -0,0 +1,22 @@
+"""
+arrays.py: small numpy helpers shared across modules.
+"""
+
+import numpy as np
+
+
+def ragged_arange(starts, counts):
+    """
+    Concatenate `arange(start, start + count)` for every pair,
+    without a Python loop.
+
+    ragged_arange([10, 20], [3, 2]) = [10, 11, 12, 20, 21]
+    """
+    starts = np.asarray(starts, dtype=np.intp)
+    counts = np.asarray(counts, dtype=np.intp)
+    offsets = np.cumsum(counts) - counts
+    return (
+        np.arange(counts.sum())
+        - np.repeat(offsets, counts)
+        + np.repeat(starts, counts)
+        )
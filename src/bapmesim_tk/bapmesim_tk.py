@@ -4,18 +4,27 @@ import platform
 import logging
 import re
 import importlib.resources
+import functools
+import threading
+import contextlib
+import time
+import code
 
 import numpy as np
-import scipy as sp
-import networkx as nx
 import matplotlib.pyplot as plt
-import rasterio
 
 from matplotlib.figure import Figure 
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 from matplotlib.backends.backend_tkagg import NavigationToolbar2Tk
 
-from .iters import duplets
+from .sim import Sim
+from .commands import Commands, find_script
+from .tasks import Worker, UIQueue, OnUI, Cancelled
+from . import render
+from . import plots
+from .view import View
+from .terrain import Terrain
+from .cache import LRUCache
 from . import res
 from . import sample_scripts
 from . import sample_terrains
@@ -28,25 +37,24 @@ log = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
 
-try:
-    import IPython
-    import threading
-    from IPython.core.debugger import set_trace
-    HAVE_IPYTHON=True
-except ImportError:
-    log.error(
-        "Could not import IPython. Falling back to "
-        "builtin `code.InteractiveConsole`. "
-        "Expect jank."
-        )
-    import code
-    HAVE_IPYTHON=False
-
+@functools.cache
+def ipython():
+    """
+    Import IPython on first use, for the shell.
+    None (after a warning) if it is not installed.
+    """
+    try:
+        import IPython
+        import IPython.terminal.embed
+    except ImportError:
+        log.error(
+            "Could not import IPython. Falling back to "
+            "builtin `code.InteractiveConsole`. "
+            "Expect jank."
+            )
+        return None
+    return IPython
 
-def reverse_canvas_cpair(cpair):
-    x = (cpair[0] - 200) / 50
-    y = (cpair[1] - 200) / 50
-    return x, y
 
 DO_NOT_GARBAGE_COLLECT = []
 
@@ -58,215 +66,103 @@ def get_bitmap(filename, master):
     DO_NOT_GARBAGE_COLLECT.append(bitmap)
     return bitmap
 
-class Sim:
+class SimCMD(Commands):
     """
-    Simulator backend, no graphics.
-
-    Attributes
-    ----------
-
-    nodes_pos
-        np.array of coordinate pairs.
-        This contains all nodes of all clusters.
-
-    clst_indices
-        Indices of `self.nodes_pos` that point to the
-        clusterhead of every cluster.
-        The last item is not an index, but the total
-        number of nodes.
+    Interactive commands for simulation, redrawing the GUI.
 
+    Commands run on the simulation worker (see `SimTK.submit`),
+    everything that touches Tk or the plots is handed to the UI thread.
     """
-    def __init__(self):
-        self.reset()
-
-    def reset(self):
-        self.nodes_pos = None
-        self.clst_indices = [0]
-
-    def circles(self, radii, nodes, loc):
-        #print(radii, nodes)
-        assert len(radii) == len(nodes), \
-            "number of `radii` and `nodes` lists must be the same."
-
-        new_nodes = [loc]
-
-        for radius, num_nodes in zip(radii, nodes, strict=True):
-            for angle in np.linspace(0, np.pi * 2, num_nodes):
-                # This is very slow but i find myself in a state
-                # of peculiar confusion that prevents me from
-                # doing this the fast numpy way for now.
-                # Hopefully this changes soon.
-                new_nodes.append((
-                    np.sin(angle) * radius + loc[0],
-                    np.cos(angle) * radius + loc[1],
-                    ))
-
-        if self.nodes_pos is None:
-            self.nodes_pos = np.vstack((
-                loc,
-                new_nodes
-                ))
-
-        else:
-            self.nodes_pos = np.vstack((
-                self.nodes_pos,
-                loc,
-                new_nodes
-                ))
-
-        self.clst_indices.append(len(self.nodes_pos))
-        self.make_tree()
-
-
-    def scatter_nodes(self, num, loc, scale):
-        scattered_nodes = np.random.normal(
-            loc=loc,
-            scale=scale,
-            size=(num - 1, 2)
-            )
-
-        if self.nodes_pos is None:
-            self.nodes_pos = np.vstack((
-                    loc,
-                    scattered_nodes
-                    ))
-
-        else:
-            self.nodes_pos = np.vstack((
-                    self.nodes_pos,
-                    loc,
-                    scattered_nodes
-                    ))
-
-        self.clst_indices.append(len(self.nodes_pos))
-
-        self.make_tree()
-
-    @property
-    def num_nodes(self):
-        return len(self.nodes_pos)
-
-    @property
-    def num_connected(self):
-        return len(self.path_lengths)
-
-    @property
-    def num_disconnected(self):
-        return self.num_nodes - self.num_connected
-
-    def make_tree(self):
-        self.kdtree = sp.spatial.KDTree(self.nodes_pos)
-
-    def make_graph(self, node_range):
-        self.graph = nx.Graph()
-        self.graph.add_nodes_from(range(self.num_nodes))
-
-        self.graph.add_edges_from(
-            self.kdtree.query_pairs(node_range)
-            )
-
-        self.path_lengths = nx.single_source_shortest_path_length(
-            self.graph, 0
-            )
-
-    def load_terrain(self, *args):
-        self.ter_reader = rasterio.open(*args)
-        self.ter = self.ter_reader.read(1)
-
-class SimCMD:
-    """Interactive commands for simulation."""
     def __init__(self, simtk):
+        super().__init__(simtk.sim)
         self.simtk = simtk
+        self._next_frame = 0
+
+    def on_ui(self, fn, *args):
+        """Call `fn(*args)` on the UI thread and wait for it."""
+        return self.simtk.ui.call(fn, *args)
+
+    def changed(self):
+        """
+        Redraw, at most once per `SimTK.frame_interval`
+        and leaving at least as much time for the simulation
+        as drawing takes. Edits that come quicker
+        are drawn by `SimTK.poll` once the command is done.
+        """
+        start = time.perf_counter()
+        if start < self._next_frame:
+            self.simtk.invalidate(plots=self.sim.live is not None)
+            return
+        self.on_ui(self.simtk.draw_nodes)
+        self.update_live_plots()
+        end = time.perf_counter()
+        self._next_frame = max(
+            start + self.simtk.frame_interval, 2 * end - start)
+
+    @contextlib.contextmanager
+    def batch(self):
+        # Typed into the shell, the block is spread over many tasks,
+        # so enter and leave it on the worker too
+        manager = super().batch()
+        self.simtk.ui.wait(self.simtk.worker.submit(manager.__enter__).future)
+        try:
+            yield self
+        finally:
+            self.simtk.ui.wait(self.simtk.worker.submit(
+                manager.__exit__, None, None, None).future)
+
+    def make_plots(self, node_range=0.1, link_model='range'):
+        super().make_plots(node_range, link_model)
+        self.draw_plots()
+
+    def track(self, node_range=0.1, link_model='range'):
+        """Update the plots after every edit instead of on request."""
+        super().track(node_range, link_model)
+        self.update_live_plots()
+
+    def update_live_plots(self):
+        if self.simtk.sim.live is None:
+            return
+        self.draw_plots()
+
+    def draw_plots(self):
+        self.on_ui(self.simtk.plot_path_length_hist)
+        self.on_ui(self.simtk.plot_connected_pie)
+
+    def render(self, mode):
+        """Switch between 'raster' and 'vector' node drawing."""
+        if mode not in RENDER_MODES:
+            raise ValueError(
+                f"Unknown render mode {mode!r}, "
+                f"expected one of {RENDER_MODES}"
+                )
+        self.simtk.render_mode = mode
+        self.on_ui(self.simtk.draw_nodes)
+
+    def zoom(self, factor):
+        """Zoom in by `factor` around the centre of the canvas."""
+        self.on_ui(self.simtk.zoom, factor)
 
-    def scatter(self, num, loc=(0, 0), scale=1):
-        self.simtk.sim.scatter_nodes(num, loc, scale)
-        self.simtk.draw_nodes()
-
-    def circles(self, radii, nodes, loc=(0, 0)):
-        self.simtk.sim.circles(radii, nodes, loc)
-        self.simtk.draw_nodes()
-
-    def meteor(self, size, loc=(0, 0)):
-        points = self.simtk.sim.kdtree.query_ball_point(loc, size)
-        #points.sort()
-        #print(points)
-        #print(len(points))
-
-        # FIXME cleanup this spaghett
-        #print(f"brefore: {self.simtk.sim.clst_indices}")
-        nodes_in_clsts = [0] * len(self.simtk.sim.clst_indices)
-        for point in points:
-            for i, (left, right) in enumerate(duplets(self.simtk.sim.clst_indices)):
-                i = i + 1
-                if left <= point < right:
-                    #print(f"point {point} in {right}")
-                    for x in range(i, len(self.simtk.sim.clst_indices)):
-                        nodes_in_clsts[x] += 1
-
-        for i, x in enumerate(nodes_in_clsts):
-            self.simtk.sim.clst_indices[i] -= x
-
-        #self.simtk.sim.clst_indices[-1] -= len(points)
-        #print(f"after: {self.simtk.sim.clst_indices}")
-
-        #print(len(self.simtk.sim.nodes_pos))
-        self.simtk.sim.nodes_pos = np.delete(
-            self.simtk.sim.nodes_pos, points, axis=0)
-        #print(len(self.simtk.sim.nodes_pos))
-        self.simtk.sim.make_tree()
-        self.simtk.draw_nodes()
-
-    def meteors(self, size, num):
-        xmin, ymin = self.simtk.sim.nodes_pos.min(axis=0)
-        xmax, ymax = self.simtk.sim.nodes_pos.max(axis=0)
-        positions = np.random.uniform(
-            [xmin, ymin],
-            [xmax, ymax],
-            size=[num, 2]
-            )
-        for loc in positions:
-            self.meteor(size, loc)
-
-    def make_plots(self, node_range=0.1):
-        self.simtk.sim.make_graph(node_range)
-        self.simtk.plot_path_length_hist()
-        self.simtk.plot_connected_pie()
+    def pan(self, dx, dy):
+        """Move the picture by (`dx`, `dy`) pixels."""
+        self.on_ui(self.simtk.pan, dx, dy)
 
     def egg(self):
-        self.simtk.egg()
+        self.on_ui(self.simtk.egg)
 
     def load_terrain(self, path):
-        self.simtk.sim.load_terrain(path)
-        self.simtk.show_terrain()
+        super().load_terrain(path)
+        self.on_ui(self.simtk.show_terrain)
 
     def hillshade(self, azi: float, alti: float):
-        # Thanks to
-        # https://www.neonscience.org/resources/learning-hub/tutorials/create-hillshade-py
-        azi = np.deg2rad(360.0 - azi)
-        alti = np.deg2rad(alti)
+        super().hillshade(azi, alti)
+        self.on_ui(self.simtk.show_terrain)
 
-        x, y = np.gradient(self.simtk.sim.ter)
-        slope = np.pi / 2. - np.arctan(np.sqrt(x * x + y * y))
-        aspect = np.arctan2(-x, y)
-
-        shaded = (
-            np.sin(azi) * np.sin(slope)
-            + np.cos(alti)
-            * np.cos(slope)
-            * np.cos((azi - np.pi / 2.) - aspect)
-            )
-
-        scale = np.iinfo(self.simtk.sim.ter.dtype).max
-
-        self.simtk.sim.shaded = (
-            scale * (shaded + 1) / 2 ).astype(self.simtk.sim.ter.dtype)
-        self.simtk.show_terrain()
-
-    def script(self, scriptpath, outpath):
-        with open(scriptpath, 'r') as f:
+    def script(self, scriptpath, outpath=None):
+        with open(find_script(scriptpath), 'r') as f:
             scriptcode = f.read()
 
-        if HAVE_IPYTHON:
+        if ipython() is not None:
             exec(scriptcode, self.simtk.console_locs)
         else:
             self.simtk.console_code.runsource(
@@ -348,6 +244,10 @@ class Tool:
 
         self.setup()
 
+    def submit(self, command, *args, **kwargs):
+        """Run `command` on the simulation worker."""
+        return self.cmd.simtk.submit(command, *args, **kwargs)
+
     def cb_click(self, event):
         pass
 
@@ -377,8 +277,9 @@ class ToolScatter(Tool):
         self.ui_scale.grid(row=0, column=3)
 
     def cb_click(self, event):
-        x, y = reverse_canvas_cpair((event.x, event.y))
-        self.cmd.scatter(
+        x, y = self.cmd.simtk.view.to_world((event.x, event.y))
+        self.submit(
+            self.cmd.scatter,
             num=int(self.ui_num.get()),
             loc=(x, y),
             scale=float(self.ui_scale.get())
@@ -419,8 +320,9 @@ class ToolCircles(Tool):
             r'\d+(?:\.\d+)?'
             )
 
-        x, y = reverse_canvas_cpair((event.x, event.y))
-        self.cmd.circles(
+        x, y = self.cmd.simtk.view.to_world((event.x, event.y))
+        self.submit(
+            self.cmd.circles,
             radii=tuple(map(float, self.re_floats.findall(self.ui_radii.get()))),
             nodes=tuple(map(int, self.re_ints.findall(self.ui_nodes.get()))),
             loc=(x, y),
@@ -441,8 +343,9 @@ class ToolMeteor(Tool):
         self.ui_size.grid(row=0, column=1)
 
     def cb_click(self, event):
-        x, y = reverse_canvas_cpair((event.x, event.y))
-        self.cmd.meteor(
+        x, y = self.cmd.simtk.view.to_world((event.x, event.y))
+        self.submit(
+            self.cmd.meteor,
             size=float(self.ui_size.get()),
             loc=(x, y),
             )
@@ -475,7 +378,8 @@ class ToolMeteors(Tool):
         self.ui_but.grid(row=2, column=0, columnspan=2)
 
     def cb_click(self, event):
-        self.cmd.meteors(
+        self.submit(
+            self.cmd.meteors,
             size=float(self.ui_size.get()),
             num=int(self.ui_num.get()),
             )
@@ -495,11 +399,44 @@ class ToolPlot(Tool):
             text="Make plots!",
             command=self.make_plots
             )
+        self.ui_live = tk.IntVar(self.frame)
+        self.ui_check_live = tk.Checkbutton(
+            self.frame,
+            text="Live",
+            variable=self.ui_live,
+            command=self.toggle_live
+            )
+        self.ui_los = tk.IntVar(self.frame)
+        self.ui_check_los = tk.Checkbutton(
+            self.frame,
+            text="Line of sight",
+            variable=self.ui_los,
+            )
         self.ui_range.pack()
         self.ui_but.pack()
+        self.ui_check_live.pack()
+        self.ui_check_los.pack()
+
+    @property
+    def link_model(self):
+        return 'los' if self.ui_los.get() else 'range'
 
     def make_plots(self):
-        self.cmd.make_plots(node_range=float(self.ui_range.get()))
+        self.submit(
+            self.cmd.make_plots,
+            node_range=float(self.ui_range.get()),
+            link_model=self.link_model,
+            )
+
+    def toggle_live(self):
+        if self.ui_live.get():
+            self.submit(
+                self.cmd.track,
+                node_range=float(self.ui_range.get()),
+                link_model=self.link_model,
+                )
+        else:
+            self.submit(self.cmd.untrack)
 
 class ToolScripts(Tool):
     name = "Scripts"
@@ -587,7 +524,7 @@ class ToolScripts(Tool):
         #    )
 
     def run(self):
-        self.cmd.script(self.scriptpath, self.outpath)
+        self.submit(self.cmd.script, self.scriptpath, self.outpath)
 
 class ToolTerrain(Tool):
     name = "Terrain"
@@ -623,7 +560,7 @@ class ToolTerrain(Tool):
         if not path:
             return
 
-        self.cmd.load_terrain(path)
+        self.submit(self.cmd.load_terrain, path)
 
 class ToolHillshade(Tool):
     name = "Hillshade"
@@ -657,24 +594,58 @@ class ToolHillshade(Tool):
         self.ui_but.grid(row=3)
 
     def hillshade(self):
-        self.cmd.hillshade(
+        self.submit(
+            self.cmd.hillshade,
             float(self.ui_azi.get()),
             float(self.ui_alti.get()),
             )
 
 
+RENDER_MODES = ('raster', 'vector')
+
 class SimTK:
-    """Simulator with TK graphics. Encapsulates `Sim` instance."""
-    def __init__(self, sim: Sim):
+    """
+    Simulator with TK graphics. Encapsulates `Sim` instance.
+
+    `render_mode` is 'raster' to draw every node into one image,
+    or 'vector' to draw up to 200 nodes per cluster as canvas items.
+
+    Commands run on `worker`, one at a time, off the UI thread.
+    The UI thread drains `ui` every `poll_interval` milliseconds
+    to draw what they changed, and shows their progress.
+    """
+    def __init__(self, sim: Sim, render_mode='raster'):
+        if render_mode not in RENDER_MODES:
+            raise ValueError(
+                f"Unknown render mode {render_mode!r}, "
+                f"expected one of {RENDER_MODES}"
+                )
         self.sim = sim
+        self.render_mode = render_mode
+        self.ter_display = None
+        # uint8 display pyramids of terrains and hillshades
+        # and the tiles they have converted so far
+        self.pyramids = LRUCache(512 << 20)
+        self.display_tiles = LRUCache(128 << 20)
+        self._crop_key = None
+
+        self.ui = UIQueue()
+        self.worker = Worker()
+        self.poll_interval = 20
+        self.frame_interval = 1 / 30
+        self._draw_pending = False
+        self._plots_pending = False
 
         self.fig_pie, self.ax_pie = plt.subplots(1, figsize=(3.5, 2.5))
         self.fig_hist, self.ax_hist = plt.subplots(1, figsize=(3.5, 2.5))
 
         self.root = tk.Tk()
 
-        self.scroll_x = 0
-        self.scroll_y = 0
+        self.view = View(400, 400)
+        self.pan_step = 10
+        self.zoom_step = 1.25
+        self.lod_density = 0.25
+        self.node_img = tk.PhotoImage(master=self.root)
 
         if platform.system() == 'Linux':
             self.root.attributes('-type', 'dialog')
@@ -688,8 +659,8 @@ class SimTK:
 
         self.canvas = tk.Canvas(
             self.root,
-            width=400,
-            height=400
+            width=self.view.width,
+            height=self.view.height
             )
 
         self.canvas_pie = FigureCanvasTkAgg(
@@ -702,6 +673,11 @@ class SimTK:
             self.root,
             )
 
+        self.hop_hist = plots.HopHistogram(
+            self.ax_hist, plots.Blitter(self.canvas_hist))
+        self.connected_pie = plots.ConnectedPie(
+            self.ax_pie, plots.Blitter(self.canvas_pie))
+
 
         self.frame_tbar = tk.Frame(self.root)
 
@@ -714,6 +690,19 @@ class SimTK:
         self.canvas_pie.get_tk_widget().grid(row=0, column=3) 
         self.canvas_hist.get_tk_widget().grid(row=1, column=3) 
 
+        self.frame_status = tk.Frame(self.root)
+        self.frame_status.grid(row=3, column=1, columnspan=3, sticky='ew')
+        self.ui_status = tk.Label(self.frame_status, anchor='w')
+        self.ui_status.pack(side='left', fill='x', expand=True)
+        self.ui_cancel = tk.Button(
+            self.frame_status,
+            text="Cancel",
+            command=self.worker.cancel,
+            state='disabled',
+            )
+        self.ui_cancel.pack(side='right')
+        self.root.bind('<Escape>', lambda event: self.worker.cancel())
+
         self.cmd = SimCMD(self)
 
         self.tbar = Toolbar(
@@ -735,6 +724,92 @@ class SimTK:
         self.canvas.bind("<Button>", self.cb_button)
         self.canvas.bind("<MouseWheel>", self.cb_mousewheel)
 
+        self.root.after(self.poll_interval, self.poll)
+
+    def submit(self, command, *args, **kwargs):
+        """
+        Run `command` on the worker without waiting for it.
+        Errors are logged, since nobody is waiting for them.
+        """
+        task = self.worker.submit(command, *args, **kwargs)
+        task.future.add_done_callback(
+            lambda future, name=task.name: self._log_failure(name, future))
+        return task
+
+    @staticmethod
+    def _log_failure(name, future):
+        if future.cancelled():
+            return
+        e = future.exception()
+        if isinstance(e, Cancelled):
+            log.info(f"Cancelled {name}")
+        elif e is not None:
+            log.error(f"{name} failed", exc_info=e)
+
+    def command(self, fn):
+        """
+        `fn` as a shell command: it runs on the worker
+        and the shell waits for its result.
+        """
+        @functools.wraps(fn)
+        def command(*args, **kwargs):
+            return self.ui.wait(self.worker.submit(fn, *args, **kwargs).future)
+        return command
+
+    def poll(self):
+        """
+        Make the calls queued for the UI thread
+        and show what the worker is doing. Runs every `poll_interval`.
+        """
+        self.ui.drain(budget=self.poll_interval / 1000)
+        if self._draw_pending:
+            self.request_draw()
+        self.show_status()
+        self.root.after(self.poll_interval, self.poll)
+
+    def show_status(self):
+        task = self.worker.current
+        if task is None:
+            text = ""
+        else:
+            text = task.name
+            if task.fraction is not None:
+                text += f" {task.fraction:.0%}"
+            if task.message:
+                text += f": {task.message}"
+            if self.worker.pending:
+                text += f" ({self.worker.pending} more queued)"
+        if text != self.ui_status['text']:
+            self.ui_status.config(text=text)
+            self.ui_cancel.config(state='disabled' if task is None else 'normal')
+
+    def invalidate(self, plots=False):
+        """
+        Have `poll` redraw the nodes, and with `plots` the plots,
+        once no command is busy with the simulation.
+        """
+        self._draw_pending = True
+        self._plots_pending |= plots
+
+    def request_draw(self, plots=False):
+        """
+        Redraw the nodes (and with `plots` the plots) now,
+        unless a command is busy with the simulation;
+        then `poll` redraws once it is done.
+        """
+        self.invalidate(plots)
+        if not self.worker.lock.acquire(blocking=False):
+            return
+        try:
+            self._draw_pending = False
+            self.draw_nodes()
+            if self._plots_pending:
+                self._plots_pending = False
+                self.plot_path_length_hist()
+                self.plot_connected_pie()
+        finally:
+            self.worker.lock.release()
+
     def cb_button(self, event):
         if event.num == 1:
             self.tbar.cb_click(event)
@@ -760,21 +835,23 @@ class SimTK:
         # Windows scroll handling works completely differently,
         # that's handled in cb_mousewheel
 
+        # Holding control zooms around the pointer instead.
+
+        elif event.num in (4, 5) and event.state & 4:
+            self.zoom(self.zoom_step if event.num == 4 else 1 / self.zoom_step,
+                (event.x, event.y))
+
         elif event.num == 4 and event.state == 1 or event.num == 6:
-            self.scroll_x += 1
-            self.canvas.scan_dragto(self.scroll_x, self.scroll_y)
+            self.pan(self.pan_step, 0)
 
         elif event.num == 5 and event.state == 1 or event.num == 7:
-            self.scroll_x -= 1
-            self.canvas.scan_dragto(self.scroll_x, self.scroll_y)
+            self.pan(-self.pan_step, 0)
 
         elif event.num == 4:
-            self.scroll_y += 1
-            self.canvas.scan_dragto(self.scroll_x, self.scroll_y)
+            self.pan(0, self.pan_step)
 
         elif event.num == 5:
-            self.scroll_y -= 1
-            self.canvas.scan_dragto(self.scroll_x, self.scroll_y)
+            self.pan(0, -self.pan_step)
 
         # FIXME state is probably a bitmask,
         # read it idiomatically
@@ -784,81 +861,221 @@ class SimTK:
     def cb_mousewheel(self, event):
         # MouseWheel events are only emitted in Windows.
         # For linux/xorg scrolling is handled in cb_button
-        if event.state == 1:
-            self.scroll_x += event.delta // abs(event.delta)
+        step = event.delta // abs(event.delta)
+        if event.state & 4:
+            self.zoom(self.zoom_step ** step, (event.x, event.y))
+        elif event.state == 1:
+            self.pan(step * self.pan_step, 0)
         else:
-            self.scroll_y += event.delta // abs(event.delta)
-        self.canvas.scan_dragto(self.scroll_x, self.scroll_y)
+            self.pan(0, step * self.pan_step)
+
+    def pan(self, dx, dy):
+        """Move the picture by (`dx`, `dy`) pixels and redraw."""
+        self.view.pan(dx, dy)
+        self.request_draw()
 
+    def zoom(self, factor, about=None):
+        """Zoom in by `factor` around canvas pixel `about` and redraw."""
+        self.view.zoom(factor, about)
+        self.request_draw()
 
     def callback_scatter(self):
         self.sim.scatter_nodes(int(self.spin_num_nodes.get()))
         self.draw_nodes()
 
     def canvas_cpair(self, cpair):
-        cx = cpair[0] * 50 + 200
-        cy = cpair[1] * 50 + 200
+        cx, cy = self.view.to_screen(cpair)
         return cx, cy
 
     def draw_node(self, cpair, style=None):
         #x, y = self.sim.nodes_pos[index]
         cx, cy = self.canvas_cpair(cpair)
 
-        style = style or {}
+        style = {'tags': 'nodes', **(style or {})}
 
         self.canvas.create_line(cx - 2, cy - 2, cx + 2, cy + 2, **style)
         self.canvas.create_line(cx - 2, cy + 2, cx + 2, cy - 2, **style)
 
     def draw_nodes(self):
-        self.canvas.delete("all")
-
-        for clst, clst_next in duplets(self.sim.clst_indices):
-
-            if clst_next - clst > 200:
-                log.info(f"Drawing 200 nodes of {clst_next - clst}")
+        if self.render_mode == 'raster':
+            self.draw_nodes_raster()
+        else:
+            self.draw_nodes_vector()
 
-            for node_i in range(clst + 1, min(clst + 200, clst_next)):
+    def show_image(self, rgb):
+        """Show an RGB image as the canvas background."""
+        height, width, _ = rgb.shape
+        # Thanks https://stackoverflow.com/a/68601202
+        # for this clever trick
+        self.node_img.configure(
+            width=width,
+            height=height,
+            data=render.ppm(rgb),
+            format='PPM'
+            )
+        if not self.canvas.find_withtag('raster'):
+            self.canvas.create_image(
+                (0, 0),
+                image=self.node_img,
+                anchor='nw',
+                tags='raster'
+                )
+            self.canvas.tag_lower('raster')
+
+    def draw_nodes_vector(self):
+        """
+        Draw up to 200 visible nodes per cluster as canvas items,
+        over the terrain.
+        """
+        self.canvas.delete('nodes')
+        self.show_image(self.terrain_crop())
+
+        visible = self.view.contains(self.sim.nodes_pos)
+        for clst in range(self.sim.clusters.num):
+            members = self.sim.members(clst)
+            if not len(members):
+                continue
+            head = members[0]
+            members = members[visible[members]]
+
+            if len(members) > 200:
+                log.info(f"Drawing 200 nodes of {len(members)}")
+
+            for node_i in members[members != head][:199]:
                 self.draw_node(self.sim.nodes_pos[node_i])
 
-                self.draw_node(self.sim.nodes_pos[clst],
+            if visible[head]:
+                self.draw_node(self.sim.nodes_pos[head],
                     style={'fill': 'red'})
 
+    def draw_nodes_raster(self):
+        """
+        Rasterize every visible node, dead ones included,
+        over the visible part of the terrain
+        and show the result as a single image.
+
+        Visible nodes are found through the spatial index.
+        Once there are more than `lod_density` of them per pixel
+        they are drawn as density cells, with only the clusterheads
+        still drawn as markers.
+        """
+        self.canvas.delete('nodes')
+
+        lo, hi = self.view.bounds
+        slots = self.sim.nodes_in_box(lo, hi, dead=True)
+        num_visible = len(slots)
+        if num_visible == len(self.sim.alive):
+            # Views instead of copies when everything is visible
+            slots = slice(None)
+        pos = self.sim.nodes_pos[slots]
+        alive = self.sim.alive[slots]
+
+        # Hop counts are only meaningful if they are up to date
+        path_lengths = getattr(self.sim, 'path_lengths', None)
+        if path_lengths is not None and len(path_lengths) != len(self.sim.alive):
+            path_lengths = None
+        classes = render.node_classes(
+            self.sim.alive, self.sim.clusters.heads, path_lengths)[slots]
+        is_head = classes == render.HEAD
+
+        background = self.terrain_crop()
+        if num_visible > self.lod_density * self.view.width * self.view.height:
+            background = render.density(
+                pos[alive],
+                classes[alive] == render.DISCONNECTED,
+                self.view.origin,
+                self.view.scale,
+                self.view.shape,
+                background=background,
+                )
+            pos = pos[is_head]
+            classes = classes[is_head]
+
+        self.show_image(render.rasterize(
+            pos,
+            classes,
+            self.view.origin,
+            self.view.scale,
+            self.view.shape,
+            background=background,
+            ))
+
+    def terrain_crop(self):
+        """
+        Greyscale terrain under the view, as a uint8 RGB image
+        padded with the canvas background colour.
+        Terrain pixels are placed in the world by its `transform`
+        and sampled nearest-neighbour.
+        """
+        rgb = np.array(self.canvas.winfo_rgb(self.canvas['background'])) >> 8
+        crop = np.empty((*self.view.shape, 3), dtype=np.uint8)
+        crop[:] = rgb
+        ter = self.ter_display
+        if ter is None:
+            return crop
+
+        # Node edits redraw over an unchanged view
+        key = (ter, self.view.scale, tuple(self.view.origin), self.view.shape)
+        if key == self._crop_key:
+            return self._crop.copy()
+
+        # Only read the window under the view,
+        # at the coarsest level that still has a pixel per screen pixel
+        scale = ter.transform.scale
+        offset = ter.transform.offset
+        level = ter.level_for(scale.min() / self.view.scale)
+        factor = 2 ** level
+        xs, ys = self.view.pixel_centres()
+        cols = np.floor((xs * scale[0] + offset[0]) / factor).astype(np.intp)
+        rows = np.floor((ys * scale[1] + offset[1]) / factor).astype(np.intp)
+        ter_h, ter_w = ter.level_shape(level)
+        in_cols = (cols >= 0) & (cols < ter_w)
+        in_rows = (rows >= 0) & (rows < ter_h)
+        if in_cols.any() and in_rows.any():
+            cols = cols[in_cols]
+            rows = rows[in_rows]
+            window = ter.read(
+                slice(rows.min(), rows.max() + 1),
+                slice(cols.min(), cols.max() + 1),
+                level
+                )
+            crop[np.ix_(in_rows, in_cols)] = window[
+                np.ix_(rows - rows.min(), cols - cols.min())][:, :, None]
+
+        self._crop_key = key
+        self._crop = crop
+        return crop.copy()
+
     def plot_path_length_hist(self):
         """Make plot of number of hops to root node for each node."""
-        self.ax_hist.clear()
-        self.ax_hist.hist(
-            self.sim.path_lengths.values(),
-            bins=tuple(range(
-                0,
-                max(self.sim.path_lengths.values()) + 2
-                ))
-            )
-        self.canvas_hist.draw()
+        self.hop_hist.update(self.sim.hop_histogram())
 
     def plot_connected_pie(self):
-        self.ax_pie.clear()
-        self.ax_pie.pie(
-            (self.sim.num_connected, self.sim.num_disconnected),
-            labels=('connected', 'disconnected'),
-            )
-        #self.ax_pie.legend()
-        self.canvas_pie.draw()
+        self.connected_pie.update(
+            self.sim.num_connected, self.sim.num_disconnected)
 
     def mainloop(self):
         self.root.mainloop()
 
     def spawn_shell(self):
+        # Commands run on the worker and pyplot on the UI thread,
+        # whether typed into the shell or run by a script
         self.console_locs = {
             **locals(),
             **globals(),
+            'plt': OnUI(plt, self.ui),
+            'cancel': self.worker.cancel,
             **{
-                k: v for k in dir(self.cmd)
+                k: self.command(v) for k in dir(self.cmd)
                 if not k.startswith('_')
                 and callable(v := getattr(self.cmd, k))
                 }
             }
 
-        if HAVE_IPYTHON:
+        IPython = ipython()
+        if IPython is not None:
+            from IPython.core.debugger import set_trace
+            self.console_locs['set_trace'] = set_trace
             self.console_ipy = IPython.terminal.embed.InteractiveShellEmbed(
                 #config=c,
                 user_ns=self.console_locs
@@ -871,7 +1088,7 @@ class SimTK:
             self.console_code.interact()
 
     def spawn_shell_nonblocking(self):
-        if HAVE_IPYTHON:
+        if ipython() is not None:
             threading.Thread(
                 target=self.spawn_shell,
                 daemon=True
@@ -909,31 +1126,23 @@ class SimTK:
 
     def show_terrain(self):
         # FIXME this is some top-quality spaghett
-        image = getattr(self.sim, 'shaded', self.sim.ter)
-
-        height, width = image.shape
-        info = np.iinfo(image.dtype)
-        norm = image / (info.max - info.min) + (info.min / (info.max - info.min))
-        uint8 = (norm * 255).astype(np.uint8)
-
-        # Thanks https://stackoverflow.com/a/68601202
-        # for this clever trick
-        data = b''.join((
-            f'P5 {width} {height} 255 '.encode('ascii'),
-            uint8.tobytes()
-            ))
-
-        self.ter_img = tk.PhotoImage(
-            master=self.root,
-            width=width,
-            height=height,
-            data=data,
-            format='PPM'
-            )#.subsample(10, 10)
-        #self.ter_img = tk.PhotoImage(
-        #    file=path, master=self.root
-        #    ).subsample(10, 10)
-        self.canvas.create_image((width / 2, height / 2), image=self.ter_img)
+        shaded = getattr(self.sim, 'shaded', None)
+        source = self.sim.terrain if shaded is None else shaded
+
+        # Arrays are not hashable, but the pyramid keeps
+        # the array alive, so its id cannot be reused meanwhile
+        key = id(source)
+        pyramid = self.pyramids.get(key)
+        if pyramid is None:
+            if shaded is not None:
+                # Placed like the terrain it shades
+                source = Terrain.from_array(
+                    shaded, transform=self.sim.terrain.transform)
+            pyramid = source.display(cache=self.display_tiles)
+            self.pyramids.put(key, pyramid)
+
+        self.ter_display = pyramid
+        self.draw_nodes()
 
 def cli():
     sim = Sim()
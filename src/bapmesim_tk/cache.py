@@ -0,0 +1,82 @@
+"""
+cache.py: least-recently-used cache bounded by memory use.
+"""
+
+from collections import OrderedDict
+import threading
+
+
+def nbytes(value):
+    """Memory used by an array, or a tuple of arrays."""
+    if isinstance(value, tuple):
+        return sum(map(nbytes, value))
+    return getattr(value, 'nbytes', 0)
+
+
+class LRUCache:
+    """
+    Mapping that forgets the least recently used entries
+    once the values add up to more than `max_bytes`.
+
+    Values larger than `max_bytes` on their own are not stored,
+    so the budget always holds.
+    The cache can be used from several threads at once.
+
+    Attributes
+    ----------
+
+    max_bytes
+        Memory budget.
+
+    size
+        Memory currently used by the values.
+
+    """
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # Locks cannot be pickled (or deep copied), and need not be
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._entries:
+                return default
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def put(self, key, value):
+        """Store `value`, unless it is larger than the whole budget."""
+        size = nbytes(value)
+        with self._lock:
+            if key in self._entries:
+                self.size -= nbytes(self._entries.pop(key))
+            if size > self.max_bytes:
+                return
+            self._entries[key] = value
+            self.size += size
+
+            while self.size > self.max_bytes:
+                _, old = self._entries.popitem(last=False)
+                self.size -= nbytes(old)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
@@ -0,0 +1,72 @@
+"""
+checkpoint.py: save simulation state to memory-mappable `.npz` files.
+
+Checkpoints are ordinary uncompressed `.npz` archives
+(readable with `np.load`), one `.npy` member per array
+plus a `meta` member with the scalars as JSON.
+Members of an uncompressed zip are stored as-is,
+so `load` finds the data of every array through the zip headers
+and memory maps it in place instead of reading it.
+"""
+
+import json
+import struct
+import zipfile
+
+import numpy as np
+
+# Fixed part of a zip local file header,
+# followed by the file name and the extra field
+_LOCAL_HEADER = struct.Struct('<4sHHHHHIIIHH')
+
+
+def save(path, arrays, meta):
+    """Write `arrays` and the JSON-able `meta` to `path`, uncompressed."""
+    # Through a file, so that `path` is used as is, without adding `.npz`
+    with open(path, 'wb') as f:
+        np.savez(f, meta=np.array(json.dumps(meta)), **arrays)
+
+
+def _member_offset(f, info):
+    """Offset of the data of the stored zip member `info` in the file."""
+    f.seek(info.header_offset)
+    fields = _LOCAL_HEADER.unpack(f.read(_LOCAL_HEADER.size))
+    name_length, extra_length = fields[-2:]
+    return info.header_offset + _LOCAL_HEADER.size + name_length + extra_length
+
+
+def load(path, mode='c'):
+    """
+    Open a checkpoint written by `save`,
+    return its arrays as memory maps opened with `mode`
+    (default copy-on-write) and its meta.
+    """
+    arrays = {}
+    with open(path, 'rb') as f, zipfile.ZipFile(f) as archive:
+        meta = json.loads(str(np.load(archive.open('meta.npy'))))
+        for info in archive.infolist():
+            key = info.filename.removesuffix('.npy')
+            if key == 'meta':
+                continue
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError(
+                    f"Member {info.filename} of {path} is compressed, "
+                    "checkpoints have to be saved uncompressed"
+                    )
+
+            f.seek(_member_offset(f, info))
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran, dtype = np.lib.format.read_array_header_2_0(f)
+
+            if not np.prod(shape):
+                # Nothing to map
+                arrays[key] = np.empty(shape, dtype=dtype)
+                continue
+            arrays[key] = np.memmap(
+                f, dtype=dtype, mode=mode, offset=f.tell(),
+                shape=shape, order='F' if fortran else 'C',
+                )
+    return arrays, meta
@@ -0,0 +1,221 @@
+"""
+commands.py: the command surface shared by scripts, the shell and the GUI.
+
+`Commands` drives a `Sim` without any display.
+The GUI subclasses it to redraw after every edit,
+and `run` executes scripts with it headless,
+which is what `python -m bapmesim_tk run script.py` does.
+
+Nothing here imports tkinter,
+and matplotlib is only imported if a script plots something.
+"""
+
+import argparse
+import contextlib
+import importlib.resources
+import os
+import warnings
+
+import numpy as np
+
+from .sim import Sim
+from . import sample_scripts
+
+
+class LazyPyplot:
+    """
+    Stand-in for `matplotlib.pyplot` that imports it on first use,
+    after selecting `backend` (if given).
+    """
+    def __init__(self, backend=None):
+        self.backend = backend
+        self.module = None
+
+    def __getattr__(self, name):
+        if self.module is None:
+            import matplotlib
+            if self.backend is not None:
+                matplotlib.use(self.backend)
+            import matplotlib.pyplot
+            self.module = matplotlib.pyplot
+        return getattr(self.module, name)
+
+
+# Headless scripts plot into images, never windows
+plt = LazyPyplot('Agg')
+
+
+def find_script(path):
+    """
+    Return `path` if it exists,
+    otherwise the bundled sample script of that name.
+    """
+    if os.path.exists(path):
+        return path
+    bundled = importlib.resources.files(sample_scripts) / path
+    if bundled.is_file():
+        return str(bundled)
+    raise FileNotFoundError(f"No script {path!r}, and no sample script of that name")
+
+
+class Commands:
+    """
+    Commands for scripts and the interactive shell.
+
+    Every command that edits the simulation calls `changed` afterwards,
+    which does nothing headless and redraws in the GUI.
+    Inside `batch`, it is called once at the end instead.
+    """
+    def __init__(self, sim):
+        self.sim = sim
+        self._batch_depth = 0
+        self._dirty = False
+
+    def changed(self):
+        """Hook called after every edit."""
+
+    def _edited(self):
+        if self._batch_depth:
+            self._dirty = True
+        else:
+            self.changed()
+
+    @contextlib.contextmanager
+    def batch(self):
+        """
+        Group the commands in the `with` block:
+        the simulation defers its bookkeeping until the end
+        (see `Sim.batch`), and `changed` is only called once.
+        """
+        self._batch_depth += 1
+        try:
+            with self.sim.batch():
+                yield self
+        finally:
+            self._batch_depth -= 1
+            if not self._batch_depth and self._dirty:
+                self._dirty = False
+                self.changed()
+
+    def scatter(self, num, loc=(0, 0), scale=1):
+        self.sim.scatter_nodes(num, loc, scale)
+        self._edited()
+
+    def circles(self, radii, nodes, loc=(0, 0)):
+        self.sim.circles(radii, nodes, loc)
+        self._edited()
+
+    def scatter_terrain(
+            self, num, loc=(0, 0), scale=1, elevation=None, max_slope=None):
+        self.sim.scatter_on_terrain(
+            num, loc, scale, elevation=elevation, max_slope=max_slope)
+        self._edited()
+
+    def box(self, num, loc=(0, 0), extent=2):
+        self.deploy('box', loc, extent, num)
+
+    def grid(self, shape, loc=(0, 0), spacing=0.1):
+        self.deploy('square_grid', loc, spacing, shape)
+
+    def hexgrid(self, shape, loc=(0, 0), spacing=0.1):
+        self.deploy('hex_grid', loc, spacing, shape)
+
+    def poisson(self, radius, loc=(0, 0), extent=2, num=None):
+        self.deploy('poisson_disk', loc, extent, radius, num)
+
+    def deploy(self, pattern, *args, **kwargs):
+        self.sim.deploy(pattern, *args, **kwargs)
+        self._edited()
+
+    def meteor(self, size, loc=(0, 0)):
+        self.sim.strike([loc], size)
+        self._edited()
+
+    def meteors(self, size, num):
+        self.sim.strike(self.sim.random_impacts(num), size)
+        self._edited()
+
+    def make_plots(self, node_range=0.1, link_model='range'):
+        self.sim.make_graph(node_range, link_model)
+
+    def track(self, node_range=0.1, link_model='range'):
+        """Update the graph after every edit instead of on request."""
+        self.sim.track(node_range, link_model)
+
+    def untrack(self):
+        self.sim.untrack()
+
+    def load_terrain(self, path):
+        self.sim.load_terrain(path)
+
+    def hillshade(self, azi: float, alti: float):
+        self.sim.hillshade(azi, alti)
+
+    def namespace(self, outpath=None):
+        """
+        Globals for scripts: every public command,
+        `self` (with `self.sim`), `np`, `plt` and `outpath`.
+        """
+        return {
+            'np': np,
+            'plt': plt,
+            'self': self,
+            'outpath': outpath,
+            **{
+                k: v for k in dir(self)
+                if not k.startswith('_')
+                and callable(v := getattr(self, k))
+                }
+            }
+
+    def script(self, scriptpath, outpath=None):
+        scriptpath = find_script(scriptpath)
+        with open(scriptpath, 'r') as f:
+            scriptcode = f.read()
+
+        with warnings.catch_warnings():
+            # Scripts written for the GUI show their figures
+            warnings.filterwarnings(
+                'ignore', message='.*non-interactive', category=UserWarning)
+            exec(compile(scriptcode, scriptpath, 'exec'), self.namespace(outpath))
+
+
+def run(scriptpath, outpath=None, sim=None):
+    """
+    Run a script headless against `sim` (default a new `Sim`).
+    Bundled sample scripts can be given by name.
+
+    Figures the script leaves open are saved to `outpath`
+    as `figure-<number>.png`.
+    Returns the `Commands` the script ran with.
+    """
+    cmd = Commands(Sim() if sim is None else sim)
+    cmd.script(scriptpath, outpath)
+
+    if outpath is not None and plt.module is not None:
+        os.makedirs(outpath, exist_ok=True)
+        for num in plt.get_fignums():
+            plt.figure(num).savefig(os.path.join(outpath, f'figure-{num}.png'))
+    return cmd
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='bapmesim_tk',
+        description="BAP Mesh Simulator. Starts the GUI without a command.",
+        )
+    commands = parser.add_subparsers(dest='command')
+    parser_run = commands.add_parser(
+        'run', help="run a script without the GUI")
+    parser_run.add_argument(
+        'script', help="script file, or the name of a bundled sample script")
+    parser_run.add_argument(
+        '-o', '--outpath', help="directory to save the open figures to")
+    args = parser.parse_args(argv)
+
+    if args.command == 'run':
+        run(args.script, args.outpath)
+        return
+
+    from .bapmesim_tk import cli
+    cli()
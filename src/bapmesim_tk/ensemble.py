@@ -0,0 +1,199 @@
+"""
+ensemble.py: Monte Carlo ensembles of independent simulation runs.
+
+A scenario is a function that takes a fresh `Sim`,
+deploys, strikes and evaluates it,
+and optionally returns a dict of extra metrics.
+Every replica gets its own `Sim` whose `rng` is seeded from
+an independent child of one `SeedSequence`,
+so an ensemble is reproducible from its seed
+no matter how the replicas are spread over processes.
+
+Metrics stream back as replicas finish and are folded into
+`RunningStats`, which can report means and confidence intervals
+at any point, long before the last replica is done.
+"""
+
+import functools
+
+import numpy as np
+
+from .sim import Sim
+from .tasks import process_map, progress
+
+
+def metrics(sim):
+    """
+    Standard metrics of the last graph of `sim`:
+    `num_nodes`, `num_connected` and `hops`,
+    the histogram of hop counts to the root.
+    """
+    return {
+        'num_nodes': sim.num_nodes,
+        'num_connected': sim.num_connected,
+        'hops': sim.hop_histogram(),
+        }
+
+
+def replica(scenario, seed, sim_kwargs=None):
+    """Run `scenario` once on a new `Sim` seeded with `seed`, return its metrics."""
+    sim = Sim(rng=seed, **(sim_kwargs or {}))
+    extra = scenario(sim)
+    return {**metrics(sim), **(extra or {})}
+
+
+def _pad(array, shape):
+    """Zero-pad `array` at the end of every axis up to `shape`."""
+    if array.shape == shape:
+        return array
+    return np.pad(array, [(0, n - m) for n, m in zip(shape, array.shape)])
+
+
+class RunningStats:
+    """
+    Streaming mean and variance of every metric (Welford's algorithm),
+    element-wise for array metrics.
+
+    Arrays of different lengths, like hop histograms,
+    are zero-padded to the longest one seen so far.
+
+    Attributes
+    ----------
+
+    count
+        Number of replicas added per metric.
+
+    mean
+        Running mean per metric.
+
+    """
+    def __init__(self):
+        self.count = {}
+        self.mean = {}
+        self._m2 = {}
+
+    def add(self, values):
+        """Fold the metrics of one replica in."""
+        for name, value in values.items():
+            value = np.asarray(value, dtype=float)
+            if name not in self.mean:
+                self.count[name] = 0
+                self.mean[name] = np.zeros_like(value)
+                self._m2[name] = np.zeros_like(value)
+            shape = tuple(map(max, value.shape, self.mean[name].shape))
+            value = _pad(value, shape)
+            mean = self.mean[name] = _pad(self.mean[name], shape)
+            m2 = self._m2[name] = _pad(self._m2[name], shape)
+
+            self.count[name] += 1
+            delta = value - mean
+            mean += delta / self.count[name]
+            m2 += delta * (value - mean)
+
+    def var(self, name):
+        """Sample variance of metric `name`."""
+        return self._m2[name] / max(self.count[name] - 1, 1)
+
+    def interval(self, name, level=0.95):
+        """
+        Student t confidence interval (low, high)
+        of the mean of metric `name`, NaN below two replicas.
+        """
+        import scipy.stats
+
+        count = self.count[name]
+        if count < 2:
+            nan = np.full_like(self.mean[name], np.nan)
+            return nan, nan
+        half = scipy.stats.t.ppf((1 + level) / 2, count - 1) \
+            * np.sqrt(self.var(name) / count)
+        return self.mean[name] - half, self.mean[name] + half
+
+    def summary(self, level=0.95):
+        """Mean, low and high of the confidence interval of every metric."""
+        return {
+            name: (self.mean[name], *self.interval(name, level))
+            for name in self.mean
+            }
+
+
+class Ensemble:
+    """
+    Run `replicas` replicas of `scenario` over a process pool.
+
+    Iterating yields (replica number, metrics) in the order
+    replicas finish, each already folded into `stats`.
+    `run` just runs them all.
+
+    Workers start from a clean process by default,
+    which is safe from the GUI but needs `scenario`
+    to be picklable: a function defined in a module
+    (like those in `scenarios`), not in a script or the console.
+    With `start_method='fork'` the workers inherit `scenario`,
+    so closures and functions defined in scripts work,
+    but only do that from a script that runs no threads,
+    see `tasks.process_context`.
+
+    Attributes
+    ----------
+
+    seed
+        Seed of the root `SeedSequence`, None for fresh entropy.
+        `seeds` holds its children, one per replica.
+
+    workers
+        Number of worker processes, None for one per CPU,
+        0 to run the replicas in this process.
+
+    sim_kwargs
+        Keyword arguments for every `Sim`.
+
+    start_method
+        `multiprocessing` start method of the workers,
+        None for the safe default.
+
+    stats
+        `RunningStats` of the replicas that finished so far.
+
+    """
+    def __init__(
+            self, scenario, replicas, seed=None, workers=None, sim_kwargs=None,
+            start_method=None):
+        self.scenario = scenario
+        self.seed = seed
+        self.seeds = np.random.SeedSequence(seed).spawn(replicas)
+        self.workers = workers
+        self.sim_kwargs = sim_kwargs
+        self.start_method = start_method
+        self.stats = RunningStats()
+
+    def __iter__(self):
+        if self.workers == 0:
+            for num, seed in enumerate(self.seeds):
+                progress(num / len(self.seeds), "replicas")
+                values = replica(self.scenario, seed, self.sim_kwargs)
+                self.stats.add(values)
+                yield num, values
+            return
+
+        for num, values in process_map(
+                functools.partial(
+                    replica, self.scenario, sim_kwargs=self.sim_kwargs),
+                self.seeds,
+                self.workers,
+                self.start_method,
+                "replicas",
+                ):
+            self.stats.add(values)
+            yield num, values
+
+    def run(self, report=None):
+        """
+        Run every replica and return `stats`.
+        `report(num, values, stats)` is called as each one finishes.
+        """
+        for num, values in self:
+            if report is not None:
+                report(num, values, self.stats)
+        return self.stats
+
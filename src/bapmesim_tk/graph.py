@@ -0,0 +1,195 @@
+"""
+graph.py: array-based graph helpers.
+
+Graphs are stored as symmetric `scipy.sparse` CSR adjacency matrices
+built directly from the pair arrays returned by
+`KDTree.query_pairs(..., output_type='ndarray')`,
+so no per-edge Python objects are ever created.
+"""
+
+import numpy as np
+import scipy as sp
+
+from .arrays import ragged_arange
+
+
+def adjacency(pairs, num_nodes: int):
+    """
+    Build a symmetric CSR adjacency matrix from an (m, 2) array of pairs.
+
+    Every pair is stored in both directions.
+    """
+    pairs = np.asarray(pairs, dtype=np.int32).reshape(-1, 2)
+    rows = np.concatenate((pairs[:, 0], pairs[:, 1]))
+    cols = np.concatenate((pairs[:, 1], pairs[:, 0]))
+    return sp.sparse.csr_array(
+        (np.ones(len(rows), dtype=np.int8), (rows, cols)),
+        shape=(num_nodes, num_nodes),
+        )
+
+
+def from_csr(data, indices, indptr, shape):
+    """
+    Adjacency matrix over existing CSR arrays, without copying them,
+    e.g. memory maps or shared memory.
+    """
+    return sp.sparse.csr_array((data, indices, indptr), shape=shape, copy=False)
+
+
+def hop_counts(adj, source: int):
+    """
+    Return the number of hops from `source` to every node.
+
+    The result is an int32 array with -1 for unreachable nodes.
+    """
+    dist = sp.sparse.csgraph.shortest_path(
+        adj,
+        directed=False,
+        unweighted=True,
+        indices=source,
+        )
+    hops = np.full(len(dist), -1, dtype=np.int32)
+    reached = np.isfinite(dist)
+    hops[reached] = dist[reached]
+    return hops
+
+
+def components(adj):
+    """
+    Return the number of connected components
+    and the component label of every node.
+    """
+    return sp.sparse.csgraph.connected_components(adj, directed=False)
+
+
+def neighbours(adj, nodes):
+    """
+    Return the neighbours of every node in `nodes`
+    and how many each node has.
+
+    The neighbours of `nodes[0]` come first,
+    then those of `nodes[1]`, and so on.
+    """
+    starts = adj.indptr[nodes]
+    counts = adj.indptr[np.asarray(nodes) + 1] - starts
+    return adj.indices[ragged_arange(starts, counts)], counts
+
+
+def relax_hops(adj, hops, frontier):
+    """
+    Lower hop counts in place after nodes or edges were added.
+
+    `hops` holds the current hop counts (-1 for unreachable),
+    `frontier` the nodes whose hop count has just decreased.
+    Improvements are pushed outwards one level at a time,
+    so only the part of the graph that actually gets closer
+    is visited.
+
+    `adj` may also be any graph with a `neighbours(nodes)` method
+    that works like `neighbours`, e.g. a `LiveGraph`.
+    """
+    find = getattr(adj, 'neighbours', None) or (
+        lambda nodes: neighbours(adj, nodes))
+    frontier = np.asarray(frontier, dtype=np.intp)
+    while len(frontier):
+        nbrs, counts = find(frontier)
+        cand = np.repeat(hops[frontier] + 1, counts)
+
+        better = (hops[nbrs] < 0) | (cand < hops[nbrs])
+        nbrs = nbrs[better]
+        cand = cand[better]
+
+        # Several frontier nodes may reach the same neighbour,
+        # keep the smallest candidate for each.
+        order = np.lexsort((cand, nbrs))
+        nbrs, first = np.unique(nbrs[order], return_index=True)
+        hops[nbrs] = cand[order][first]
+        frontier = nbrs
+
+
+def nearest_sources(adj, sources, alive=None):
+    """
+    Multi-source breadth-first search:
+    the hop count from every node to its nearest node in `sources`,
+    and which one that is, as an index into `sources`.
+
+    All sources are searched at once, one level at a time,
+    so the whole search visits every edge once.
+    Nodes equally close to several sources go to the first of them.
+    Nodes outside the mask `alive` (if given) are left out,
+    as sources and on the way.
+    Returns two arrays, both -1 for nodes no source reaches:
+    int32 hop counts and intp source indices.
+    """
+    sources = np.asarray(sources, dtype=np.intp)
+    hops = np.full(adj.shape[0], -1, dtype=np.int32)
+    nearest = np.full(adj.shape[0], -1, dtype=np.intp)
+    # The first of duplicate sources wins
+    frontier, first = np.unique(sources, return_index=True)
+    if alive is not None:
+        first = first[alive[frontier]]
+        frontier = frontier[alive[frontier]]
+    hops[frontier] = 0
+    nearest[frontier] = first
+
+    level = 0
+    while len(frontier):
+        nbrs, counts = neighbours(adj, frontier)
+        owners = np.repeat(nearest[frontier], counts)
+        new = hops[nbrs] < 0
+        if alive is not None:
+            new &= alive[nbrs]
+        nbrs = nbrs[new]
+        owners = owners[new]
+
+        # Nodes reached from several sources at once
+        # go to the lowest source index
+        order = np.lexsort((owners, nbrs))
+        nbrs, first = np.unique(nbrs[order], return_index=True)
+        level += 1
+        hops[nbrs] = level
+        nearest[nbrs] = owners[order][first]
+        frontier = nbrs
+    return hops, nearest
+
+
+def kruskal_forest(pairs, keys, num_nodes: int):
+    """
+    Return the indices of the pairs that form a minimum spanning forest
+    with respect to `keys`, sorted by increasing key.
+
+    Sweeping only these edges in order through a union-find
+    merges exactly the same sets, at exactly the same keys,
+    as sweeping every edge,
+    but the forest is found in C by `csgraph.minimum_spanning_tree`.
+    Only the order of `keys` matters, so ties and zero keys are fine.
+    """
+    pairs = np.asarray(pairs).reshape(-1, 2)
+    order = np.argsort(keys, kind='stable')
+
+    # Edges are weighted by their 1-based rank,
+    # because the sparse matrix would drop zero weights.
+    ranks = np.empty(len(order), dtype=float)
+    ranks[order] = np.arange(1, len(order) + 1)
+
+    forest = sp.sparse.csgraph.minimum_spanning_tree(
+        sp.sparse.coo_array(
+            (ranks, (pairs[:, 0], pairs[:, 1])),
+            shape=(num_nodes, num_nodes),
+            )
+        )
+    return order[np.sort(forest.data).astype(np.intp) - 1]
+
+
+def to_networkx(adj, nodes=None):
+    """
+    Export an adjacency matrix as an `nx.Graph`,
+    keeping only `nodes` (and the edges among them) if given.
+
+    networkx is only imported when this is called.
+    """
+    import networkx as nx
+    graph = nx.from_scipy_sparse_array(adj)
+    if nodes is not None:
+        graph = graph.subgraph(np.asarray(nodes).tolist()).copy()
+    return graph
@@ -0,0 +1,164 @@
+"""
+hillshade.py: tiled, memoized hillshading of terrains.
+
+Shading is split in two steps.
+The slope and aspect of the terrain do not depend on the sun,
+so they are computed once per tile,
+and kept as the sines and cosines the shading formula needs.
+Shading for a given sun position is then
+a few float32 multiply-adds per pixel.
+Tiles are read, analysed and shaded one at a time,
+so memory use does not grow with the terrain.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import tempfile
+
+import numpy as np
+
+from .cache import LRUCache
+
+
+class Hillshader:
+    """
+    Hillshade terrains tile by tile, remembering recent results.
+
+    Apart from the output, memory use is bounded by
+    a few float32 temporaries per tile in flight and the two caches,
+    whatever the size of the terrain.
+    Outputs too large for the `shades` budget are written
+    to a temporary memory map, unless the caller passes its own.
+
+    Attributes
+    ----------
+
+    tile_size
+        Side of the square tiles, in pixels.
+
+    threads
+        Number of worker threads to spread tiles over,
+        None to work in the calling thread.
+
+    terms
+        `LRUCache` of the slope and aspect terms of recent tiles,
+        keyed by (terrain, row start, row stop, column start, column stop).
+
+    shades
+        `LRUCache` of shaded uint8 images,
+        keyed by (terrain, azimuth, altitude).
+
+    """
+    def __init__(self, tile_size=512, threads=None, max_bytes=512 << 20):
+        self.tile_size = tile_size
+        self.threads = threads
+        self.terms = LRUCache(max_bytes // 2)
+        self.shades = LRUCache(max_bytes // 2)
+
+    def _tiles(self, shape):
+        size = self.tile_size
+        for r0 in range(0, shape[0], size):
+            for c0 in range(0, shape[1], size):
+                yield slice(r0, min(r0 + size, shape[0])), \
+                    slice(c0, min(c0 + size, shape[1]))
+
+    def _each_tile(self, func, shape):
+        """Call `func(rows, cols)` for every tile of `shape`."""
+        tiles = list(self._tiles(shape))
+        if self.threads is None:
+            for rows, cols in tiles:
+                func(rows, cols)
+            return
+        with ThreadPoolExecutor(self.threads) as pool:
+            # list() to raise any exception from the workers
+            list(pool.map(lambda tile: func(*tile), tiles))
+
+    def slope_aspect(self, terrain, rows, cols):
+        """
+        Return sin(slope), cos(slope), cos(aspect) and sin(aspect)
+        of the pixels `rows`, `cols` (slices) of `terrain`
+        as float32 arrays, with slope and aspect as in `shade`.
+        """
+        key = (terrain, rows.start, rows.stop, cols.start, cols.stop)
+        terms = self.terms.get(key)
+        if terms is not None:
+            return terms
+
+        # One pixel of halo, so that the central differences
+        # at tile edges match those of the whole raster
+        shape = terrain.shape
+        r0, r1 = max(rows.start - 1, 0), min(rows.stop + 1, shape[0])
+        c0, c1 = max(cols.start - 1, 0), min(cols.stop + 1, shape[1])
+        z = terrain.read(slice(r0, r1), slice(c0, c1)).astype(np.float32)
+        x, y = np.gradient(z) if min(z.shape) > 1 else (
+            np.zeros_like(z), np.zeros_like(z))
+        inner = (
+            slice(rows.start - r0, rows.stop - r0),
+            slice(cols.start - c0, cols.stop - c0),
+            )
+        x, y = x[inner], y[inner]
+
+        # slope = pi/2 - arctan(g), aspect = arctan2(-x, y),
+        # without evaluating a single trig function
+        g = np.hypot(x, y)
+        sin_slope = 1 / np.sqrt(1 + g * g)
+        cos_slope = g * sin_slope
+        flat = g == 0
+        g[flat] = 1
+        cos_aspect = np.where(flat, np.float32(1), y / g)
+        sin_aspect = np.where(flat, np.float32(0), -x / g)
+
+        terms = sin_slope, cos_slope, cos_aspect, sin_aspect
+        self.terms.put(key, terms)
+        return terms
+
+    def _output(self, shape):
+        """uint8 image of `shape`, memory mapped if too large to cache."""
+        if shape[0] * shape[1] <= self.shades.max_bytes:
+            return np.empty(shape, dtype=np.uint8)
+        return np.memmap(
+            tempfile.TemporaryFile(), dtype=np.uint8, mode='w+', shape=shape)
+
+    def shade(self, terrain, azimuth, altitude, out=None):
+        """
+        Hillshade `terrain` lit from `azimuth` and `altitude` (degrees)
+        into a uint8 image, brighter facing the sun.
+
+        The image is written into `out` if given
+        (e.g. a memory map of the caller's), which is not cached.
+        """
+        key = (terrain, azimuth, altitude)
+        shaded = self.shades.get(key)
+        if shaded is not None:
+            if out is None:
+                return shaded
+            out[...] = shaded
+            return out
+
+        # Thanks to
+        # https://www.neonscience.org/resources/learning-hub/tutorials/create-hillshade-py
+        azi = np.deg2rad(360.0 - azimuth)
+        alti = np.deg2rad(altitude)
+
+        # shaded = sin(alti) sin(slope)
+        #     + cos(alti) cos(slope) cos(azi - pi/2 - aspect)
+        a = np.float32(np.sin(alti))
+        b = np.float32(np.cos(alti) * np.cos(azi - np.pi / 2))
+        c = np.float32(np.cos(alti) * np.sin(azi - np.pi / 2))
+        shaded = self._output(terrain.shape) if out is None else out
+
+        def tile(rows, cols):
+            sin_slope, cos_slope, cos_aspect, sin_aspect = \
+                self.slope_aspect(terrain, rows, cols)
+            light = cos_aspect * b
+            light += sin_aspect * c
+            light *= cos_slope
+            light += sin_slope * a
+            # -1..1 onto 0..255
+            light += 1
+            light *= 127.5
+            shaded[rows, cols] = np.clip(light, 0, 255)
+
+        self._each_tile(tile, terrain.shape)
+        if out is None:
+            self.shades.put(key, shaded)
+        return shaded
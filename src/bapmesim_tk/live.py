@@ -0,0 +1,395 @@
+"""
+live.py: connectivity that is kept up to date as nodes come and go.
+"""
+
+import numpy as np
+
+from . import graph
+from .nodes import _grow
+
+
+class _Links:
+    """
+    Links stored as a few CSR matrices of decreasing size,
+    so that adding links never rebuilds one big matrix.
+
+    New links get a matrix of their own, first merged with
+    the matrices before it that are not bigger (like carries
+    in a binary counter), so every link is copied O(log links) times
+    in all, and a neighbour lookup goes through O(log links) matrices.
+    Links of dead nodes are left in place, and dropped
+    when their matrix is merged.
+    """
+    def __init__(self, pairs, num_slots):
+        self.levels = []
+        self.add(pairs, num_slots)
+
+    @property
+    def pairs(self):
+        return np.concatenate(
+            [pairs for pairs, _ in self.levels]
+            or [np.empty((0, 2), dtype=np.intp)]
+            )
+
+    def add(self, pairs, num_slots, components=None):
+        """
+        Add an (m, 2) array of new links.
+        `components` (-1 for dead slots) drops dead links while merging.
+        """
+        pairs = np.asarray(pairs, dtype=np.intp).reshape(-1, 2)
+        if not len(pairs):
+            return
+        merged = False
+        while self.levels and len(self.levels[-1][0]) <= len(pairs):
+            older, _ = self.levels.pop()
+            pairs = np.concatenate((older, pairs))
+            merged = True
+        if merged and components is not None:
+            pairs = pairs[
+                (components[pairs[:, 0]] >= 0) & (components[pairs[:, 1]] >= 0)]
+        if len(pairs):
+            self.levels.append((pairs, graph.adjacency(pairs, num_slots)))
+
+    def neighbours(self, nodes):
+        """
+        Return the neighbours of `nodes`, dead or alive,
+        and which node each one belongs to (as an index into `nodes`).
+        """
+        owners = []
+        nbrs = []
+        for _, adj in self.levels:
+            inside = np.flatnonzero(nodes < adj.shape[0])
+            level_nbrs, counts = graph.neighbours(adj, nodes[inside])
+            owners.append(np.repeat(inside, counts))
+            nbrs.append(level_nbrs)
+        if not nbrs:
+            return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp)
+        return np.concatenate(owners), np.concatenate(nbrs)
+
+
+class LiveGraph:
+    """
+    Graph, components and hop counts to the root for a fixed node range,
+    updated incrementally instead of rebuilt after every edit.
+
+    Inserted nodes only query their own neighbourhood,
+    their links are added without rebuilding the others,
+    and hop counts are only lowered where the new nodes
+    actually shorten a path.
+    Components that new nodes join are merged
+    into the biggest of them, so only the smaller ones are relabelled.
+    Deletions only re-examine the components that lost nodes,
+    and hop counts are only recomputed
+    if the root's component was one of them.
+    None of this scans every slot or every link.
+
+    Attributes
+    ----------
+
+    node_range
+        Range at which two nodes are linked.
+
+    pairs
+        (m, 2) array of linked node slots.
+
+    adjacency
+        Symmetric CSR adjacency matrix of `pairs`,
+        built when first asked for after an edit.
+
+    components
+        Component label of every slot, -1 for dead slots.
+        Labels are not consecutive.
+
+    num_components
+        Number of connected components.
+
+    path_lengths
+        int32 hop counts to the root, -1 if unreachable or dead.
+
+    link_filter
+        Optional function that takes an (m, 2) array of candidate pairs
+        in range and returns a mask of those that actually link.
+
+    """
+    def __init__(self, node_range, link_filter=None):
+        self.node_range = node_range
+        self.link_filter = link_filter
+        self.reset(
+            np.empty((0, 2), dtype=np.intp),
+            np.empty(0, dtype=np.intp),
+            0,
+            np.empty(0, dtype=np.int32),
+            )
+
+    def reset(
+            self, pairs, components, num_components, path_lengths,
+            adjacency=None):
+        """
+        Start over from a complete, already analysed graph.
+        `adjacency` is the matrix of `pairs`, if already built.
+        """
+        components = np.asarray(components, dtype=np.intp)
+        self._size = len(components)
+        self._components = components.copy()
+        self._hops = np.array(path_lengths, dtype=np.int32)
+        self.num_components = num_components
+        self._links = _Links(pairs, self._size)
+        self._adjacency = adjacency
+        self._next_label = int(components.max(initial=-1)) + 1
+        self._sizes = np.bincount(
+            components[components >= 0], minlength=self._next_label)
+        # Visit marks of `_reach`, see there
+        self._mark = np.zeros(self._size, dtype=np.int64)
+        self._stamp = 0
+
+    @property
+    def num_slots(self):
+        return self._size
+
+    @property
+    def components(self):
+        return self._components[:self._size]
+
+    @property
+    def path_lengths(self):
+        return self._hops[:self._size]
+
+    @property
+    def pairs(self):
+        pairs = self._links.pairs
+        comps = self._components
+        return pairs[(comps[pairs[:, 0]] >= 0) & (comps[pairs[:, 1]] >= 0)]
+
+    @property
+    def adjacency(self):
+        if self._adjacency is None:
+            self._adjacency = graph.adjacency(self.pairs, self._size)
+        return self._adjacency
+
+    def neighbours(self, nodes):
+        """Alive neighbours of `nodes`, like `graph.neighbours`."""
+        nodes = np.asarray(nodes, dtype=np.intp)
+        owners, nbrs = self._links.neighbours(nodes)
+        alive = self._components[nbrs] >= 0
+        owners = owners[alive]
+        order = np.argsort(owners, kind='stable')
+        return (
+            nbrs[alive][order],
+            np.bincount(owners, minlength=len(nodes)),
+            )
+
+    def _reach(self, seeds):
+        """
+        Every alive node connected to `seeds`, found by a search
+        that only touches what it reaches: visited nodes are marked
+        with a number that is new for every search,
+        so the marks never need clearing.
+        """
+        self._stamp += 1
+        mark = self._mark
+        frontier = np.unique(seeds)
+        mark[frontier] = self._stamp
+        reached = [frontier]
+        while len(frontier):
+            nbrs, _ = self.neighbours(frontier)
+            frontier = np.unique(nbrs[mark[nbrs] != self._stamp])
+            mark[frontier] = self._stamp
+            reached.append(frontier)
+        return np.concatenate(reached)
+
+    def _reserve(self, size):
+        """Make room for `size` slots."""
+        if size <= len(self._components):
+            return
+        num_marks = len(self._mark)
+        self._components = _grow(self._components, size)
+        self._hops = _grow(self._hops, size)
+        self._mark = _grow(self._mark, size)
+        self._mark[num_marks:] = 0
+
+    def _fresh_labels(self, num):
+        labels = np.arange(self._next_label, self._next_label + num)
+        self._next_label += num
+        if self._next_label > len(self._sizes):
+            self._sizes = _grow(self._sizes, self._next_label)
+        return labels
+
+    def _tidy_labels(self):
+        """Renumber component labels once too many have been used up."""
+        if self._next_label <= 2 * self._size:
+            return
+        comps = self.components
+        alive = comps >= 0
+        _, comps[alive] = np.unique(comps[alive], return_inverse=True)
+        self._sizes = np.bincount(comps[alive], minlength=self.num_components)
+        self._next_label = self.num_components
+
+    def insert(self, index, nodes_pos, start, root):
+        """
+        Account for the nodes `nodes_pos[start:]`,
+        which have just been appended.
+
+        `index` must already contain the new nodes,
+        and `root` is the root slot after the insertion.
+        """
+        num_slots = len(nodes_pos)
+        num_new = num_slots - start
+        if not num_new:
+            return
+
+        owners, nbrs = index.query_ball(nodes_pos[start:], self.node_range)
+        srcs = owners + start
+
+        # Links to old nodes are new,
+        # links among new nodes are found from both ends.
+        keep = (nbrs < start) | (srcs < nbrs)
+        new_pairs = np.column_stack((srcs[keep], nbrs[keep]))
+        if self.link_filter is not None:
+            new_pairs = new_pairs[self.link_filter(new_pairs)]
+
+        self._reserve(num_slots)
+        self._size = num_slots
+        self._components[start:num_slots] = -1
+        self._hops[start:num_slots] = -1
+        self._merge_components(start, new_pairs)
+        self._links.add(new_pairs, num_slots, self._components)
+        self._adjacency = None
+        self._lower_hops(start, new_pairs, root)
+
+    def _merge_components(self, start, new_pairs):
+        """
+        Label the new nodes and merge the components they join.
+        Runs before the new links are added.
+        """
+        comps = self._components
+        num_new = self._size - start
+        old = new_pairs[:, 1] < start
+        old_nbrs = new_pairs[old, 1]
+        touched, first, old_slot = np.unique(
+            comps[old_nbrs],
+            return_index=True,
+            return_inverse=True
+            )
+
+        # Small graph whose nodes are the touched old components
+        # followed by the new nodes.
+        num_touched = len(touched)
+        small = new_pairs - start + num_touched
+        small[old, 1] = old_slot
+        num_groups, groups = graph.components(
+            graph.adjacency(small, num_touched + num_new))
+        touched_groups = groups[:num_touched]
+
+        # Every group keeps the label of its biggest old component,
+        # so a relabelled node always ends up
+        # in a component at least twice as big as before.
+        group_labels = np.full(num_groups, -1, dtype=np.intp)
+        order = np.lexsort((-self._sizes[touched], touched_groups))
+        merged, biggest = np.unique(touched_groups[order], return_index=True)
+        group_labels[merged] = touched[order][biggest]
+        fresh = group_labels < 0
+        group_labels[fresh] = self._fresh_labels(np.count_nonzero(fresh))
+
+        # The other old components are found from one of their nodes
+        new_labels = group_labels[touched_groups]
+        moved = new_labels != touched
+        if moved.any():
+            members = self._reach(old_nbrs[first[moved]])
+            comps[members] = new_labels[np.searchsorted(touched, comps[members])]
+        comps[start:self._size] = group_labels[groups[num_touched:]]
+
+        sizes = np.bincount(groups[num_touched:], minlength=num_groups) \
+            + np.bincount(
+                touched_groups, weights=self._sizes[touched],
+                minlength=num_groups).astype(np.intp)
+        self._sizes[touched] = 0
+        self._sizes[group_labels] = sizes
+        self.num_components += num_groups - num_touched
+        self._tidy_labels()
+
+    def _lower_hops(self, start, new_pairs, root):
+        """Push shorter paths through the new nodes outwards."""
+        hops = self._hops
+
+        if root >= start:
+            hops[root] = 0
+            frontier = [root]
+        else:
+            # New nodes next to reachable old nodes
+            # are one hop further than their closest such neighbour.
+            old = new_pairs[:, 1] < start
+            reach = hops[new_pairs[old, 1]]
+            srcs = new_pairs[old, 0][reach >= 0]
+            reach = reach[reach >= 0] + 1
+            order = np.lexsort((reach, srcs))
+            frontier, first = np.unique(srcs[order], return_index=True)
+            hops[frontier] = reach[order][first]
+
+        graph.relax_hops(self, hops, frontier)
+
+    def kill(self, victims, root):
+        """
+        Account for the nodes in `victims`,
+        which have just been marked dead.
+
+        `root` is the root slot after the deletion,
+        or None if no nodes are left.
+        """
+        if not len(victims):
+            return
+
+        comps = self._components
+        hops = self._hops
+        touched = np.unique(comps[victims])
+        touched = touched[touched >= 0]
+        # The root moved if it was one of the victims.
+        rehop = root is not None and (
+            hops[root] != 0
+            or comps[root] in touched
+            )
+
+        comps[victims] = -1
+        hops[victims] = -1
+        self._sizes[touched] = 0
+        self._adjacency = None
+
+        # Only the components that lost nodes can have split,
+        # and all that is left of them is connected
+        # to a neighbour of a victim.
+        seeds, _ = self.neighbours(victims)
+        members = np.sort(self._reach(seeds))
+        nbrs, counts = self.neighbours(members)
+        local = np.column_stack((
+            np.repeat(np.arange(len(members)), counts),
+            np.searchsorted(members, nbrs),
+            ))
+        num_split, split = graph.components(
+            graph.adjacency(local, len(members)))
+        labels = self._fresh_labels(num_split)
+        comps[members] = labels[split]
+        self._sizes[labels] = np.bincount(split, minlength=num_split)
+        self.num_components += num_split - len(touched)
+        self._tidy_labels()
+
+        if not rehop:
+            return
+
+        # Only the touched components had paths to the old root
+        hops[members] = -1
+        hops[root] = 0
+        graph.relax_hops(self, hops, [root])
+
+    def compact(self, keep):
+        """
+        Follow a compaction of the node store.
+
+        Surviving slots are renumbered in order,
+        just like `nodes_pos[keep]`.
+        """
+        remap = np.cumsum(keep) - 1
+        self.reset(
+            remap[self.pairs],
+            self.components[keep],
+            self.num_components,
+            self.path_lengths[keep],
+            )
@@ -0,0 +1,223 @@
+"""
+los.py: terrain line-of-sight link model.
+
+Two nodes in range can only link if the terrain
+does not rise above the straight line between their antennas.
+Segments are sampled in batches,
+vectorized over all candidate pairs at once,
+and results are remembered per pair of stable node ids,
+so rebuilding the graph of unchanged nodes samples nothing.
+The cache is bounded, forgets the pairs used least recently,
+and drops the pairs of nodes that were compacted away.
+"""
+
+import numpy as np
+
+from .arrays import ragged_arange
+
+
+class LineOfSight:
+    """
+    Terrain line-of-sight check for candidate links.
+
+    Attributes
+    ----------
+
+    terrain
+        `Terrain` to check against.
+        Pixels outside of it count as elevation 0.
+
+    mast_height
+        Height of the antennas above the ground,
+        in elevation units of the terrain.
+
+    step
+        Distance between samples along a segment, in terrain pixels.
+
+    batch_samples
+        Number of samples to take at once,
+        bounds the memory used by the temporaries.
+
+    max_pairs
+        Number of pairs to remember at most.
+        Past it, the least recently used quarter is forgotten.
+
+    """
+    # Cache keys pack two ids into one int64
+    ID_BITS = 32
+
+    def __init__(
+            self, terrain, mast_height=0.0, step=1.0, batch_samples=1 << 20,
+            max_pairs=1 << 24):
+        self.terrain = terrain
+        self.mast_height = mast_height
+        self.step = step
+        self.batch_samples = batch_samples
+        self.max_pairs = max_pairs
+
+        self._params = None
+        self.clear()
+
+    def clear(self):
+        """Forget every cached pair."""
+        self._keys = np.empty(0, dtype=np.int64)
+        self._visible = np.empty(0, dtype=bool)
+        # When every pair was last used, in calls to `visible`
+        self._used = np.empty(0, dtype=np.int64)
+        self._clock = 0
+
+    def __len__(self):
+        return len(self._keys)
+
+    def _settings(self):
+        return self.terrain, self.mast_height, self.step
+
+    def visible(self, pos, ids, pairs, replace=True):
+        """
+        Return a mask of the `pairs` (of slots into `pos`)
+        that can see each other.
+
+        `ids` are the stable ids of the slots, used as cache keys.
+        Only pairs that are not in the cache are sampled.
+        With `replace` the cache then holds exactly these pairs,
+        which is what full graph builds want,
+        otherwise the new results are added to it.
+        """
+        pairs = np.asarray(pairs, dtype=np.intp).reshape(-1, 2)
+        if self._params != self._settings():
+            self._params = self._settings()
+            self.clear()
+        self._clock += 1
+
+        # Ids are never reused, so a key is never stale
+        a = ids[pairs[:, 0]].astype(np.int64)
+        b = ids[pairs[:, 1]].astype(np.int64)
+        # The smaller id lands in the high bits, below the sign bit
+        if len(pairs) and max(a.max(), b.max()) >> (63 - self.ID_BITS):
+            raise OverflowError(
+                f"Node ids must be below 2**{63 - self.ID_BITS} "
+                f"to be cached by `LineOfSight`")
+        keys = (np.minimum(a, b) << self.ID_BITS) | np.maximum(a, b)
+
+        where = np.searchsorted(self._keys, keys)
+        where[where == len(self._keys)] = 0
+        known = (
+            self._keys[where] == keys
+            if len(self._keys) else np.zeros(len(keys), dtype=bool)
+            )
+
+        visible = np.empty(len(pairs), dtype=bool)
+        visible[known] = self._visible[where[known]]
+        self._used[where[known]] = self._clock
+        fresh = np.flatnonzero(~known)
+        visible[fresh] = self.sample(
+            pos[pairs[fresh, 0]], pos[pairs[fresh, 1]])
+
+        if replace and not len(fresh) and len(keys) == len(self._keys):
+            # Exactly the pairs that are cached already
+            pass
+        elif replace:
+            order = np.argsort(keys)
+            self._keys = keys[order]
+            self._visible = visible[order]
+            self._used = np.full(len(keys), self._clock, dtype=np.int64)
+        else:
+            keys, first = np.unique(keys[fresh], return_index=True)
+            where = np.searchsorted(self._keys, keys)
+            self._keys = np.insert(self._keys, where, keys)
+            self._visible = np.insert(self._visible, where, visible[fresh][first])
+            self._used = np.insert(self._used, where, self._clock)
+        self._trim()
+        return visible
+
+    def _trim(self):
+        """Forget the least recently used pairs once over `max_pairs`."""
+        if len(self._keys) <= self.max_pairs:
+            return
+        # Down to three quarters, so that trimming is not
+        # needed again on the very next call
+        num_keep = self.max_pairs * 3 // 4
+        keep = np.sort(np.argpartition(
+            self._used, len(self._used) - num_keep)[len(self._used) - num_keep:])
+        self._keys = self._keys[keep]
+        self._visible = self._visible[keep]
+        self._used = self._used[keep]
+
+    def compact(self, ids):
+        """
+        Forget the pairs of nodes that are gone,
+        given the sorted `ids` of the nodes that are left.
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        if not len(ids):
+            self.clear()
+            return
+        mask = (1 << self.ID_BITS) - 1
+        keep = np.ones(len(self._keys), dtype=bool)
+        for part in (self._keys >> self.ID_BITS, self._keys & mask):
+            where = np.searchsorted(ids, part)
+            where[where == len(ids)] = 0
+            keep &= ids[where] == part
+        self._keys = self._keys[keep]
+        self._visible = self._visible[keep]
+        self._used = self._used[keep]
+
+    def sample(self, pos_a, pos_b):
+        """
+        Check the segments from `pos_a` to `pos_b` against the terrain,
+        return a mask of those that are not blocked.
+        """
+        pix_a = self.terrain.transform.to_pixel(pos_a)
+        pix_b = self.terrain.transform.to_pixel(pos_b)
+        ground = self.terrain.sample(
+            np.floor(np.concatenate((pix_a[:, 1], pix_b[:, 1]))),
+            np.floor(np.concatenate((pix_a[:, 0], pix_b[:, 0]))),
+            )
+        top_a, top_b = np.split(ground + np.float32(self.mast_height), 2)
+
+        # Interior samples only, the endpoints never block
+        length = np.hypot(*(pix_b - pix_a).T)
+        counts = np.maximum(np.ceil(length / self.step).astype(np.intp) - 1, 0)
+
+        visible = np.ones(len(pix_a), dtype=bool)
+        ends = np.cumsum(counts)
+        start = 0
+        while start < len(counts):
+            # As many pairs as fit in the sample budget, at least one
+            stop = max(
+                np.searchsorted(
+                    ends, ends[start] - counts[start] + self.batch_samples,
+                    side='right'),
+                start + 1
+                )
+            visible[start:stop] = self._sample_batch(
+                pix_a[start:stop], pix_b[start:stop],
+                top_a[start:stop], top_b[start:stop],
+                counts[start:stop],
+                )
+            start = stop
+        return visible
+
+    def _sample_batch(self, pix_a, pix_b, top_a, top_b, counts):
+        owner = np.repeat(np.arange(len(counts)), counts)
+        t = ragged_arange(np.ones(len(counts)), counts).astype(np.float32)
+        t /= (counts + 1).astype(np.float32)[owner]
+
+        # Flat float32 columns keep the temporaries small
+        delta = (pix_b - pix_a).astype(np.float32)
+        pix_a = pix_a.astype(np.float32)
+        cols = delta[:, 0][owner]
+        cols *= t
+        cols += pix_a[:, 0][owner]
+        rows = delta[:, 1][owner]
+        rows *= t
+        rows += pix_a[:, 1][owner]
+        ground = self.terrain.sample(
+            np.floor(rows, out=rows), np.floor(cols, out=cols))
+
+        line = (top_b - top_a)[owner]
+        line *= t
+        line += top_a[owner]
+
+        blocked = np.bincount(owner[ground > line], minlength=len(counts))
+        return blocked == 0
@@ -0,0 +1,293 @@
+"""
+nodes.py: growable column store for simulation nodes.
+"""
+
+import numpy as np
+
+
+def _grow(arr, needed):
+    """Return a copy of `arr` with room for at least `needed` rows."""
+    new = np.empty((max(2 * len(arr), needed), *arr.shape[1:]), dtype=arr.dtype)
+    new[:len(arr)] = arr
+    return new
+
+
+class NodeStore:
+    """
+    Struct-of-arrays storage for nodes.
+
+    Every column is preallocated and doubles in capacity when full,
+    so appending a cluster only copies the new nodes
+    and building a deployment cluster by cluster is linear time.
+
+    Deleted nodes are only marked dead (tombstoned).
+    Their rows stay in place, so node indices ("slots")
+    remain valid until `compact` squeezes the dead rows out.
+
+    Attributes
+    ----------
+
+    size
+        Number of slots in use, dead or alive.
+
+    num_alive
+        Number of slots that are alive.
+
+    compact_threshold
+        Fraction of dead slots above which
+        `needs_compaction` becomes true.
+
+    extent
+        (lo, hi) corners of a box containing every slot,
+        None while the store is empty.
+        Only ever grows, so it may be larger than needed
+        after nodes were deleted.
+
+    """
+    def __init__(self, capacity=1024, compact_threshold=0.5):
+        self.compact_threshold = compact_threshold
+        self.size = 0
+        self.num_alive = 0
+        self.next_id = 0
+        self.extent = None
+
+        self._pos = np.empty((capacity, 2), dtype=np.float64)
+        self._cluster = np.empty(capacity, dtype=np.int32)
+        self._ids = np.empty(capacity, dtype=np.int64)
+        self._alive = np.empty(capacity, dtype=bool)
+
+    @classmethod
+    def from_columns(
+            cls, pos, cluster, ids, alive, next_id, extent=None, **kwargs):
+        """
+        Store using the given columns as they are, without copying,
+        e.g. views into shared memory.
+        Columns that are read-only stay so,
+        and appending copies them into new, larger ones.
+        """
+        nodes = cls(capacity=0, **kwargs)
+        nodes._pos, nodes._cluster, nodes._ids, nodes._alive = \
+            pos, cluster, ids, alive
+        nodes.size = len(alive)
+        nodes.num_alive = int(np.count_nonzero(alive))
+        nodes.next_id = next_id
+        nodes.extent = extent
+        return nodes
+
+    @property
+    def capacity(self):
+        return len(self._alive)
+
+    @property
+    def pos(self):
+        """View of the position of every slot."""
+        return self._pos[:self.size]
+
+    @property
+    def cluster(self):
+        """View of the cluster number of every slot."""
+        return self._cluster[:self.size]
+
+    @property
+    def ids(self):
+        """
+        View of the stable id of every slot.
+
+        Ids are handed out in increasing order and never reused,
+        and compaction keeps slots in order,
+        so ids are always sorted.
+        """
+        return self._ids[:self.size]
+
+    @property
+    def alive(self):
+        """View of the alive flag of every slot."""
+        return self._alive[:self.size]
+
+    @property
+    def num_dead(self):
+        return self.size - self.num_alive
+
+    @property
+    def needs_compaction(self):
+        return self.num_dead > self.compact_threshold * self.size
+
+    def append(self, pos, cluster):
+        """
+        Append nodes at `pos` to cluster number `cluster`.
+
+        Returns the slot of the first new node.
+        """
+        pos = np.asarray(pos, dtype=np.float64).reshape(-1, 2)
+        start = self.size
+        end = start + len(pos)
+        if end > self.capacity:
+            for name in ('_pos', '_cluster', '_ids', '_alive'):
+                setattr(self, name, _grow(getattr(self, name), end))
+
+        self._pos[start:end] = pos
+        self._cluster[start:end] = cluster
+        self._ids[start:end] = np.arange(self.next_id, self.next_id + len(pos))
+        self._alive[start:end] = True
+
+        if len(pos):
+            lo, hi = pos.min(axis=0), pos.max(axis=0)
+            if self.extent is not None:
+                lo = np.minimum(lo, self.extent[0])
+                hi = np.maximum(hi, self.extent[1])
+            self.extent = lo, hi
+
+        self.next_id += len(pos)
+        self.size = end
+        self.num_alive += len(pos)
+        return start
+
+    def kill(self, slots):
+        """
+        Mark `slots` as dead.
+
+        Returns the slots that were alive until now, sorted.
+        """
+        slots = np.unique(np.asarray(slots, dtype=np.intp))
+        slots = slots[self._alive[slots]]
+        self._alive[slots] = False
+        self.num_alive -= len(slots)
+        return slots
+
+    def compact(self):
+        """
+        Squeeze out dead slots, keeping the rest in order.
+
+        Returns the boolean mask of old slots that were kept,
+        or None if there was nothing to do.
+        """
+        if not self.num_dead:
+            return None
+
+        keep = self.alive.copy()
+        for name in ('_pos', '_cluster', '_ids', '_alive'):
+            col = getattr(self, name)
+            if not col.flags.writeable:
+                # Shared views (see `from_columns`) are left alone
+                col = col[:self.size][keep]
+                setattr(self, name, col)
+                continue
+            col[:self.num_alive] = col[:self.size][keep]
+        self.size = self.num_alive
+        return keep
+
+    def slots_of(self, ids):
+        """
+        Return the current slots of nodes with stable `ids`,
+        -1 for ids that have been compacted away.
+
+        Ids are sorted, so this is a binary search.
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        slots = np.searchsorted(self.ids, ids)
+        found = slots < self.size
+        found[found] = self.ids[slots[found]] == ids[found]
+        return np.where(found, slots, -1)
+
+
+class ClusterTable:
+    """
+    Per-cluster bookkeeping for a `NodeStore`.
+
+    Clusters are appended as contiguous runs of slots,
+    and compaction keeps slots in order,
+    so every cluster always occupies one slot range.
+    Together with the per-slot cluster column in `NodeStore`
+    this makes "which cluster is slot i in", "members of cluster k"
+    and "alive nodes in cluster k" O(1) or O(log n) lookups.
+
+    Attributes
+    ----------
+
+    num
+        Number of clusters.
+
+    end
+        One past the last slot of the last cluster.
+
+    """
+    def __init__(self, capacity=64):
+        self.num = 0
+        self.end = 0
+        self._starts = np.empty(capacity, dtype=np.int64)
+        self._heads = np.empty(capacity, dtype=np.int64)
+        self._counts = np.empty(capacity, dtype=np.int64)
+
+    @classmethod
+    def from_columns(cls, starts, heads, counts, end):
+        """Table using the given columns as they are, without copying."""
+        table = cls(capacity=0)
+        table._starts, table._heads, table._counts = starts, heads, counts
+        table.num = len(starts)
+        table.end = end
+        return table
+
+    @property
+    def starts(self):
+        """View of the first slot of every cluster."""
+        return self._starts[:self.num]
+
+    @property
+    def heads(self):
+        """
+        View of the clusterhead slot of every cluster,
+        -1 for clusters with no alive nodes.
+        The clusterhead is the first alive slot of the cluster.
+        """
+        return self._heads[:self.num]
+
+    @property
+    def counts(self):
+        """View of the number of alive nodes in every cluster."""
+        return self._counts[:self.num]
+
+    @property
+    def bounds(self):
+        """Slot boundaries: cluster `k` is `bounds[k]:bounds[k + 1]`."""
+        return np.append(self.starts, self.end)
+
+    def add(self, start, count):
+        """Add a cluster of `count` nodes from slot `start` on, return its number."""
+        if self.num == len(self._starts):
+            for name in ('_starts', '_heads', '_counts'):
+                setattr(self, name, _grow(getattr(self, name), self.num + 1))
+
+        self._starts[self.num] = start
+        self._heads[self.num] = start if count else -1
+        self._counts[self.num] = count
+        self.end = start + count
+        self.num += 1
+        return self.num - 1
+
+    def members(self, k, alive):
+        """Return the alive slots of cluster `k`."""
+        start = self._starts[k]
+        end = self._starts[k + 1] if k + 1 < self.num else self.end
+        return start + np.flatnonzero(alive[start:end])
+
+    def kill(self, victims, cluster, alive):
+        """
+        Account for `victims`, which have just been marked dead.
+
+        `cluster` and `alive` are the columns of the node store.
+        """
+        self.counts[:] -= np.bincount(cluster[victims], minlength=self.num)
+
+        # Promote the next alive member where the clusterhead died
+        hit = np.unique(cluster[victims])
+        for k in hit[~alive[self.heads[hit]]]:
+            members = self.members(k, alive)
+            self._heads[k] = members[0] if len(members) else -1
+
+    def compact(self, keep):
+        """Follow a compaction of the node store."""
+        kept_before = np.concatenate(([0], np.cumsum(keep)))
+        self.starts[:] = kept_before[self.starts]
+        self.heads[:] = np.where(
+            self.heads >= 0, kept_before[self.heads], -1)
+        self.end = int(kept_before[self.end])
@@ -0,0 +1,247 @@
+"""
+patterns.py: vectorized node deployment patterns.
+
+Every generator returns one cluster as an (n, 2) coordinate block
+whose first row is the clusterhead at `loc`,
+ready for `Sim.add_cluster`.
+Random generators draw from `rng`,
+which defaults to the global `np.random` state.
+"""
+
+import numpy as np
+import scipy as sp
+
+
+def _rng(rng):
+    return np.random if rng is None else rng
+
+
+def _head_first(block, loc):
+    """Move the point nearest to `loc` to the front of `block`."""
+    nearest = np.argmin(((block - loc) ** 2).sum(axis=1))
+    block[[0, nearest]] = block[[nearest, 0]]
+    return block
+
+
+def gaussian(loc, scale, num, rng=None):
+    """Clusterhead at `loc` plus `num - 1` normally distributed nodes."""
+    block = np.empty((num, 2))
+    block[0] = loc
+    block[1:] = _rng(rng).normal(loc=loc, scale=scale, size=(num - 1, 2))
+    return block
+
+
+def rings(loc, radii, nodes):
+    """
+    Clusterhead at `loc` plus concentric rings,
+    `nodes[i]` evenly spaced nodes on the ring of radius `radii[i]`.
+    """
+    radii = np.asarray(radii, dtype=float)
+    nodes = np.asarray(nodes, dtype=np.intp)
+    assert len(radii) == len(nodes), \
+        "number of `radii` and `nodes` lists must be the same."
+
+    ring = np.repeat(np.arange(len(nodes)), nodes)
+    first = np.cumsum(nodes) - nodes
+    angle = 2 * np.pi * (np.arange(nodes.sum()) - first[ring]) / nodes[ring]
+
+    block = np.empty((1 + len(angle), 2))
+    block[0] = loc
+    block[1:, 0] = np.sin(angle) * radii[ring] + loc[0]
+    block[1:, 1] = np.cos(angle) * radii[ring] + loc[1]
+    return block
+
+
+def box(loc, extent, num, rng=None):
+    """
+    Clusterhead at `loc` plus `num - 1` uniformly distributed nodes
+    in a box of size `extent` (scalar or (width, height)) centred on it.
+    """
+    half = np.broadcast_to(np.asarray(extent, dtype=float) / 2, 2)
+    block = np.empty((num, 2))
+    block[0] = loc
+    block[1:] = _rng(rng).uniform(
+        np.subtract(loc, half), np.add(loc, half), size=(num - 1, 2))
+    return block
+
+
+def square_grid(loc, spacing, shape):
+    """
+    `shape[0]` by `shape[1]` square lattice centred on `loc`.
+    The lattice point nearest `loc` is the clusterhead.
+    """
+    nx, ny = shape
+    xs = (np.arange(nx) - (nx - 1) / 2) * spacing + loc[0]
+    ys = (np.arange(ny) - (ny - 1) / 2) * spacing + loc[1]
+    block = np.empty((nx * ny, 2))
+    block.reshape(nx, ny, 2)[:, :, 0] = xs[:, None]
+    block.reshape(nx, ny, 2)[:, :, 1] = ys[None, :]
+    return _head_first(block, loc)
+
+
+def hex_grid(loc, spacing, shape):
+    """
+    `shape[0]` by `shape[1]` hexagonal (triangular) lattice
+    centred on `loc`, every node `spacing` away from its six neighbours.
+    The lattice point nearest `loc` is the clusterhead.
+    """
+    nx, ny = shape
+    row_height = spacing * np.sqrt(3) / 2
+    xs = (np.arange(nx) - (nx - 1) / 2) * spacing
+    ys = (np.arange(ny) - (ny - 1) / 2) * row_height
+    block = np.empty((nx * ny, 2))
+    grid = block.reshape(ny, nx, 2)
+    grid[:, :, 0] = xs[None, :] + (np.arange(ny) % 2)[:, None] * spacing / 2
+    grid[:, :, 1] = ys[:, None]
+    block += loc
+    return _head_first(block, loc)
+
+
+def poisson_disk(
+        loc, extent, radius, num=None,
+        rng=None, batch=None, min_acceptance=0.01):
+    """
+    Clusterhead at `loc` plus nodes in a box of size `extent`
+    centred on it, no two closer than `radius` (Poisson-disk sampling).
+
+    Candidates are thrown in batches.
+    Each batch is checked against the accepted nodes
+    with a background grid of cells that hold at most one node,
+    and conflicts inside a batch are resolved
+    by dropping the later candidate of every close pair.
+    Stops at `num` nodes, or once the box is nearly saturated,
+    that is, when less than `min_acceptance` of a batch is accepted.
+    """
+    rng = _rng(rng)
+    loc = np.asarray(loc, dtype=float)
+    half = np.broadcast_to(np.asarray(extent, dtype=float) / 2, 2)
+    lo = loc - half
+    cell = radius / np.sqrt(2)
+    shape = np.ceil(2 * half / cell).astype(np.intp) + 1
+
+    # Position of the node in every cell, NaN for empty cells.
+    # Padded by two cells on every side, so that
+    # neighbourhood lookups never go out of bounds.
+    width = shape[1] + 4
+    grid_x = np.full((shape[0] + 4) * width, np.nan)
+    grid_y = grid_x.copy()
+    capacity = int(np.prod(shape)) + 1
+    if num is not None:
+        capacity = min(capacity, num)
+    block = np.empty((capacity, 2))
+    block[0] = loc
+    head = ((loc - lo) / cell).astype(np.intp) + 2
+    grid_x[head[0] * width + head[1]], grid_y[head[0] * width + head[1]] = loc
+    count = 1
+
+    batch = batch or max(64, capacity // 4)
+    offsets = [
+        dx * width + dy for dx in range(-2, 3) for dy in range(-2, 3)]
+    inner = np.arange(len(grid_x)).reshape(-1, width)[2:-2, 2:-2].ravel()
+    saturated = False
+    while count < capacity and not saturated:
+        # A cell already holding a node can never take another one,
+        # so candidates are only thrown into empty cells.
+        empty = inner[np.isnan(grid_x[inner])]
+        if not len(empty):
+            break
+        # Sorted, so that the neighbourhood lookups below
+        # walk through the grid in memory order.
+        cells = np.sort(
+            empty[rng.uniform(0, len(empty), size=batch).astype(np.intp)])
+        corner = np.column_stack(np.divmod(cells, width)) - 2
+        cand = lo + (corner + rng.uniform(size=(batch, 2))) * cell
+        inside = (cand <= lo + 2 * half).all(axis=1)
+        cand, cells = cand[inside], cells[inside]
+
+        ok = np.ones(len(cand), dtype=bool)
+        cand_x, cand_y = cand.T
+        for offset in offsets:
+            # Comparisons with NaN (empty cells) are always false.
+            dx = cand_x - grid_x[cells + offset]
+            dy = cand_y - grid_y[cells + offset]
+            ok &= ~(dx * dx + dy * dy < radius ** 2)
+
+        pairs = sp.spatial.KDTree(cand[ok]).query_pairs(
+            radius, output_type='ndarray')
+        survivors = np.flatnonzero(ok)
+        ok[survivors[pairs.max(axis=1, initial=0)]] = False
+
+        accepted = np.flatnonzero(ok)[:capacity - count]
+        saturated = len(accepted) < batch * min_acceptance
+
+        block[count:count + len(accepted)] = cand[accepted]
+        grid_x[cells[accepted]], grid_y[cells[accepted]] = cand[accepted].T
+        count += len(accepted)
+
+    return block[:count]
+
+
+def rejection(
+        draw, accept, loc, num,
+        oversample=1.25, max_rounds=20, max_batch=1 << 20,
+        min_acceptance=1e-5):
+    """
+    Cluster of `num` nodes drawn by `draw(n)`,
+    which returns `n` candidate positions,
+    keeping only those the mask `accept(positions)` lets through.
+    The accepted node nearest to `loc` is the clusterhead,
+    `loc` itself if it is accepted.
+
+    Instead of retrying points one by one,
+    candidates are drawn and checked in batches
+    sized from the acceptance rate seen so far times `oversample`,
+    and at most `max_batch`,
+    so that usually one or two batches suffice.
+    Raises ValueError if `max_rounds` batches
+    do not yield `num` nodes, or as soon as enough candidates
+    have been drawn to tell that less than `min_acceptance`
+    of them are accepted.
+    """
+    loc = np.asarray(loc, dtype=float)
+    block = np.empty((num, 2))
+    count = 0
+    drawn = accepted = 0
+    for round_ in range(max_rounds):
+        # Rate estimate never zero, so the batches grow
+        # geometrically while nothing has been accepted yet
+        rate = max(accepted, 1) / drawn if drawn else 1.0
+        size = int(min(np.ceil((num - count) / rate * oversample), max_batch))
+        cand = draw(size)
+        if not round_:
+            cand = np.concatenate((loc[None], cand))
+        cand = cand[accept(cand)]
+
+        drawn += size
+        accepted += len(cand)
+        take = cand[:num - count]
+        block[count:count + len(take)] = take
+        count += len(take)
+        if count == num:
+            return _head_first(block, loc)
+
+        # Were the rate `min_acceptance`, this many candidates
+        # would have let through at least 3 on average
+        if drawn * min_acceptance >= 3 and accepted < drawn * min_acceptance:
+            raise ValueError(
+                f"The mask accepts almost nothing: {accepted} "
+                f"of {drawn} candidates, below {min_acceptance:g}"
+                )
+
+    raise ValueError(
+        f"Only {count} of {num} nodes accepted "
+        f"after {max_rounds} rounds of {drawn} candidates"
+        )
+
+
+PATTERNS = {
+    'gaussian': gaussian,
+    'rings': rings,
+    'box': box,
+    'square_grid': square_grid,
+    'hex_grid': hex_grid,
+    'poisson_disk': poisson_disk,
+    }
+
+# Patterns that take an `rng`
+RANDOM = ('gaussian', 'box', 'poisson_disk')
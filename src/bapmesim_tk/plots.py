@@ -0,0 +1,126 @@
+"""
+plots.py: live plots that update their artists in place.
+
+Clearing the axes and plotting again rebuilds every artist
+and redraws the whole figure, ticks and labels included.
+These plots keep their bars and wedges,
+only change their sizes, and redraw just those
+over a cached background (blitting).
+The whole figure is only drawn again when the axes limits change.
+"""
+
+import numpy as np
+from matplotlib.patches import Rectangle
+
+
+class Blitter:
+    """
+    Redraws the animated artists of a figure over its background.
+
+    The background is captured whenever the canvas does a full draw
+    (animated artists are left out of those),
+    and the artists are drawn over it right away.
+    """
+    def __init__(self, canvas):
+        self.canvas = canvas
+        self.artists = []
+        self.background = None
+        canvas.mpl_connect('draw_event', self._on_draw)
+
+    def add(self, artist):
+        artist.set_animated(True)
+        self.artists.append(artist)
+        return artist
+
+    def remove(self, artist):
+        self.artists.remove(artist)
+        artist.remove()
+
+    def _on_draw(self, event):
+        self.background = self.canvas.copy_from_bbox(self.canvas.figure.bbox)
+        self._draw_artists()
+
+    def _draw_artists(self):
+        for artist in self.artists:
+            self.canvas.figure.draw_artist(artist)
+
+    def update(self, full=False):
+        """Show the current state of the artists, drawing everything with `full`."""
+        if full or self.background is None:
+            self.canvas.draw()
+            return
+        self.canvas.restore_region(self.background)
+        self._draw_artists()
+        self.canvas.blit(self.canvas.figure.bbox)
+
+
+class HopHistogram:
+    """
+    Bar chart of the number of nodes per hop count to the root.
+
+    The y axis is rescaled (with a full redraw) when the tallest bar
+    no longer fits or would fill less than a quarter of it.
+    """
+    def __init__(self, ax, blitter):
+        self.ax = ax
+        self.blitter = blitter
+        self.bars = []
+
+    def update(self, counts):
+        """Show `counts[k]` nodes at `k` hops."""
+        counts = np.asarray(counts)
+        full = False
+        if len(counts) != len(self.bars):
+            for bar in self.bars[len(counts):]:
+                self.blitter.remove(bar)
+            del self.bars[len(counts):]
+            for hops in range(len(self.bars), len(counts)):
+                self.bars.append(self.blitter.add(self.ax.add_patch(
+                    Rectangle((hops, 0), 1, 0, color='C0'))))
+            self.ax.set_xlim(0, max(len(counts), 1))
+            full = True
+
+        for bar, count in zip(self.bars, counts.tolist()):
+            bar.set_height(count)
+
+        top = self.ax.get_ylim()[1]
+        highest = counts.max(initial=0)
+        if highest > top or highest < top / 4:
+            self.ax.set_ylim(0, max(highest, 1) * 1.1)
+            full = True
+        self.blitter.update(full)
+
+
+class ConnectedPie:
+    """Pie of connected and disconnected nodes."""
+    LABELS = ('connected', 'disconnected')
+
+    def __init__(self, ax, blitter, labeldistance=1.1):
+        self.ax = ax
+        self.blitter = blitter
+        self.labeldistance = labeldistance
+        wedges, texts = ax.pie((1, 1), labels=self.LABELS,
+            labeldistance=labeldistance)
+        self.wedges = [blitter.add(wedge) for wedge in wedges]
+        self.texts = [blitter.add(text) for text in texts]
+        # Nothing to show before the first update
+        for artist in self.wedges + self.texts:
+            artist.set_visible(False)
+
+    def update(self, connected, disconnected):
+        """Show `connected` and `disconnected` node counts."""
+        total = connected + disconnected
+        split = 360 * connected / total if total else 0
+        for wedge, text, theta1, theta2 in zip(
+                self.wedges, self.texts, (0, split), (split, 360)):
+            wedge.set_theta1(theta1)
+            wedge.set_theta2(theta2)
+            # Place the label like `ax.pie` does
+            middle = np.deg2rad((theta1 + theta2) / 2)
+            x = self.labeldistance * wedge.r * np.cos(middle)
+            y = self.labeldistance * wedge.r * np.sin(middle)
+            text.set_position((x, y))
+            text.set_horizontalalignment('left' if x > 0 else 'right')
+            wedge.set_visible(theta2 > theta1)
+            text.set_visible(theta2 > theta1)
+        self.blitter.update()
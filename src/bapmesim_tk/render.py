@@ -0,0 +1,173 @@
+"""
+render.py: rasterize nodes into an RGB image buffer.
+
+Instead of one canvas item per node,
+every node is written into a per-pixel class image,
+markers are stamped by dilating that image,
+and a palette lookup turns it into RGB in one go.
+The cost of a redraw is then a handful of array passes
+over the nodes plus a few over the pixels,
+no matter how many nodes end up on the same pixel.
+"""
+
+import numpy as np
+
+# Pixel classes, in increasing drawing priority.
+# Where markers overlap, the higher class wins.
+BACKGROUND = 0
+DEAD = 1
+NODE = 2
+DISCONNECTED = 3
+HEAD = 4
+
+PALETTE = np.array((
+    (255, 255, 255),  # BACKGROUND, normally replaced
+    (190, 190, 190),  # DEAD
+    (0, 0, 0),        # NODE
+    (230, 140, 0),    # DISCONNECTED
+    (255, 0, 0),      # HEAD
+    ), dtype=np.uint8)
+
+
+def node_classes(alive, heads, path_lengths=None):
+    """
+    Return the pixel class of every slot.
+
+    `heads` are the clusterhead slots (-1 entries are ignored).
+    `path_lengths` are the hop counts to the root,
+    if given, alive slots that cannot reach the root
+    are classed as `DISCONNECTED`.
+    """
+    classes = np.where(alive, np.uint8(NODE), np.uint8(DEAD))
+    if path_lengths is not None:
+        classes[alive & (path_lengths < 0)] = DISCONNECTED
+    heads = np.asarray(heads)
+    classes[heads[heads >= 0]] = HEAD
+    return classes
+
+
+def class_image(pos, classes, origin, scale, shape):
+    """
+    Rasterize nodes into a uint8 class image of `shape` (rows, columns),
+    one pixel per node.
+
+    Pixel (0, 0) is at world coordinates `origin`,
+    and there are `scale` pixels per world unit.
+    """
+    height, width = shape
+    image = np.zeros(height * width, dtype=np.uint8)
+
+    px = np.floor((pos[:, 0] - origin[0]) * scale).astype(np.intp)
+    py = np.floor((pos[:, 1] - origin[1]) * scale).astype(np.intp)
+    inside = (px >= 0) & (px < width) & (py >= 0) & (py < height)
+
+    flat = py[inside] * width + px[inside]
+    # Highest class per pixel.
+    np.maximum.at(image, flat, classes[inside])
+    return image.reshape(height, width)
+
+
+def stamp(image, radius):
+    """
+    Grow every pixel of a class image into an "x" marker
+    reaching `radius` pixels out, higher classes on top.
+    """
+    out = image.copy()
+    height, width = image.shape
+    for d in range(1, radius + 1):
+        for dy, dx in ((d, d), (d, -d), (-d, d), (-d, -d)):
+            # out[y + dy, x + dx] = max(out[y + dy, x + dx], image[y, x])
+            dst = out[
+                max(dy, 0):height + min(dy, 0),
+                max(dx, 0):width + min(dx, 0),
+                ]
+            src = image[
+                max(-dy, 0):height + min(-dy, 0),
+                max(-dx, 0):width + min(-dx, 0),
+                ]
+            np.maximum(dst, src, out=dst)
+    return out
+
+
+def rasterize(
+        pos, classes, origin, scale, shape,
+        background=None, marker=2, palette=PALETTE):
+    """
+    Render nodes into an (rows, columns, 3) uint8 RGB image.
+
+    `background` is an RGB (or greyscale) image of the same shape
+    that shows through wherever there is no node,
+    or a single colour.
+    """
+    image = stamp(class_image(pos, classes, origin, scale, shape), marker)
+    rgb = palette[image]
+
+    if background is not None:
+        background = np.asarray(background, dtype=np.uint8)
+        if background.ndim == 2:
+            background = background[:, :, None]
+        empty = image == BACKGROUND
+        rgb[empty] = np.broadcast_to(background, rgb.shape)[empty]
+    return rgb
+
+
+def ppm(rgb):
+    """Encode an RGB image as binary PPM (P6), e.g. for `tk.PhotoImage`."""
+    height, width, _ = rgb.shape
+    return b''.join((
+        f'P6 {width} {height} 255 '.encode('ascii'),
+        np.ascontiguousarray(rgb).tobytes()
+        ))
+
+
+def density(
+        pos, disconnected, origin, scale, shape,
+        cell=4, background=None, palette=PALETTE):
+    """
+    Render nodes as square density cells of `cell` pixels
+    into an (rows, columns, 3) uint8 RGB image.
+
+    Cells get darker with the (log) number of nodes in them,
+    and shift towards the `DISCONNECTED` colour
+    with the fraction of their nodes flagged in `disconnected`.
+    Use this instead of `rasterize` once there are
+    more nodes than the markers could tell apart.
+    """
+    height, width = shape
+    rows = -(-height // cell)
+    cols = -(-width // cell)
+
+    cx = np.floor((pos[:, 0] - origin[0]) * scale / cell).astype(np.intp)
+    cy = np.floor((pos[:, 1] - origin[1]) * scale / cell).astype(np.intp)
+    inside = (cx >= 0) & (cx < cols) & (cy >= 0) & (cy < rows)
+    flat = cy[inside] * cols + cx[inside]
+
+    counts = np.bincount(flat, minlength=rows * cols)
+    lost = np.bincount(
+        flat, weights=disconnected[inside], minlength=rows * cols)
+
+    # Even a single node should be visible
+    weight = np.where(
+        counts > 0,
+        0.25 + 0.75 * np.log1p(counts) / np.log1p(counts.max(initial=1)),
+        0.0,
+        )
+    frac = lost / np.maximum(counts, 1)
+    ink = (
+        (1 - frac)[:, None] * palette[NODE]
+        + frac[:, None] * palette[DISCONNECTED]
+        )
+
+    def upsample(cells):
+        cells = cells.reshape(rows, cols, -1)
+        return np.repeat(np.repeat(cells, cell, 0), cell, 1)[:height, :width]
+
+    if background is None:
+        background = palette[BACKGROUND]
+    background = np.asarray(background, dtype=float)
+    if background.ndim == 2:
+        background = background[:, :, None]
+
+    weight = upsample(weight)
+    rgb = background * (1 - weight) + upsample(ink) * weight
+    return rgb.astype(np.uint8)
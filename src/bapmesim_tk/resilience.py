@@ -0,0 +1,337 @@
+"""
+resilience.py: which nodes and links the network depends on.
+
+Exact betweenness and node connectivity (networkx) cost
+O(nodes * links) or worse, which is hopeless for large deployments.
+Instead:
+
+- `articulation_points_and_bridges` finds every node and link
+  whose loss splits a component, in linear time;
+- `betweenness` estimates betweenness centrality
+  from a sample of sources, with a probabilistic error bound,
+  spread over a process pool and stopped at a time budget;
+- `node_connectivity` bounds how many nodes must fail
+  to split the network, from a sample of max-flow problems.
+
+All of them work on the CSR adjacency matrices from `graph`,
+e.g. `sim.adjacency` after `make_graph`.
+"""
+
+from typing import NamedTuple
+import functools
+import math
+import os
+import time
+
+import numpy as np
+import scipy as sp
+
+from . import graph
+from .tasks import process_map, progress
+
+
+def articulation_points_and_bridges(adj):
+    """
+    Find the articulation points (nodes whose removal disconnects
+    their component) and bridges (links whose removal does)
+    with one iterative depth-first search (Tarjan), O(nodes + links).
+
+    Returns the sorted articulation point slots
+    and an (m, 2) array of bridges (parent, child in the search tree).
+    """
+    indptr = adj.indptr.tolist()
+    indices = adj.indices.tolist()
+    num_nodes = adj.shape[0]
+
+    # Discovery order, lowest discovery order reachable
+    # through one back edge, and next edge to look at, per node
+    disc = [-1] * num_nodes
+    low = [0] * num_nodes
+    parent = [-1] * num_nodes
+    nxt = indptr[:-1]
+    cut = bytearray(num_nodes)
+    bridges = []
+    order = 0
+
+    for root in range(num_nodes):
+        if disc[root] >= 0 or indptr[root] == indptr[root + 1]:
+            continue
+        disc[root] = low[root] = order
+        order += 1
+        children = 0
+        stack = [root]
+        while stack:
+            v = stack[-1]
+            i = nxt[v]
+            if i < indptr[v + 1]:
+                nxt[v] = i + 1
+                w = indices[i]
+                if disc[w] < 0:
+                    parent[w] = v
+                    disc[w] = low[w] = order
+                    order += 1
+                    stack.append(w)
+                elif w != parent[v] and disc[w] < low[v]:
+                    low[v] = disc[w]
+                continue
+
+            # Done with v, report back to its parent
+            stack.pop()
+            if not stack:
+                break
+            u = stack[-1]
+            if low[v] < low[u]:
+                low[u] = low[v]
+            if low[v] > disc[u]:
+                bridges.append((u, v))
+            if u == root:
+                children += 1
+            elif low[v] >= disc[u]:
+                cut[u] = 1
+        if children > 1:
+            cut[root] = 1
+
+    return (
+        np.flatnonzero(np.frombuffer(cut, dtype=np.uint8)),
+        np.array(bridges, dtype=np.intp).reshape(-1, 2),
+        )
+
+
+def dependencies(adj, source):
+    """
+    Brandes dependency of `source` on every node:
+    the sum, over all targets, of the fraction of shortest paths
+    from `source` to the target that pass through the node.
+
+    The search runs one level at a time,
+    counting shortest paths on the way out
+    and accumulating dependencies on the way back.
+    """
+    num_nodes = adj.shape[0]
+    hops = np.full(num_nodes, -1, dtype=np.int32)
+    sigma = np.zeros(num_nodes)
+    hops[source] = 0
+    sigma[source] = 1
+
+    # Shortest path DAG edges, one (parents, children) pair per level
+    levels = []
+    frontier = np.array([source], dtype=np.intp)
+    while len(frontier):
+        nbrs, counts = graph.neighbours(adj, frontier)
+        parents = np.repeat(frontier, counts)
+        fresh = hops[nbrs] < 0
+        parents = parents[fresh]
+        nbrs = nbrs[fresh]
+        if not len(nbrs):
+            break
+        frontier, inverse = np.unique(nbrs, return_inverse=True)
+        hops[frontier] = len(levels) + 1
+        sigma[frontier] = np.bincount(inverse, weights=sigma[parents])
+        levels.append((parents, nbrs))
+
+    delta = np.zeros(num_nodes)
+    for parents, children in reversed(levels):
+        share = sigma[parents] / sigma[children] * (1 + delta[children])
+        parents, inverse = np.unique(parents, return_inverse=True)
+        delta[parents] += np.bincount(inverse, weights=share)
+    delta[source] = 0
+    return delta
+
+
+def _dependency_sum(adj, sources, deadline, report=False):
+    """
+    Sum of the dependencies of `sources`, stopping at `deadline`
+    (a `time.time()`, the wall clock, which unlike the monotonic clocks
+    every worker process reads the same).
+    Returns the sum and how many sources made it in.
+    """
+    total = np.zeros(adj.shape[0])
+    for done, source in enumerate(sources):
+        if deadline is not None and time.time() > deadline:
+            return total, done
+        if report:
+            progress(done / len(sources), "betweenness sources")
+        total += dependencies(adj, source)
+    return total, len(sources)
+
+
+class Betweenness(NamedTuple):
+    """
+    Result of `betweenness`.
+
+    `values` has the estimated normalized betweenness of every slot
+    (0 for nodes without links).
+    With probability at least 1 - `delta`,
+    every estimate is within `epsilon` of the exact value;
+    `epsilon` is 0 if every node was a source.
+    """
+    values: np.ndarray
+    samples: int
+    epsilon: float
+    delta: float
+
+
+# Every source adds at most `num_nodes - 2` to a node's dependency sum,
+# so Hoeffding's inequality (with a union bound over the nodes)
+# bounds the error of the mean of the scaled dependencies.
+# Normalized betweenness is that mean times `num_nodes / (num_nodes - 1)`.
+
+def _epsilon(num_nodes, samples, delta):
+    """Error bound of `samples` sources, over all nodes at once."""
+    if samples >= num_nodes:
+        return 0.0
+    if not samples:
+        return math.inf
+    return num_nodes / (num_nodes - 1) \
+        * math.sqrt(math.log(2 * num_nodes / delta) / (2 * samples))
+
+
+def _samples(num_nodes, epsilon, delta):
+    """Number of sources for error `epsilon`, see `_epsilon`."""
+    epsilon *= (num_nodes - 1) / num_nodes
+    return min(num_nodes, math.ceil(
+        math.log(2 * num_nodes / delta) / (2 * epsilon ** 2)))
+
+
+def betweenness(
+        adj, epsilon=0.05, delta=0.1, time_budget=None,
+        workers=None, rng=None, start_method=None):
+    """
+    Estimate the betweenness centrality of every node
+    from the dependencies of a random sample of sources.
+
+    The sample is large enough that, with probability
+    at least 1 - `delta`, every estimate is within `epsilon`
+    of the exact normalized betweenness
+    (as `networkx.betweenness_centrality` computes it
+    over the nodes that have links).
+    Once `time_budget` seconds have passed,
+    the sources done by then are used
+    and the result reports the looser bound they give.
+
+    Sources are processed in batches over `workers` processes
+    (None for one per CPU, 0 to stay in this process),
+    started with `start_method`, see `tasks.process_context`.
+    `rng` seeds the choice of sources.
+    """
+    deadline = None if time_budget is None else time.time() + time_budget
+    rng = np.random.default_rng(rng)
+    active = np.flatnonzero(np.diff(adj.indptr))
+    num_active = len(active)
+    values = np.zeros(adj.shape[0])
+    if num_active < 3:
+        return Betweenness(values, 0, 0.0, delta)
+
+    sources = rng.permutation(active)[:_samples(num_active, epsilon, delta)]
+
+    if workers == 0:
+        total, done = _dependency_sum(adj, sources, deadline, report=True)
+    else:
+        total, done = _pool_dependency_sum(
+            adj, sources, deadline, workers, start_method)
+
+    if done:
+        values = total * (num_active / done) \
+            / ((num_active - 1) * (num_active - 2))
+    return Betweenness(values, done, _epsilon(num_active, done, delta), delta)
+
+
+def _pool_dependency_sum(adj, sources, deadline, workers, start_method):
+    workers = workers or os.cpu_count() or 1
+    batches = np.array_split(sources, min(len(sources), 4 * workers))
+    total = np.zeros(adj.shape[0])
+    done = 0
+    for _, (part, num) in process_map(
+            functools.partial(_dependency_sum, adj, deadline=deadline),
+            batches,
+            workers,
+            start_method,
+            "betweenness batches",
+            ):
+        total += part
+        done += num
+    return total, done
+
+
+class NodeConnectivity(NamedTuple):
+    """
+    Result of `node_connectivity`.
+
+    `bound` is an upper bound on the node connectivity:
+    the smallest of `min_degree` and the local connectivity
+    of the `pairs` node pairs that were tried.
+    """
+    bound: int
+    min_degree: int
+    pairs: int
+
+
+def _split_graph(adj):
+    """
+    Flow network for vertex-disjoint paths:
+    node `v` becomes `2v` (in) and `2v + 1` (out)
+    joined by a unit capacity edge, and every link
+    becomes an out-to-in edge each way that never limits the flow.
+    """
+    num_nodes = adj.shape[0]
+    coo = adj.tocoo()
+    nodes = np.arange(num_nodes)
+    rows = np.concatenate((2 * nodes, 2 * coo.row + 1))
+    cols = np.concatenate((2 * nodes + 1, 2 * coo.col))
+    capacity = np.concatenate((
+        np.ones(num_nodes, dtype=np.int32),
+        np.full(coo.nnz, num_nodes, dtype=np.int32),
+        ))
+    return sp.sparse.csr_array(
+        (capacity, (rows, cols)), shape=(2 * num_nodes, 2 * num_nodes))
+
+
+def node_connectivity(adj, pairs=16, time_budget=None, rng=None, nodes=None):
+    """
+    Bound the node connectivity of the graph over `nodes`
+    (default: its largest component), the fewest nodes
+    whose failure splits it.
+
+    Every sampled pair of non-adjacent nodes
+    gives a bound through the number of vertex-disjoint paths
+    between them, one max-flow each.
+    Pairs are drawn as a random node that is not linked to every other,
+    then a random node it is not linked to.
+    Sampling stops after `pairs` pairs, after `time_budget` seconds,
+    or once the bound reaches 1 (see `articulation_points_and_bridges`
+    for which nodes those are).
+    """
+    deadline = None if time_budget is None else time.time() + time_budget
+    rng = np.random.default_rng(rng)
+    if nodes is None:
+        _, labels = graph.components(adj)
+        nodes = np.flatnonzero(labels == np.bincount(labels).argmax())
+    nodes = np.asarray(nodes, dtype=np.intp)
+    sub = adj[nodes][:, nodes].tocsr()
+    num_nodes = len(nodes)
+    if num_nodes < 2:
+        return NodeConnectivity(0, 0, 0)
+
+    degrees = np.diff(sub.indptr)
+    bound = min_degree = int(degrees.min())
+    if min_degree == num_nodes - 1:
+        # Complete graph, no pair to separate
+        return NodeConnectivity(bound, min_degree, 0)
+
+    flows = _split_graph(sub)
+    # Nodes with at least one other node they are not linked to
+    sources = np.flatnonzero(degrees < num_nodes - 1)
+    tried = 0
+    while tried < pairs and bound > 1:
+        if deadline is not None and time.time() > deadline:
+            break
+        s = rng.choice(sources)
+        linked = np.zeros(num_nodes, dtype=bool)
+        linked[sub.indices[sub.indptr[s]:sub.indptr[s + 1]]] = True
+        linked[s] = True
+        t = rng.choice(np.flatnonzero(~linked))
+        flow = sp.sparse.csgraph.maximum_flow(flows, 2 * s + 1, 2 * t)
+        bound = min(bound, int(flow.flow_value))
+        tried += 1
+        progress(tried / pairs, "max-flow pairs")
+    return NodeConnectivity(bound, min_degree, tried)
@@ -0,0 +1,35 @@
+"""
+meteorshower_ensemble.py -- meteor shower resilience over many seeds
+
+This is a sample script bundled with bapmesim_tk.
+It repeats the `meteorshower.py` scenario for 200 random seeds
+over all CPUs, printing running means while replicas come in,
+and plots the mean degradation curve with 95% confidence bands.
+"""
+
+from bapmesim_tk.ensemble import Ensemble
+# The workers import the scenario, so it lives in a module
+from bapmesim_tk.scenarios import meteor_shower
+
+
+def report(num, values, stats):
+    count = stats.count['connected']
+    if count % 25 == 0:
+        mean, low, high = stats.summary()['num_connected']
+        print(
+            f"{count} replicas: "
+            f"{mean:.1f} nodes connected at the end ({low:.1f} .. {high:.1f})"
+            )
+
+
+stats = Ensemble(meteor_shower, 200, seed=1).run(report)
+
+fig, ax = plt.subplots(1)
+for name, label in (('active', "Active Nodes"), ('connected', "Connected Nodes")):
+    mean, low, high = stats.summary()[name]
+    ax.plot(range(len(mean)), mean, label=label)
+    ax.fill_between(range(len(mean)), low, high, alpha=0.3)
+ax.set_xlabel('Time')
+ax.set_ylabel('Number of nodes')
+ax.legend()
+fig.show()
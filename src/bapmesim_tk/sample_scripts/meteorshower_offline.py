@@ -0,0 +1,33 @@
+"""
+meteorshower_offline.py -- model resilience to meteor shower, offline
+
+This is a sample script bundled with bapmesim_tk.
+It computes the same degradation curve as `meteorshower.py`,
+but the whole shower is evaluated in one pass by `Sim.shower_curve`
+and the deployment itself is left untouched.
+"""
+
+import numpy as np
+
+scatter(num=200, loc=(-0.5, -0.5), scale=1)
+scatter(num=100, loc=(0.5, 0.5), scale=2)
+
+# Ten rounds of ten meteors each
+times = np.repeat(np.arange(1, 11), 10)
+locs = self.sim.random_impacts(len(times))
+
+curve = self.sim.shower_curve(
+    times,
+    locs,
+    sizes=0.5,
+    node_range=0.7,
+    steps=range(0, 11),
+    )
+
+fig, ax = plt.subplots(1)
+ax.scatter(curve.steps, curve.num_nodes, label="Active Nodes")
+ax.scatter(curve.steps, curve.num_connected, label="Connected Nodes")
+ax.set_xlabel('Time')
+ax.set_ylabel('Number of nodes')
+ax.legend()
+fig.show()
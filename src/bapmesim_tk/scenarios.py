@@ -0,0 +1,29 @@
+"""
+scenarios.py: ready-made scenarios for `ensemble.Ensemble`.
+
+Worker processes that are not forked from the caller
+import their scenario by name, so scenarios meant to run
+over a process pool have to live in a module like this one,
+not in a script or the console.
+"""
+
+
+def meteor_shower(sim):
+    """
+    Two scattered clusters under ten rounds of ten meteors,
+    returning the `active` and `connected` node counts
+    before the first round and after every round.
+    """
+    sim.scatter_nodes(num=200, loc=(-0.5, -0.5), scale=1)
+    sim.scatter_nodes(num=100, loc=(0.5, 0.5), scale=2)
+
+    nodes_active = []
+    nodes_connected = []
+    for step in range(0, 11):
+        if step:
+            sim.strike(sim.random_impacts(10), 0.5)
+        sim.make_graph(0.7)
+        nodes_active.append(sim.num_nodes)
+        nodes_connected.append(sim.num_connected)
+
+    return {'active': nodes_active, 'connected': nodes_connected}
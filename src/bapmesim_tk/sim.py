@@ -0,0 +1,1061 @@
+"""
+sim.py: headless simulator core.
+
+Nothing here needs a display,
+so scripts and batch runs can import `Sim`
+without tkinter or matplotlib.
+"""
+
+from typing import NamedTuple
+import contextlib
+
+import numpy as np
+
+from . import graph
+from .unionfind import UnionFind
+from .live import LiveGraph
+from .nodes import NodeStore, ClusterTable
+from . import spatial
+from . import patterns
+from .terrain import Terrain, PixelTransform
+from .hillshade import Hillshader
+from .los import LineOfSight
+from .tasks import progress
+
+
+class ConnectivityCurve(NamedTuple):
+    """
+    Result of `Sim.connectivity_curve`.
+
+    All arrays have one entry per range, in the order they were given.
+    """
+    ranges: np.ndarray
+    root_size: np.ndarray
+    num_components: np.ndarray
+    largest: np.ndarray
+    critical_range: float
+
+class ShowerCurve(NamedTuple):
+    """
+    Result of `Sim.shower_curve`.
+
+    `num_nodes` and `num_connected` have one entry per step,
+    `death_times` has one entry per node
+    (`inf` for nodes that survive the whole shower).
+    """
+    steps: np.ndarray
+    num_nodes: np.ndarray
+    num_connected: np.ndarray
+    death_times: np.ndarray
+
+class GatewayRoutes(NamedTuple):
+    """
+    Result of `Sim.gateway_routes`.
+
+    `nearest` and `hops` have one entry per slot,
+    -1 for nodes that reach no gateway and for dead nodes.
+    `load` has one entry per gateway.
+    """
+    gateways: np.ndarray
+    nearest: np.ndarray
+    hops: np.ndarray
+    load: np.ndarray
+
+
+class Sim:
+    """
+    Simulator backend, no graphics.
+
+    Nodes live in a `NodeStore`.
+    Destroyed nodes are only marked dead until the store is compacted,
+    so node indices ("slots") stay valid across strikes.
+
+    Attributes
+    ----------
+
+    nodes
+        `NodeStore` with the position, cluster, id
+        and alive flag of every slot.
+
+    nodes_pos
+        View of the position of every slot.
+        Rows of dead nodes stay in place until compaction,
+        check `alive` to skip them.
+
+    clusters
+        `ClusterTable` with the slot range, clusterhead
+        and alive count of every cluster.
+
+    clst_indices
+        Slot boundaries of the clusters,
+        same as `clusters.bounds`.
+
+    index
+        Spatial index over the alive nodes.
+        `'kdtree'` (default) is a KDTree rebuilt lazily
+        on the first query after nodes were added,
+        `'grid'` is a grid hash with `cell_size` cells
+        that is updated in place.
+        See `spatial`.
+
+    graph_engine
+        Which library `make_graph` uses.
+        `'scipy'` (default) keeps the graph as a sparse matrix,
+        `'networkx'` builds an `nx.Graph` in `self.graph`.
+        Both produce the same array results.
+
+    adjacency
+        Symmetric `scipy.sparse` CSR adjacency matrix
+        built by `make_graph`.
+
+    generation
+        Number of edits that added or renumbered slots so far,
+        i.e. additions, compactions and resets.
+        The graph remembers the generation it was built for.
+
+    path_lengths
+        int32 array of hop counts from the root to every slot,
+        -1 for nodes that cannot reach the root and for dead nodes.
+
+    components
+        Connected component label of every slot, -1 for dead nodes.
+
+    live
+        `LiveGraph` that keeps the graph attributes above
+        up to date after every edit, see `track`.
+        None if tracking is off.
+
+    terrain
+        Lazily read `Terrain`, see `load_terrain`.
+        Its `transform` maps world coordinates to terrain pixels.
+
+    los
+        `LineOfSight` link model for the terrain,
+        used by `make_graph(..., link_model='los')`.
+        Set its `mast_height` to raise the antennas.
+
+    shaded
+        uint8 hillshade of the terrain, see `hillshade`.
+
+    hillshader
+        `Hillshader` that computes and remembers hillshades.
+
+    batching
+        Whether edits are being deferred, see `batch`.
+
+    rng
+        Random generator for deployments and impacts,
+        made from the `rng` seed (int, `SeedSequence` or `Generator`).
+        The global `np.random` state if no seed is given.
+
+    """
+    GRAPH_ENGINES = ('scipy', 'networkx')
+    LINK_MODELS = ('range', 'los')
+    # See `nodes_in_box`
+    BOX_SAMPLE = 1024
+    BOX_MASK_SHARE = 0.3
+
+    def __init__(
+            self, graph_engine='scipy', index='kdtree', cell_size=0.5,
+            rng=None):
+        if graph_engine not in self.GRAPH_ENGINES:
+            raise ValueError(
+                f"Unknown graph engine `{graph_engine}`, "
+                f"expected one of {self.GRAPH_ENGINES}"
+                )
+        if index not in spatial.INDEXES:
+            raise ValueError(
+                f"Unknown spatial index `{index}`, "
+                f"expected one of {tuple(spatial.INDEXES)}"
+                )
+        self.graph_engine = graph_engine
+        self.index_kind = index
+        self.cell_size = cell_size
+        self.rng = np.random if rng is None else np.random.default_rng(rng)
+        self.live = None
+        self.los = None
+        self.hillshader = Hillshader()
+        self._batch_depth = 0
+        self.generation = 0
+        self.reset()
+
+    def reset(self):
+        # First slot not in the index yet,
+        # and victims the live graph has not been told about
+        self._unindexed = None
+        self._victims = []
+        self.generation += 1
+        self.nodes = NodeStore()
+        self.clusters = ClusterTable()
+        if self.index_kind == 'grid':
+            self.index = spatial.GridIndex(self.nodes, self.cell_size)
+        else:
+            self.index = spatial.KDTreeIndex(self.nodes)
+        if self.live is not None:
+            self.track(self.live.node_range, self._live_link_model)
+
+    @property
+    def nodes_pos(self):
+        return self.nodes.pos
+
+    @property
+    def alive(self):
+        return self.nodes.alive
+
+    @property
+    def clst_indices(self):
+        return self.clusters.bounds
+
+    @property
+    def adjacency(self):
+        # While tracking, the matrix is only built when asked for
+        if self.live is not None:
+            return self.live.adjacency
+        return self._adjacency
+
+    @adjacency.setter
+    def adjacency(self, adj):
+        self._adjacency = adj
+        self._adjacency_generation = self.generation
+
+    def _graph_is_current(self):
+        """Whether `adjacency` is a graph of the current slots."""
+        if self.live is not None:
+            return True
+        return getattr(self, '_adjacency', None) is not None \
+            and self._adjacency_generation == self.generation
+
+    def cluster_of(self, slots):
+        """Return the cluster number of `slots`."""
+        return self.nodes.cluster[slots]
+
+    def members(self, k):
+        """Return the alive slots of cluster `k`."""
+        return self.clusters.members(k, self.alive)
+
+    def slots_of(self, ids):
+        """Return the current slots of stable node `ids`, -1 if gone."""
+        return self.nodes.slots_of(ids)
+
+    @property
+    def root(self):
+        """Slot of the root node (the first alive node), None if empty."""
+        if not self.nodes.num_alive:
+            return None
+        return int(np.argmax(self.nodes.alive))
+
+    def add_cluster(self, positions):
+        """
+        Append a cluster of nodes at `positions`.
+        The first position is the clusterhead.
+
+        Returns the slot of the clusterhead.
+        """
+        start = self.nodes.append(positions, self.clusters.num)
+        self.clusters.add(start, self.nodes.size - start)
+        self.generation += 1
+        if self._unindexed is None:
+            self._unindexed = start
+        if not self.batching:
+            self.flush()
+        return start
+
+    @property
+    def batching(self):
+        return self._batch_depth > 0
+
+    @contextlib.contextmanager
+    def batch(self):
+        """
+        Defer the bookkeeping of edits made in the `with` block
+        and do it once at the end, see `flush`.
+
+        Inside the block, nodes are added and killed right away
+        and the spatial index catches up before every query,
+        but the live graph attributes (`adjacency`, `components`,
+        `path_lengths`) only follow at the end,
+        and compaction waits, so slots stay put.
+        Batches nest; only the outermost one flushes.
+        """
+        self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+            if not self.batching:
+                self.flush()
+
+    def flush(self):
+        """
+        Catch up on deferred edits:
+        index the added nodes, update the live graph
+        for all additions and strikes at once,
+        and compact if enough nodes are dead.
+        """
+        self._flush_index()
+        self._flush_live()
+        if self.nodes.needs_compaction:
+            self.compact()
+
+    def _flush_index(self):
+        if self._unindexed is None:
+            return
+        self.index.insert(np.arange(self._unindexed, self.nodes.size))
+        self._unindexed = None
+
+    def _flush_live(self):
+        victims = self._victims
+        self._victims = []
+        if self.live is None:
+            return
+        self._flush_index()
+
+        # Strikes on the nodes the live graph knows,
+        # then the additions, then strikes on the added nodes
+        start = self.live.num_slots
+        if not victims and start == self.nodes.size:
+            return
+        victims = np.concatenate(victims or [[]]).astype(np.intp)
+        old = victims[victims < start]
+        if len(old):
+            alive = self.alive[:start]
+            self.live.kill(old, int(np.argmax(alive)) if alive.any() else None)
+        if start < self.nodes.size:
+            if self.root is None:
+                # Everything is dead, nothing to link
+                size = self.nodes.size
+                self.live.reset(
+                    np.empty((0, 2), dtype=np.intp),
+                    np.full(size, -1, dtype=np.intp),
+                    0,
+                    np.full(size, -1, dtype=np.int32),
+                    )
+            else:
+                self.live.insert(self.index, self.nodes_pos, start, self.root)
+                self.live.kill(victims[victims >= start], self.root)
+        self.sync_live()
+
+    def circles(self, radii, nodes, loc):
+        self.add_cluster(patterns.rings(loc, radii, nodes))
+
+    def scatter_nodes(self, num, loc, scale):
+        self.add_cluster(patterns.gaussian(loc, scale, num, rng=self.rng))
+
+    def deploy(self, pattern, *args, **kwargs):
+        """
+        Add one cluster laid out by the generator
+        `patterns.PATTERNS[pattern]`, called with `args` and `kwargs`.
+        Random patterns draw from `rng` unless told otherwise.
+
+        Returns the slot of the clusterhead.
+        """
+        if pattern not in patterns.PATTERNS:
+            raise ValueError(
+                f"Unknown pattern {pattern!r}, "
+                f"expected one of {list(patterns.PATTERNS)}"
+                )
+        if pattern in patterns.RANDOM:
+            kwargs.setdefault('rng', self.rng)
+        return self.add_cluster(patterns.PATTERNS[pattern](*args, **kwargs))
+
+    @property
+    def num_nodes(self):
+        return self.nodes.num_alive
+
+    @property
+    def num_connected(self):
+        return int(np.count_nonzero(self.path_lengths >= 0))
+
+    def hop_histogram(self):
+        """Number of nodes at every hop count to the root, from 0 hops up."""
+        # Shifted by one so that unreachable and dead slots (-1) go in bin 0
+        return np.bincount(self.path_lengths + 1)[1:]
+
+    @property
+    def num_disconnected(self):
+        return self.num_nodes - self.num_connected
+
+    @property
+    def kdtree(self):
+        """KDTree over every slot, rebuilt on first use after a change."""
+        self._flush_index()
+        return self.index.kdtree
+
+    def make_tree(self):
+        self._flush_index()
+        self.index.rebuild()
+
+    def query_ball(self, locs, sizes):
+        """
+        Find the alive nodes within `sizes` of each of `locs`.
+
+        Returns two flat arrays:
+        the index into `locs` of every hit, and the slot that was hit.
+        """
+        self._flush_index()
+        return self.index.query_ball(locs, sizes)
+
+    def query_pairs(self, node_range):
+        """Return an (m, 2) array of alive slots within `node_range`."""
+        self._flush_index()
+        return self.index.query_pairs_array(node_range)
+
+    def nodes_in_box(self, lo, hi, dead=False):
+        """
+        Return the slots with `lo <= pos <= hi`, sorted.
+        Dead slots are only included if `dead` is true.
+
+        The spatial index costs time per node found,
+        a plain mask over all positions costs less per node
+        but goes through all of them.
+        Boxes that hold more than `BOX_MASK_SHARE` of the nodes
+        (estimated from a sample of them) are masked.
+        """
+        lo = np.asarray(lo, dtype=float)
+        hi = np.asarray(hi, dtype=float)
+        pos = self.nodes_pos
+        if self.nodes.extent is None:
+            return np.empty(0, dtype=np.intp)
+
+        if (lo <= self.nodes.extent[0]).all() and (hi >= self.nodes.extent[1]).all():
+            # Everything is inside, no need to ask the index
+            return np.arange(len(pos)) if dead else np.flatnonzero(self.alive)
+
+        sample = pos[::max(len(pos) // self.BOX_SAMPLE, 1)]
+        share = ((sample >= lo) & (sample <= hi)).all(axis=1).mean()
+        if share > self.BOX_MASK_SHARE:
+            inside = ((pos >= lo) & (pos <= hi)).all(axis=1)
+            if not dead:
+                inside &= self.alive
+            return np.flatnonzero(inside)
+
+        self._flush_index()
+        slots = self.index.query_box(lo, hi)
+        if dead and self.nodes.num_dead:
+            tomb = np.flatnonzero(~self.alive)
+            inside = ((pos[tomb] >= lo) & (pos[tomb] <= hi)).all(axis=1)
+            slots = np.concatenate((slots, tomb[inside]))
+        return np.sort(slots)
+
+    def links(self, pairs, link_model='range', replace=True):
+        """
+        Return the candidate `pairs` in range that actually link.
+
+        `'range'` links every pair,
+        `'los'` only pairs with a terrain line of sight, see `los`.
+        With `replace`, the line of sight cache is narrowed
+        to `pairs`, as a full graph build wants.
+        """
+        if link_model not in self.LINK_MODELS:
+            raise ValueError(
+                f"Unknown link model `{link_model}`, "
+                f"expected one of {self.LINK_MODELS}"
+                )
+        if link_model == 'range':
+            return pairs
+        if self.los is None:
+            raise ValueError("The 'los' link model needs a terrain")
+        return pairs[self.los.visible(
+            self.nodes_pos, self.nodes.ids, pairs, replace)]
+
+    def make_graph(self, node_range, link_model='range'):
+        pairs = self.links(self.query_pairs(node_range), link_model)
+        adj = self.adjacency = graph.adjacency(pairs, self.nodes.size)
+
+        if self.graph_engine == 'networkx':
+            self.make_graph_networkx(pairs)
+        else:
+            self.num_components, self.components = graph.components(adj)
+            self.path_lengths = (
+                graph.hop_counts(adj, self.root)
+                if self.root is not None
+                else np.full(self.nodes.size, -1, dtype=np.int32)
+                )
+
+            # Dead nodes are isolated, don't count them as components
+            self.components[~self.alive] = -1
+            self.num_components -= self.nodes.num_dead
+
+        if self.live is not None:
+            # The new graph already accounts for deferred strikes
+            self._victims = []
+            self.live.node_range = node_range
+            # For `reset` to track the same way again
+            self._live_link_model = link_model
+            self.live.link_filter = None if link_model == 'range' else (
+                lambda new_pairs: self.los.visible(
+                    self.nodes_pos, self.nodes.ids, new_pairs, replace=False)
+                )
+            self.live.reset(
+                pairs,
+                self.components,
+                self.num_components,
+                self.path_lengths,
+                adj,
+                )
+
+    def track(self, node_range, link_model='range'):
+        """
+        Keep `adjacency`, `components`, `num_components`
+        and `path_lengths` up to date for `node_range`
+        and `link_model` after every scatter, circle and strike.
+
+        Edits then only cost work proportional
+        to the neighbourhood and components they touch.
+        A later `make_graph` switches tracking to its range.
+        """
+        self.live = LiveGraph(node_range)
+        self.make_graph(node_range, link_model)
+
+    def untrack(self):
+        """Stop keeping the graph up to date after edits."""
+        if self.live is not None:
+            self.adjacency = self.live.adjacency
+        self.live = None
+
+    def sync_live(self):
+        self.components = self.live.components
+        self.num_components = self.live.num_components
+        self.path_lengths = self.live.path_lengths
+
+    def make_graph_networkx(self, pairs):
+        import networkx as nx
+
+        self.graph = nx.Graph()
+        self.graph.add_nodes_from(np.flatnonzero(self.alive).tolist())
+        self.graph.add_edges_from(pairs.tolist())
+
+        self.path_lengths = np.full(self.nodes.size, -1, dtype=np.int32)
+        if self.root is not None:
+            hops = nx.single_source_shortest_path_length(self.graph, self.root)
+            self.path_lengths[list(hops.keys())] = list(hops.values())
+
+        self.components = np.full(self.nodes.size, -1, dtype=np.int32)
+        self.num_components = 0
+        for label, nodes in enumerate(nx.connected_components(self.graph)):
+            self.components[list(nodes)] = label
+            self.num_components += 1
+
+    def connectivity_curve(self, ranges, root=None):
+        """
+        Measure connectivity at many node ranges in one pass.
+
+        Pairs are queried once at the largest range
+        and merged in order of length with a union-find,
+        recording the state as each range is passed.
+
+        Parameters
+        ----------
+        ranges
+            Node ranges to evaluate, in any order.
+        root
+            Slot whose component size is reported.
+            Defaults to the root node.
+
+        Returns
+        -------
+        `ConnectivityCurve` with, for every range,
+        the size of `root`'s component,
+        the number of components
+        and the size of the largest component.
+        `critical_range` is the exact range at which `root`
+        first reaches every node,
+        or `inf` if it does not even at the largest range.
+        An empty network gives zero curves and an `inf` critical range.
+        """
+        ranges = np.asarray(ranges, dtype=float)
+        num_nodes = self.num_nodes
+        if not num_nodes:
+            zeros = np.zeros(len(ranges), dtype=np.int64)
+            return ConnectivityCurve(
+                ranges=ranges,
+                root_size=zeros,
+                num_components=zeros.copy(),
+                largest=zeros.copy(),
+                critical_range=np.inf,
+                )
+        if root is None:
+            root = self.root
+
+        pairs = self.query_pairs(ranges.max())
+        # Squared lengths against squared ranges, like the spatial
+        # queries behind `make_graph`, so that pairs exactly at
+        # a range are linked by both or by neither
+        delta = self.nodes_pos[pairs[:, 0]] - self.nodes_pos[pairs[:, 1]]
+        lengths2 = (delta * delta).sum(axis=1)
+        forest = graph.kruskal_forest(pairs, lengths2, self.nodes.size)
+        forest_lengths2 = lengths2[forest]
+
+        # Every forest edge merges two components,
+        # so only the union-find is needed for component sizes.
+        cutoffs = np.searchsorted(forest_lengths2, ranges ** 2, side='right')
+        root_size = np.empty(len(ranges), dtype=np.int64)
+        largest = np.empty(len(ranges), dtype=np.int64)
+
+        uf = UnionFind(self.nodes.size)
+        merged = 0
+        for i in np.argsort(cutoffs, kind='stable'):
+            progress(merged / max(len(forest), 1), "merging components")
+            while merged < cutoffs[i]:
+                uf.union(*pairs[forest[merged]].tolist())
+                merged += 1
+            root_size[i] = uf.set_size(root)
+            largest[i] = uf.largest
+
+        if num_nodes == 1:
+            critical_range = 0.0
+        elif len(forest) == num_nodes - 1:
+            # Smallest range whose square reaches the last edge
+            last = forest_lengths2[-1]
+            critical_range = np.sqrt(last)
+            if critical_range ** 2 < last:
+                critical_range = np.nextafter(critical_range, np.inf)
+            critical_range = float(critical_range)
+        else:
+            critical_range = np.inf
+
+        return ConnectivityCurve(
+            ranges=ranges,
+            root_size=root_size,
+            num_components=num_nodes - cutoffs,
+            largest=largest,
+            critical_range=critical_range,
+            )
+
+    def death_times(self, times, locs, sizes):
+        """
+        Return the time at which every slot is destroyed
+        by a schedule of impacts, `inf` if it survives
+        and `-inf` if it is already dead.
+
+        Impact `i` happens at `times[i]` at `locs[i]`
+        with blast radius `sizes[i]`
+        (`sizes` may also be a single radius).
+        """
+        times = np.asarray(times, dtype=float)
+        locs = np.atleast_2d(np.asarray(locs, dtype=float))
+        sizes = np.broadcast_to(np.asarray(sizes, dtype=float), len(locs))
+
+        death = np.where(self.alive, np.inf, -np.inf)
+        if not len(locs):
+            return death
+
+        owners, victims = self.query_ball(locs, sizes)
+        np.minimum.at(death, victims, times[owners])
+        return death
+
+    def shower_curve(self, times, locs, sizes, node_range, steps=None):
+        """
+        Compute how the network degrades during a meteor shower
+        without touching the deployment.
+
+        Death times for all nodes are found in one vectorized pass.
+        The shower is then replayed in reverse:
+        edges are added back in order of decreasing death time
+        into a union-find,
+        so the whole curve costs one graph build.
+
+        Parameters
+        ----------
+        times, locs, sizes
+            Impact schedule, see `death_times`.
+        node_range
+            Node range used for connectivity.
+        steps
+            Times at which to evaluate the network.
+            Each step sees the state after every impact
+            at or before it.
+            Defaults to the distinct impact times.
+
+        Returns
+        -------
+        `ShowerCurve` with the number of surviving nodes
+        and the number of nodes connected to the root at every step.
+        Like after `strike`, the root is the first surviving node.
+        """
+        death = self.death_times(times, locs, sizes)
+        if steps is None:
+            steps = np.unique(times)
+        steps = np.asarray(steps, dtype=float)
+
+        pairs = self.query_pairs(node_range)
+        edge_death = np.minimum(death[pairs[:, 0]], death[pairs[:, 1]])
+
+        # Reverse replay adds edges from the last to die to the first,
+        # which is a maximum spanning forest over edge death times.
+        forest = graph.kruskal_forest(pairs, -edge_death, self.nodes.size)
+        num_edges = len(forest) - np.searchsorted(
+            edge_death[forest][::-1], steps, side='right')
+
+        # The root at each step is the lowest surviving slot.
+        by_death = np.argsort(-death, kind='stable')
+        roots = np.minimum.accumulate(by_death)
+        num_nodes = len(death) - np.searchsorted(
+            np.sort(death), steps, side='right')
+
+        num_connected = np.zeros(len(steps), dtype=np.int64)
+        uf = UnionFind(self.nodes.size)
+        merged = 0
+        for i in np.argsort(num_edges, kind='stable'):
+            progress(merged / max(len(forest), 1), "replaying shower")
+            while merged < num_edges[i]:
+                uf.union(*pairs[forest[merged]].tolist())
+                merged += 1
+            if num_nodes[i]:
+                num_connected[i] = uf.set_size(roots[num_nodes[i] - 1])
+
+        return ShowerCurve(
+            steps=steps,
+            num_nodes=num_nodes,
+            num_connected=num_connected,
+            death_times=death,
+            )
+
+    def gateway_routes(self, gateways=None):
+        """
+        Route every node to its nearest gateway.
+
+        All gateways are searched from at once
+        in one breadth-first pass, see `graph.nearest_sources`.
+        Dead nodes are left out, so the graph of the last `make_graph`
+        stays valid after strikes, but not after nodes are added
+        (unless the graph is tracked, see `track`).
+
+        Parameters
+        ----------
+        gateways
+            Gateway slots.
+            Defaults to the clusterheads, one per cluster that has
+            any nodes left.
+
+        Returns
+        -------
+        `GatewayRoutes` with the gateway slots,
+        the slot of the nearest gateway of every node
+        and how many hops away it is,
+        and the load of every gateway:
+        the number of nodes routed to it, itself included.
+        Nodes equally close to several gateways
+        are routed to the first of them.
+        Dead gateways get no nodes.
+
+        Raises ValueError if there is no graph of the current nodes.
+        """
+        if self.live is not None:
+            self._flush_live()
+        if not self._graph_is_current():
+            raise ValueError(
+                "No graph of the current nodes, call `make_graph` first")
+        adj = self.adjacency
+
+        if gateways is None:
+            gateways = self.clusters.heads[self.clusters.heads >= 0]
+        gateways = np.asarray(gateways, dtype=np.intp)
+
+        hops, nearest = graph.nearest_sources(adj, gateways, self.alive)
+        reached = nearest >= 0
+        load = np.bincount(nearest[reached], minlength=len(gateways))
+        nearest[reached] = gateways[nearest[reached]]
+        return GatewayRoutes(
+            gateways=gateways,
+            nearest=nearest,
+            hops=hops,
+            load=load,
+            )
+
+    def to_networkx(self):
+        """
+        Export the graph from the last `make_graph` as an `nx.Graph`
+        of the alive nodes, labelled by slot.
+        """
+        return graph.to_networkx(self.adjacency, np.flatnonzero(self.alive))
+
+    def strike(self, locs, sizes):
+        """
+        Destroy every node within `sizes` of any of `locs`.
+
+        All impacts are resolved with a single ball query.
+        Destroyed nodes are only marked dead,
+        and the node store is compacted
+        once enough of it is dead.
+
+        Parameters
+        ----------
+        locs
+            Impact locations, one coordinate pair per impact.
+        sizes
+            Blast radius of each impact,
+            or a single radius shared by all of them.
+
+        Returns
+        -------
+        Sorted slots (before any compaction) of the destroyed nodes.
+        """
+        locs = np.atleast_2d(np.asarray(locs, dtype=float))
+        sizes = np.broadcast_to(np.asarray(sizes, dtype=float), len(locs))
+
+        if not self.nodes.num_alive or not len(locs):
+            return np.empty(0, dtype=np.intp)
+
+        _, hits = self.query_ball(locs, sizes)
+        victims = self.nodes.kill(hits)
+        self.clusters.kill(victims, self.nodes.cluster, self.alive)
+        self.index.delete(victims)
+
+        if self.live is not None:
+            self._victims.append(victims)
+        if not self.batching:
+            self.flush()
+        return victims
+
+    def compact(self):
+        """
+        Squeeze dead nodes out of the node store.
+
+        Slots of surviving nodes shift down,
+        and everything indexed by slot follows along.
+        """
+        self._flush_index()
+        self._flush_live()
+        current = self._graph_is_current()
+        keep = self.nodes.compact()
+        if keep is None:
+            return
+
+        self.generation += 1
+        self.clusters.compact(keep)
+        self.index.compact(keep)
+        if self.los is not None:
+            self.los.compact(self.nodes.ids)
+
+        if self.live is not None:
+            self.live.compact(keep)
+            self.sync_live()
+        elif current:
+            self.path_lengths = self.path_lengths[keep]
+            self.components = self.components[keep]
+            self.adjacency = self.adjacency[keep][:, keep]
+
+    def random_impacts(self, num):
+        """
+        Return `num` impact locations spread uniformly
+        over the bounding box of all nodes.
+        """
+        alive_pos = self.nodes_pos[self.alive]
+        xmin, ymin = alive_pos.min(axis=0)
+        xmax, ymax = alive_pos.max(axis=0)
+        return self.rng.uniform(
+            [xmin, ymin],
+            [xmax, ymax],
+            size=[num, 2]
+            )
+
+    def state(self, graph=True):
+        """
+        Return the deployment as a dict of arrays
+        and a dict of JSON-able scalars, for `from_state`:
+        node columns, cluster table, grid index entries,
+        the state of `rng` (unless it is the global one),
+        where the terrain comes from,
+        and with `graph`, the last graph as CSR arrays
+        with its hop counts and components.
+        """
+        self._flush_index()
+        self._flush_live()
+        nodes = self.nodes
+        arrays = {
+            'pos': nodes.pos,
+            'cluster': nodes.cluster,
+            'ids': nodes.ids,
+            'alive': nodes.alive,
+            'starts': self.clusters.starts,
+            'heads': self.clusters.heads,
+            'counts': self.clusters.counts,
+            }
+        meta = {
+            'next_id': nodes.next_id,
+            'extent': None if nodes.extent is None
+            else [np.asarray(corner).tolist() for corner in nodes.extent],
+            'end': self.clusters.end,
+            'index': self.index_kind,
+            'cell_size': self.cell_size,
+            'graph_engine': self.graph_engine,
+            }
+        if isinstance(self.index, spatial.GridIndex):
+            arrays['grid_keys'], arrays['grid_slots'] = self.index.entries
+        if isinstance(self.rng, np.random.Generator):
+            meta['rng'] = self.rng.bit_generator.state
+        if getattr(self, 'terrain', None) is not None \
+                and self.terrain.path is not None:
+            meta['terrain'] = {
+                'path': str(self.terrain.path),
+                'band': self.terrain.band,
+                'scale': self.terrain.transform.scale.tolist(),
+                'offset': self.terrain.transform.offset.tolist(),
+                }
+        if graph and getattr(self, 'adjacency', None) is not None:
+            adj = self.adjacency
+            arrays.update(
+                indptr=adj.indptr,
+                indices=adj.indices,
+                data=adj.data,
+                path_lengths=self.path_lengths,
+                components=self.components,
+                )
+            meta['shape'] = list(adj.shape)
+        return arrays, meta
+
+    @classmethod
+    def from_state(cls, arrays, meta, terrain=True, **kwargs):
+        """
+        Rebuild a `Sim` from the output of `state`,
+        using the arrays as they are, without copying.
+        With `terrain`, the terrain is opened again from its path.
+        `kwargs` go to `Sim`, an `rng` there overrides the saved state.
+        """
+        if 'rng' not in kwargs and 'rng' in meta:
+            state = meta['rng']
+            rng = getattr(np.random, state['bit_generator'])()
+            rng.state = state
+            kwargs['rng'] = np.random.Generator(rng)
+        kwargs.setdefault('graph_engine', meta.get('graph_engine', 'scipy'))
+        sim = cls(index=meta['index'], cell_size=meta['cell_size'], **kwargs)
+
+        extent = meta['extent']
+        sim.nodes = NodeStore.from_columns(
+            arrays['pos'], arrays['cluster'], arrays['ids'], arrays['alive'],
+            meta['next_id'],
+            None if extent is None else tuple(map(np.array, extent)),
+            )
+        sim.clusters = ClusterTable.from_columns(
+            arrays['starts'], arrays['heads'], arrays['counts'], meta['end'])
+        if meta['index'] == 'grid':
+            sim.index = spatial.GridIndex(sim.nodes, meta['cell_size'])
+            sim.index.entries = arrays['grid_keys'], arrays['grid_slots']
+        else:
+            sim.index = spatial.KDTreeIndex(sim.nodes)
+
+        if 'indptr' in arrays:
+            sim.adjacency = graph.from_csr(
+                arrays['data'], arrays['indices'], arrays['indptr'],
+                tuple(meta['shape']),
+                )
+            sim.path_lengths = arrays['path_lengths']
+            sim.components = arrays['components']
+
+        if terrain and 'terrain' in meta:
+            ter = meta['terrain']
+            sim.load_terrain(
+                ter['path'], ter['band'],
+                transform=PixelTransform(ter['scale'], ter['offset']),
+                )
+        return sim
+
+    def save(self, path, graph=True):
+        """
+        Save the deployment to an uncompressed `.npz` checkpoint,
+        see `state` for what goes in and `checkpoint`.
+        """
+        from . import checkpoint
+        checkpoint.save(path, *self.state(graph))
+
+    @classmethod
+    def load(cls, path, terrain=True, **kwargs):
+        """
+        Open a checkpoint written by `save`.
+
+        The arrays are memory mapped copy-on-write,
+        so opening is instant, only pages that are touched are read,
+        and edits never reach the file.
+        See `from_state` for the arguments.
+        """
+        from . import checkpoint
+        return cls.from_state(*checkpoint.load(path), terrain=terrain, **kwargs)
+
+    def publish(self, name=None):
+        """
+        Publish a read-only snapshot of the nodes, clusters,
+        grid index and last graph in shared memory,
+        for other processes to `Snapshot.attach` to by name.
+        See `snapshot.Snapshot`.
+        """
+        from .snapshot import Snapshot
+        return Snapshot.publish(self, name)
+
+    def load_terrain(self, path, band=1, **kwargs):
+        """
+        Open a terrain raster lazily, see `terrain.Terrain.open`.
+        Any hillshade of the previous terrain is dropped.
+        """
+        self.terrain = Terrain.open(path, band, **kwargs)
+        self.los = LineOfSight(self.terrain)
+        if hasattr(self, 'shaded'):
+            del self.shaded
+
+    def hillshade(self, azimuth, altitude):
+        """
+        Hillshade the terrain with the sun at `azimuth` and `altitude`
+        (degrees) into `shaded`.
+
+        Slope and aspect of recently shaded tiles are reused
+        for other sun positions, and recent results are remembered,
+        see `Hillshader`.
+        """
+        self.shaded = self.hillshader.shade(self.terrain, azimuth, altitude)
+        return self.shaded
+
+    @property
+    def ter(self):
+        """The whole terrain band at full resolution, read on access."""
+        return np.asarray(self.terrain)
+
+    def node_elevation(self, slots=None):
+        """
+        Bilinear terrain elevation under the nodes at `slots`
+        (default every slot) as float32, 0 off the terrain.
+        """
+        pos = self.nodes_pos if slots is None else self.nodes_pos[slots]
+        return self.terrain.elevation(pos)
+
+    def terrain_mask(self, pos, elevation=None, max_slope=None):
+        """
+        Mask of the world positions `pos` that are on the terrain,
+        within the `elevation` range (low, high), either end may be None,
+        and no steeper than `max_slope` degrees, see `Terrain.slope`.
+        """
+        pix = self.terrain.transform.to_pixel(pos).reshape(-1, 2)
+        rows, cols = self.terrain.shape
+        mask = (pix >= 0).all(axis=1) & (pix < (cols, rows)).all(axis=1)
+        # Off the terrain is cheap to reject, only interpolate the rest
+        inside = np.flatnonzero(mask)
+        height, d_col, d_row = self.terrain.interpolate(
+            pix[inside, 0], pix[inside, 1], gradient=True)
+
+        ok = np.ones(len(inside), dtype=bool)
+        if elevation is not None:
+            low, high = elevation
+            if low is not None:
+                ok &= height >= low
+            if high is not None:
+                ok &= height <= high
+        if max_slope is not None:
+            ok &= np.hypot(d_col, d_row) <= np.tan(np.deg2rad(max_slope))
+        mask[inside] = ok
+        return mask
+
+    def scatter_on_terrain(
+            self, num, loc, scale, elevation=None, max_slope=None, **kwargs):
+        """
+        Like `scatter_nodes`, but only where `terrain_mask` allows.
+        Candidates are drawn and rejected in batches,
+        `kwargs` go to `patterns.rejection`.
+
+        Returns the slot of the clusterhead.
+        """
+        return self.add_cluster(patterns.rejection(
+            lambda n: self.rng.normal(loc=loc, scale=scale, size=(n, 2)),
+            lambda pos: self.terrain_mask(pos, elevation, max_slope),
+            loc,
+            num,
+            **kwargs
+            ))
@@ -0,0 +1,166 @@
+"""
+snapshot.py: read-only simulation state in shared memory.
+
+`Snapshot.publish` copies the node columns, the cluster table,
+the grid index entries and the last graph
+(CSR arrays, hop counts and components)
+into one `multiprocessing.shared_memory` block,
+behind a small JSON header that describes the layout.
+Other processes `attach` to the block by name
+and get numpy views into it, so a large base deployment
+is held in memory once, however many workers evaluate it.
+"""
+
+import json
+import sys
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# Arrays start on cache line boundaries
+_ALIGN = 64
+# Size of the header length field
+_LENGTH = 8
+
+
+def _aligned(offset):
+    return -(-offset // _ALIGN) * _ALIGN
+
+
+class Snapshot:
+    """
+    Read-only `Sim` state in a shared memory block.
+
+    Use `publish` (or `Sim.publish`) to create one,
+    `attach` to open it in another process,
+    and `sim` to get a `Sim` on top of it.
+    The process that published the snapshot owns the block,
+    and unlinks it when the snapshot is closed.
+
+    On Python before 3.13, attach from processes
+    started by the publishing one (e.g. pool workers):
+    their resource tracker is the publisher's,
+    others would unlink the block when they exit.
+
+    Attributes
+    ----------
+
+    name
+        Name of the shared memory block, for `attach`.
+
+    arrays
+        Read-only views into the block, by name.
+
+    meta
+        Scalars needed to rebuild the state, from the header.
+
+    owner
+        Whether this process published the snapshot.
+
+    """
+    def __init__(self, shm, owner):
+        self.shm = shm
+        self.owner = owner
+        length = int.from_bytes(shm.buf[:_LENGTH], 'little')
+        self.meta = json.loads(bytes(shm.buf[_LENGTH:_LENGTH + length]))
+        self.arrays = {}
+        for key, (offset, dtype, shape) in self.meta.pop('arrays').items():
+            array = np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)
+            array.flags.writeable = False
+            self.arrays[key] = array
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    @property
+    def nbytes(self):
+        return self.shm.size
+
+    @classmethod
+    def publish(cls, sim, name=None):
+        """Copy the state of `sim` into a new shared memory block."""
+        arrays, meta = sim.state()
+        layout = {}
+        offset = 0
+        for key, array in arrays.items():
+            offset = _aligned(offset)
+            layout[key] = (offset, array.dtype.str, array.shape)
+            offset += array.nbytes
+        # The header's length depends on the offsets,
+        # so lay out relative to its end and shift once it is known
+        header = json.dumps({**meta, 'arrays': layout}).encode()
+        start = _aligned(_LENGTH + len(header) + 16 * len(layout))
+        layout = {
+            key: (start + offset, dtype, shape)
+            for key, (offset, dtype, shape) in layout.items()
+            }
+        header = json.dumps({**meta, 'arrays': layout}).encode()
+        assert _LENGTH + len(header) <= start
+
+        shm = shared_memory.SharedMemory(
+            name=name, create=True, size=max(start + offset, 1))
+        shm.buf[:_LENGTH] = len(header).to_bytes(_LENGTH, 'little')
+        shm.buf[_LENGTH:_LENGTH + len(header)] = header
+        for key, array in arrays.items():
+            offset, _, shape = layout[key]
+            np.ndarray(
+                shape, dtype=array.dtype, buffer=shm.buf, offset=offset
+                )[...] = array
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name):
+        """Open the snapshot published as `name`, without copying it."""
+        if sys.version_info >= (3, 13):
+            shm = shared_memory.SharedMemory(name=name, track=False)
+        else:
+            shm = shared_memory.SharedMemory(name=name)
+        return cls(shm, owner=False)
+
+    def sim(self, **kwargs):
+        """
+        Return a `Sim` on top of the snapshot.
+
+        Positions, ids, clusters, grid index entries and the graph
+        are shared read-only views.
+        Only the alive flags and the cluster table,
+        which strikes update, are copied,
+        and automatic compaction is turned off, since it copies the columns.
+        Nodes added later, or an explicit `Sim.compact`,
+        go into private copies of the columns.
+        `kwargs` go to `Sim`, with `rng` defaulting to the global state
+        rather than a copy of the publisher's,
+        so that workers do not all draw the same numbers.
+        The `Sim` keeps the snapshot in its `snapshot` attribute.
+        """
+        from .sim import Sim
+
+        arrays = {
+            **self.arrays,
+            'alive': self.arrays['alive'].copy(),
+            'starts': self.arrays['starts'].copy(),
+            'heads': self.arrays['heads'].copy(),
+            'counts': self.arrays['counts'].copy(),
+            }
+        kwargs.setdefault('rng', None)
+        sim = Sim.from_state(arrays, self.meta, **kwargs)
+        sim.nodes.compact_threshold = np.inf
+        sim.snapshot = self
+        return sim
+
+    def close(self):
+        """
+        Close the block, and unlink it if this process published it.
+        Every `Sim` made from this snapshot must be gone by then.
+        """
+        self.arrays = {}
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
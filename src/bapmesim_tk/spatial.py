@@ -0,0 +1,334 @@
+"""
+spatial.py: spatial indexes over the alive nodes of a `NodeStore`.
+
+All indexes answer the same queries as `scipy.spatial.KDTree`
+(`query_ball_point` and `query_pairs`),
+but only ever return alive slots,
+and are told about insertions, deletions and compactions
+instead of being rebuilt from scratch.
+"""
+
+from itertools import chain
+
+import numpy as np
+import scipy as sp
+
+from .arrays import ragged_arange
+
+
+class SpatialIndex:
+    """
+    Base class for spatial indexes.
+
+    Subclasses implement `query_ball` and `query_pairs_array`,
+    the KDTree-style methods are built on top of those.
+    """
+    def __init__(self, nodes):
+        self.nodes = nodes
+
+    def insert(self, slots):
+        """Add `slots`, which have just been appended to the store."""
+
+    def delete(self, slots):
+        """Remove `slots`, which have just been marked dead."""
+
+    def compact(self, keep):
+        """Follow a compaction of the store that kept the slots in `keep`."""
+
+    def query_ball(self, locs, sizes):
+        """
+        Find the alive nodes within `sizes` of each of `locs`.
+
+        Returns two flat arrays:
+        the index into `locs` of every hit, and the slot that was hit.
+        """
+        raise NotImplementedError
+
+    def query_pairs_array(self, r):
+        """Return an (m, 2) array of alive slot pairs within `r`, i < j."""
+        raise NotImplementedError
+
+    def query_box(self, lo, hi):
+        """Return the alive slots with `lo <= pos <= hi`, in no particular order."""
+        raise NotImplementedError
+
+    def _in_box(self, slots, lo, hi):
+        pos = self.nodes.pos[slots]
+        inside = ((pos >= lo) & (pos <= hi)).all(axis=1)
+        return slots[inside & self.nodes.alive[slots]]
+
+    def query_ball_point(self, x, r):
+        """Same as `KDTree.query_ball_point`, for alive slots only."""
+        x = np.asarray(x, dtype=float)
+        locs = np.atleast_2d(x)
+        owners, slots = self.query_ball(locs, r)
+
+        order = np.lexsort((slots, owners))
+        counts = np.bincount(owners, minlength=len(locs))
+        groups = np.split(slots[order], np.cumsum(counts)[:-1])
+
+        if x.ndim == 1:
+            return groups[0].tolist()
+        result = np.empty(len(locs), dtype=object)
+        result[:] = [group.tolist() for group in groups]
+        return result
+
+    def query_pairs(self, r, output_type='set'):
+        """Same as `KDTree.query_pairs`, for alive slots only."""
+        pairs = self.query_pairs_array(r)
+        if output_type == 'ndarray':
+            return pairs
+        return set(map(tuple, pairs.tolist()))
+
+
+class KDTreeIndex(SpatialIndex):
+    """
+    `scipy.spatial.KDTree` over every slot,
+    rebuilt lazily on the first query after nodes were added.
+
+    Deletions never trigger a rebuild,
+    dead slots are filtered out of query results instead.
+    """
+    def __init__(self, nodes):
+        super().__init__(nodes)
+        self._tree = None
+
+    @property
+    def kdtree(self):
+        if self._tree is None:
+            self.rebuild()
+        return self._tree
+
+    def rebuild(self):
+        self._tree = sp.spatial.KDTree(self.nodes.pos)
+
+    def insert(self, slots):
+        self._tree = None
+
+    def compact(self, keep):
+        self._tree = None
+
+    def query_ball(self, locs, sizes):
+        locs = np.atleast_2d(np.asarray(locs, dtype=float))
+        hits = self.kdtree.query_ball_point(locs, sizes)
+        counts = np.fromiter(map(len, hits), dtype=np.intp, count=len(hits))
+        slots = np.fromiter(
+            chain.from_iterable(hits),
+            dtype=np.intp,
+            count=counts.sum()
+            )
+        owners = np.repeat(np.arange(len(locs)), counts)
+
+        alive = self.nodes.alive[slots]
+        return owners[alive], slots[alive]
+
+    def query_box(self, lo, hi):
+        lo = np.asarray(lo, dtype=float)
+        hi = np.asarray(hi, dtype=float)
+        if not self.nodes.size:
+            return np.empty(0, dtype=np.intp)
+        # Chebyshev ball around the centre, cut down to the box
+        slots = np.array(self.kdtree.query_ball_point(
+            (lo + hi) / 2,
+            (hi - lo).max() / 2,
+            p=np.inf,
+            return_sorted=False,
+            ), dtype=np.intp)
+        return self._in_box(slots, lo, hi)
+
+    def query_pairs_array(self, r):
+        pairs = self.kdtree.query_pairs(r, output_type='ndarray')
+        if self.nodes.num_dead:
+            alive = self.nodes.alive
+            pairs = pairs[alive[pairs[:, 0]] & alive[pairs[:, 1]]]
+        return pairs
+
+
+class GridIndex(SpatialIndex):
+    """
+    Uniform grid hash with square cells of `cell_size`.
+
+    Entries are kept as (cell key, slot) arrays sorted by key,
+    so the nodes of a cell are one `searchsorted` away,
+    and deleting is free (dead slots are skipped until compaction).
+    Inserting is not: the new entries have to be merged
+    into the sorted arrays, which copies all n entries, O(n).
+    Inserts are therefore only collected,
+    and merged all at once by the next query,
+    so a batch of inserts pays for one copy.
+
+    Queries reaching further than `max_reach` cells
+    fall back to a lazily rebuilt KDTree.
+    Pick a cell size close to the node range for best results.
+    """
+    _OFFSET = 2 ** 30
+    _STRIDE = 2 ** 31
+
+    def __init__(self, nodes, cell_size, max_reach=4):
+        super().__init__(nodes)
+        self.cell_size = cell_size
+        self.max_reach = max_reach
+        self._keys = np.empty(0, dtype=np.int64)
+        self._slots = np.empty(0, dtype=np.intp)
+        # Slot arrays inserted since the last merge
+        self._pending = []
+        self._fallback = KDTreeIndex(nodes)
+
+    @property
+    def kdtree(self):
+        return self._fallback.kdtree
+
+    def rebuild(self):
+        self._fallback.rebuild()
+
+    @property
+    def entries(self):
+        """The (cell key, slot) arrays, sorted by key."""
+        self._merge()
+        return self._keys, self._slots
+
+    @entries.setter
+    def entries(self, entries):
+        self._keys, self._slots = entries
+        self._pending = []
+
+    def _cells(self, pos):
+        return np.floor(pos / self.cell_size).astype(np.int64)
+
+    def _key(self, cx, cy):
+        return (cx + self._OFFSET) * self._STRIDE + (cy + self._OFFSET)
+
+    def insert(self, slots):
+        slots = np.asarray(slots, dtype=np.intp)
+        self._pending.append(slots)
+        self._fallback.insert(slots)
+
+    def _merge(self):
+        """Merge the pending inserts into the sorted entries, O(n)."""
+        if not self._pending:
+            return
+        slots = np.concatenate(self._pending)
+        self._pending = []
+        cells = self._cells(self.nodes.pos[slots])
+        keys = self._key(cells[:, 0], cells[:, 1])
+
+        order = np.argsort(keys, kind='stable')
+        where = np.searchsorted(self._keys, keys[order], side='right')
+        self._keys = np.insert(self._keys, where, keys[order])
+        self._slots = np.insert(self._slots, where, slots[order])
+
+    def compact(self, keep):
+        self._merge()
+        kept = keep[self._slots]
+        remap = np.cumsum(keep) - 1
+        self._keys = self._keys[kept]
+        self._slots = remap[self._slots[kept]]
+        self._fallback.compact(keep)
+
+    def _offsets(self, r):
+        """Cell offsets that can hold points within `r` of a cell."""
+        reach = int(np.ceil(r / self.cell_size))
+        steps = np.arange(-reach, reach + 1)
+        dx, dy = np.meshgrid(steps, steps, indexing='ij')
+        gap = (
+            np.maximum(np.abs(dx) - 1, 0) ** 2
+            + np.maximum(np.abs(dy) - 1, 0) ** 2
+            ) * self.cell_size ** 2
+        near = gap <= r ** 2
+        return reach, dx[near], dy[near]
+
+    def _entries(self, keys, lookup):
+        """
+        For every key in `lookup`, find the matching entries in `keys`.
+
+        Returns the index into `lookup` and the index into `keys`
+        of every match.
+        """
+        lo = np.searchsorted(keys, lookup, side='left')
+        hi = np.searchsorted(keys, lookup, side='right')
+        counts = hi - lo
+        return (
+            np.repeat(np.arange(len(lookup)), counts),
+            ragged_arange(lo, counts),
+            )
+
+    def query_ball(self, locs, sizes):
+        locs = np.atleast_2d(np.asarray(locs, dtype=float))
+        sizes = np.broadcast_to(np.asarray(sizes, dtype=float), len(locs))
+        if not len(locs):
+            return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp)
+
+        reach, dxs, dys = self._offsets(sizes.max())
+        if reach > self.max_reach:
+            return self._fallback.query_ball(locs, sizes)
+        self._merge()
+
+        cells = self._cells(locs)
+        pos = self.nodes.pos
+        alive = self.nodes.alive
+        owners = []
+        slots = []
+        for dx, dy in zip(dxs, dys):
+            lookup = self._key(cells[:, 0] + dx, cells[:, 1] + dy)
+            owner, entry = self._entries(self._keys, lookup)
+            slot = self._slots[entry]
+            dist2 = ((pos[slot] - locs[owner]) ** 2).sum(axis=1)
+            hit = (dist2 <= sizes[owner] ** 2) & alive[slot]
+            owners.append(owner[hit])
+            slots.append(slot[hit])
+
+        return np.concatenate(owners), np.concatenate(slots)
+
+    def query_box(self, lo, hi):
+        self._merge()
+        if not len(self._keys):
+            return np.empty(0, dtype=np.intp)
+        lo_cell = self._cells(np.asarray(lo, dtype=float))
+        hi_cell = self._cells(np.asarray(hi, dtype=float))
+
+        # Keys sort by column first, so within one column
+        # the cells of the box are one contiguous run of keys.
+        first = self._keys[0] // self._STRIDE - self._OFFSET
+        last = self._keys[-1] // self._STRIDE - self._OFFSET
+        cx = np.arange(max(lo_cell[0], first), min(hi_cell[0], last) + 1)
+        start = np.searchsorted(
+            self._keys, self._key(cx, lo_cell[1]), side='left')
+        end = np.searchsorted(
+            self._keys, self._key(cx, hi_cell[1]), side='right')
+        slots = self._slots[ragged_arange(start, end - start)]
+        return self._in_box(slots, lo, hi)
+
+    def query_pairs_array(self, r):
+        reach, dxs, dys = self._offsets(r)
+        if reach > self.max_reach:
+            return self._fallback.query_pairs_array(r)
+        self._merge()
+
+        alive = self.nodes.alive[self._slots]
+        keys = self._keys[alive]
+        slots = self._slots[alive]
+        pos = self.nodes.pos[slots]
+        cx = keys // self._STRIDE - self._OFFSET
+        cy = keys % self._STRIDE - self._OFFSET
+
+        # Only look in one half of the neighbourhood,
+        # the other half finds the same pairs from the other end.
+        half = (dys > 0) | ((dys == 0) & (dxs >= 0))
+        pairs = []
+        for dx, dy in zip(dxs[half], dys[half]):
+            a, b = self._entries(keys, self._key(cx + dx, cy + dy))
+            if dx == 0 and dy == 0:
+                a, b = a[a < b], b[a < b]
+            dist2 = ((pos[a] - pos[b]) ** 2).sum(axis=1)
+            near = dist2 <= r ** 2
+            pairs.append(np.column_stack((slots[a[near]], slots[b[near]])))
+
+        pairs = np.concatenate(pairs) if pairs else np.empty((0, 2), np.intp)
+        pairs.sort(axis=1)
+        return pairs
+
+
+INDEXES = {
+    'kdtree': KDTreeIndex,
+    'grid': GridIndex,
+    }
@@ -0,0 +1,390 @@
+"""
+tasks.py: run simulation commands off the UI thread.
+
+Tk may only be used from the thread running its mainloop,
+and a long computation on that thread freezes the window.
+`Worker` runs commands one at a time on a background thread,
+so the simulation only ever has one thread touching it,
+and `UIQueue` carries drawing back to the UI thread,
+which drains it periodically (with Tk's `after`).
+
+Long computations call `progress` now and then.
+That reports how far along the running task is,
+and is where a cancelled task stops.
+Outside of a task it does nothing,
+so headless code can call it freely.
+
+Nothing here imports tkinter.
+"""
+
+from concurrent.futures import Future, ProcessPoolExecutor, as_completed
+import concurrent.futures
+import multiprocessing
+import queue
+import threading
+import time
+
+import numpy as np
+
+
+class Cancelled(Exception):
+    """Raised in a cancelled task at its next `progress` call."""
+
+
+_local = threading.local()
+
+
+def progress(fraction, message=None):
+    """
+    Report that the running task is `fraction` (0 to 1) done,
+    or raise `Cancelled` if it was cancelled.
+    Does nothing outside of a task.
+    """
+    task = getattr(_local, 'task', None)
+    if task is not None:
+        task.report(fraction, message)
+
+
+def process_context(start_method=None):
+    """
+    `multiprocessing` context for worker processes.
+
+    By default workers start from a clean process,
+    through a fork server where the platform has one,
+    else by spawning: forking a process that runs threads
+    (like the GUI, with Tk and the `Worker`) can deadlock the child
+    on a lock some other thread held.
+    Such workers need everything they are sent to be picklable,
+    functions included (so defined in a module).
+    `'fork'` lifts that, for scripts without threads only.
+    """
+    if start_method is None:
+        start_method = (
+            'forkserver'
+            if 'forkserver' in multiprocessing.get_all_start_methods()
+            else 'spawn'
+            )
+    return multiprocessing.get_context(start_method)
+
+
+def process_map(fn, items, workers=None, start_method=None, message=None):
+    """
+    Call `fn(item)` for each of `items` over a pool of `workers`
+    processes (None for one per CPU), and yield
+    (index of the item, result) in the order they finish.
+
+    `fn` is sent once per worker instead of with every item,
+    so a `functools.partial` can carry large shared arguments.
+    Every finished item reports `progress` with `message`.
+    If the caller stops early (the task is cancelled, or the
+    generator abandoned), items that have not started are dropped.
+    """
+    with ProcessPoolExecutor(
+            workers,
+            mp_context=process_context(start_method),
+            initializer=_init_process,
+            initargs=(fn,),
+            ) as pool:
+        futures = {
+            pool.submit(_call_process, item): num
+            for num, item in enumerate(items)
+            }
+        try:
+            for done, future in enumerate(as_completed(futures)):
+                progress(done / len(futures), message)
+                yield futures[future], future.result()
+        finally:
+            # Do not wait for results nobody will read
+            pool.shutdown(cancel_futures=True)
+
+
+# Function of the `process_map` a worker process belongs to
+_process = {}
+
+
+def _init_process(fn):
+    _process['fn'] = fn
+
+
+def _call_process(item):
+    return _process['fn'](item)
+
+
+class Task:
+    """
+    A command submitted to a `Worker`.
+
+    Attributes
+    ----------
+
+    name
+        What the task is, for display.
+
+    future
+        `concurrent.futures.Future` with the result.
+
+    fraction, message
+        Last progress report, None before the first.
+
+    """
+    def __init__(self, name):
+        self.name = name
+        self.future = Future()
+        self.fraction = None
+        self.message = None
+        self._cancel = threading.Event()
+
+    def __repr__(self):
+        return f"<Task {self.name}>"
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def cancel(self):
+        """
+        Cancel the task. Pending tasks never start,
+        a running one stops at its next `progress` call.
+        """
+        self._cancel.set()
+        self.future.cancel()
+
+    def report(self, fraction, message=None):
+        if self._cancel.is_set():
+            raise Cancelled(self.name)
+        self.fraction = fraction
+        self.message = message
+
+    def result(self, timeout=None):
+        return self.future.result(timeout)
+
+
+class Worker:
+    """
+    Runs tasks in submission order on one background thread.
+
+    Attributes
+    ----------
+
+    current
+        The running `Task`, None while idle.
+
+    pending
+        Number of tasks waiting to start.
+
+    lock
+        Held while a task runs. Other threads that read
+        what the tasks modify can try to acquire it
+        to know the state is consistent.
+
+    """
+    def __init__(self, name='sim-worker'):
+        self.current = None
+        self.lock = threading.Lock()
+        self._queue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    @property
+    def pending(self):
+        return self._queue.qsize()
+
+    def in_worker(self):
+        """Whether the calling thread is the worker."""
+        return threading.current_thread() is self._thread
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Queue `fn(*args, **kwargs)` and return its `Task`.
+
+        Called from within a task (e.g. by a script),
+        `fn` runs right away as part of that task instead,
+        since queueing it would wait on itself.
+        """
+        task = Task(getattr(fn, '__name__', repr(fn)))
+        if self.in_worker():
+            task.future.set_running_or_notify_cancel()
+            try:
+                task.future.set_result(fn(*args, **kwargs))
+            except BaseException as e:
+                task.future.set_exception(e)
+            return task
+
+        self._queue.put((task, fn, args, kwargs))
+        return task
+
+    def cancel(self):
+        """Cancel the running task and every pending one."""
+        task = self.current
+        if task is not None:
+            task.cancel()
+        while True:
+            try:
+                task, *_ = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if task is None:
+                # Keep the shutdown request
+                self._queue.put((None, None, None, None))
+                break
+            task.cancel()
+
+    def shutdown(self, wait=True):
+        """Stop after the pending tasks."""
+        self._queue.put((None, None, None, None))
+        if wait:
+            self._thread.join()
+
+    def _run(self):
+        while True:
+            task, fn, args, kwargs = self._queue.get()
+            if task is None:
+                return
+            if not task.future.set_running_or_notify_cancel():
+                continue
+
+            with self.lock:
+                self.current = _local.task = task
+                try:
+                    result = fn(*args, **kwargs)
+                except BaseException as e:
+                    task.future.set_exception(e)
+                else:
+                    task.future.set_result(result)
+                finally:
+                    self.current = _local.task = None
+
+
+class UIQueue:
+    """
+    Calls to make on the UI thread, from any thread.
+
+    Create it on the UI thread, and have that thread `drain` it
+    regularly; everything posted runs in order.
+    """
+    def __init__(self):
+        self.thread = threading.current_thread()
+        self._queue = queue.SimpleQueue()
+
+    def on_ui(self):
+        """Whether the calling thread is the UI thread."""
+        return threading.current_thread() is self.thread
+
+    def post(self, fn, *args, **kwargs):
+        """Queue `fn(*args, **kwargs)`, return a future of its result."""
+        future = Future()
+        self._queue.put((future, fn, args, kwargs))
+        return future
+
+    def call(self, fn, *args, **kwargs):
+        """
+        Run `fn(*args, **kwargs)` on the UI thread and return its result,
+        waiting for the UI thread to get to it if needed.
+        """
+        if self.on_ui():
+            return fn(*args, **kwargs)
+        return self.post(fn, *args, **kwargs).result()
+
+    def wait(self, future, interval=0.02):
+        """
+        Wait for `future` and return its result.
+        On the UI thread the queue keeps being drained meanwhile,
+        so that a task waiting on the UI does not deadlock.
+        """
+        if not self.on_ui():
+            return future.result()
+        while True:
+            try:
+                return future.result(interval)
+            except concurrent.futures.TimeoutError:
+                self.drain()
+
+    def drain(self, budget=None):
+        """
+        Make the queued calls, stopping early once `budget` seconds
+        have passed (if given). Returns the number of calls made.
+        """
+        start = time.perf_counter()
+        num = 0
+        while budget is None or time.perf_counter() - start < budget:
+            try:
+                future, fn, args, kwargs = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            num += 1
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                result = fn(*args, **kwargs)
+            except BaseException as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+        return num
+
+
+class OnUI:
+    """
+    Proxy that makes every call to `obj`'s methods on the UI thread.
+
+    Objects the calls return (and attributes read through it)
+    are proxied the same way, apart from plain values,
+    so e.g. `OnUI(plt, ui).subplots()` gives a proxied figure and axes.
+    """
+    _PLAIN = (type(None), bool, int, float, complex, str, bytes, np.generic)
+
+    def __init__(self, obj, ui):
+        object.__setattr__(self, '_obj', obj)
+        object.__setattr__(self, '_ui', ui)
+
+    def __repr__(self):
+        return f"OnUI({self._obj!r})"
+
+    def _wrap(self, value):
+        if isinstance(value, self._PLAIN):
+            return value
+        if isinstance(value, np.ndarray):
+            if value.dtype != object:
+                return value
+            wrapped = np.empty(value.shape, dtype=object)
+            wrapped.flat[:] = [self._wrap(item) for item in value.flat]
+            return wrapped
+        if isinstance(value, (tuple, list)):
+            return type(value)(map(self._wrap, value))
+        return OnUI(value, self._ui)
+
+    @staticmethod
+    def _unwrap(value):
+        if isinstance(value, OnUI):
+            return value._obj
+        if isinstance(value, (tuple, list)):
+            return type(value)(map(OnUI._unwrap, value))
+        return value
+
+    def __getattr__(self, name):
+        return self._wrap(getattr(self._obj, name))
+
+    def __setattr__(self, name, value):
+        self._ui.call(setattr, self._obj, name, self._unwrap(value))
+
+    def __call__(self, *args, **kwargs):
+        return self._wrap(self._ui.call(
+            self._obj,
+            *map(self._unwrap, args),
+            **{k: self._unwrap(v) for k, v in kwargs.items()},
+            ))
+
+    def __getitem__(self, key):
+        return self._wrap(self._ui.call(self._obj.__getitem__, key))
+
+    def __iter__(self):
+        return iter(self._wrap(self._ui.call(list, self._obj)))
+
+    def __len__(self):
+        return self._ui.call(len, self._obj)
+
+    def __enter__(self):
+        return self._wrap(self._ui.call(self._obj.__enter__))
+
+    def __exit__(self, *exc):
+        return self._ui.call(self._obj.__exit__, *exc)
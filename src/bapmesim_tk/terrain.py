@@ -0,0 +1,453 @@
+"""
+terrain.py: lazily loaded, tiled terrain rasters.
+
+Nothing is read when a terrain is opened.
+Reads go through square tiles at some resolution level
+(level `n` is decimated by `2 ** n`),
+which are kept in an LRU cache with a memory budget,
+so only the parts of a large DEM that a view
+or a computation actually touches are ever in memory.
+
+Binary PPM/PGM files are memory mapped,
+ASCII ones are parsed once,
+and everything else is read through rasterio windows,
+which lets GDAL serve decimated reads from overviews.
+"""
+
+import numpy as np
+
+from .cache import LRUCache
+from . import view
+
+
+def _ppm_header(path):
+    """
+    Parse the header of a PNM (PGM/PPM) file.
+
+    Returns the magic number, width, height, maxval
+    and the offset of the first data byte.
+    """
+    with open(path, 'rb') as f:
+        head = f.read(4096)
+
+    tokens = []
+    pos = 0
+    while len(tokens) < 4:
+        if pos >= len(head):
+            raise ValueError(f"Truncated PNM header in {path}")
+        char = head[pos:pos + 1]
+        if char == b'#':
+            pos = head.index(b'\n', pos)
+        elif char.isspace():
+            pos += 1
+        else:
+            end = pos
+            while end < len(head) and not head[end:end + 1].isspace():
+                end += 1
+            tokens.append(head[pos:end])
+            pos = end
+
+    magic = tokens[0].decode('ascii')
+    if magic not in ('P2', 'P3', 'P5', 'P6'):
+        raise ValueError(f"Unsupported PNM type {magic} in {path}")
+    width, height, maxval = map(int, tokens[1:])
+    # Exactly one whitespace byte separates the header from the data
+    return magic, width, height, maxval, pos + 1
+
+
+def _read_pnm(path, band):
+    """
+    Return band `band` (1-based, like rasterio) of a PGM/PPM file,
+    memory mapped for binary files.
+    """
+    magic, width, height, maxval, offset = _ppm_header(path)
+    channels = 3 if magic in ('P3', 'P6') else 1
+    if not 1 <= band <= channels:
+        raise ValueError(f"{path} has no band {band}")
+    dtype = np.uint16 if maxval > 255 else np.uint8
+
+    if magic in ('P5', 'P6'):
+        # Binary PNM stores 16 bit samples big endian
+        data = np.memmap(
+            path,
+            dtype=np.dtype(dtype).newbyteorder('>'),
+            mode='r',
+            offset=offset,
+            shape=(height, width, channels),
+            )
+    else:
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            data = np.array(f.read().split(), dtype=dtype).reshape(
+                height, width, channels)
+    return data[:, :, band - 1]
+
+
+class ArraySource:
+    """Tile source backed by an array or memory map."""
+    def __init__(self, array):
+        self.array = array
+        self.shape = array.shape
+        self.dtype = np.dtype(array.dtype).newbyteorder('=')
+
+    @property
+    def nbytes(self):
+        """Memory held by the array, memory maps hold none."""
+        return 0 if isinstance(self.array, np.memmap) else self.array.nbytes
+
+    def read(self, rows, cols, factor):
+        """Read full resolution `rows` and `cols` (slices), every `factor`th pixel."""
+        return np.array(
+            self.array[rows.start:rows.stop:factor, cols.start:cols.stop:factor],
+            dtype=self.dtype,
+            )
+
+
+class RasterioSource:
+    """Tile source backed by windowed rasterio reads."""
+    def __init__(self, path, band):
+        import rasterio
+        self.dataset = rasterio.open(path)
+        self.band = band
+        self.shape = self.dataset.shape
+        self.dtype = np.dtype(self.dataset.dtypes[band - 1])
+
+    def read(self, rows, cols, factor):
+        from rasterio.windows import Window
+        return self.dataset.read(
+            self.band,
+            window=Window(
+                cols.start, rows.start,
+                cols.stop - cols.start, rows.stop - rows.start
+                ),
+            # Decimated reads are served from overviews where available
+            out_shape=(
+                -(-(rows.stop - rows.start) // factor),
+                -(-(cols.stop - cols.start) // factor),
+                ),
+            )
+
+
+class DisplaySource:
+    """
+    Tile source with the values of another terrain
+    mapped onto uint8 grey levels.
+
+    Coarse levels are converted from
+    the coarse levels of the underlying terrain,
+    so they never touch its full resolution data.
+    """
+    def __init__(self, terrain, value_range):
+        self.terrain = terrain
+        self.value_range = value_range
+        self.shape = terrain.shape
+        self.dtype = np.dtype(np.uint8)
+
+    @property
+    def nbytes(self):
+        return self.terrain.nbytes
+
+    def read(self, rows, cols, factor):
+        level = int(np.log2(factor))
+        return to_uint8(
+            self.terrain.read(
+                slice(rows.start // factor, -(-rows.stop // factor)),
+                slice(cols.start // factor, -(-cols.stop // factor)),
+                level
+                ),
+            *self.value_range
+            )
+
+
+class PixelTransform:
+    """
+    Affine mapping between world coordinates
+    and continuous (column, row) pixel coordinates,
+    pixel = world * scale + offset.
+    Pixel (c, r) covers [c, c + 1) x [r, r + 1).
+
+    Defaults to the `view.PX_PER_UNIT` / `view.ORIGIN_PX` convention
+    the terrain is drawn with.
+    The inverse is computed once, so mapping either way
+    is one multiply-add per coordinate.
+    """
+    def __init__(self, scale=view.PX_PER_UNIT, offset=view.ORIGIN_PX):
+        self.scale = np.broadcast_to(np.asarray(scale, dtype=float), 2).copy()
+        self.offset = np.broadcast_to(np.asarray(offset, dtype=float), 2).copy()
+        self._inv_scale = 1 / self.scale
+        self._inv_offset = -self.offset / self.scale
+
+    def to_pixel(self, pos):
+        """World (x, y) to pixel (column, row)."""
+        return np.asarray(pos, dtype=float) * self.scale + self.offset
+
+    def to_world(self, pix):
+        """Pixel (column, row) to world (x, y)."""
+        return np.asarray(pix, dtype=float) * self._inv_scale + self._inv_offset
+
+
+class Terrain:
+    """
+    Lazily read, tiled, single band raster.
+
+    Use `Terrain.open` for files and `Terrain.from_array`
+    for rasters that are already in memory.
+
+    Attributes
+    ----------
+
+    path
+        File the terrain was read from, None for arrays.
+
+    band
+        Band of `path` the terrain was read from.
+
+    shape
+        (rows, columns) at full resolution.
+
+    dtype
+        Data type of the samples.
+
+    tile_size
+        Side of the square tiles, in pixels of their level.
+
+    cache
+        `LRUCache` of tiles, keyed by (terrain, level, tile row, tile column).
+        Several terrains can share one cache and one memory budget.
+
+    transform
+        `PixelTransform` placing the full resolution pixels in the world.
+
+    """
+    def __init__(
+            self, source, path=None, band=1,
+            tile_size=256, cache_bytes=256 << 20, cache=None, transform=None):
+        self.source = source
+        self.path = path
+        self.band = band
+        self.shape = tuple(source.shape)
+        self.dtype = source.dtype
+        self.tile_size = tile_size
+        self.cache = LRUCache(cache_bytes) if cache is None else cache
+        self.transform = PixelTransform() if transform is None else transform
+
+    @classmethod
+    def open(cls, path, band=1, **kwargs):
+        """Open the terrain in `path` without reading any of it."""
+        if str(path).lower().endswith(('.ppm', '.pgm', '.pnm')):
+            source = ArraySource(_read_pnm(path, band))
+        else:
+            source = RasterioSource(path, band)
+        return cls(source, path=path, band=band, **kwargs)
+
+    @classmethod
+    def from_array(cls, array, **kwargs):
+        return cls(ArraySource(np.asarray(array)), **kwargs)
+
+    @property
+    def nbytes(self):
+        """Memory held by the raster itself, not counting cached tiles."""
+        return getattr(self.source, 'nbytes', 0)
+
+    def display(self, value_range=None, **kwargs):
+        """
+        Return a uint8 display pyramid of this terrain:
+        a `Terrain` of grey levels for `value_range`
+        (default `value_range()`), converted tile by tile
+        the first time each tile of each level is read.
+        """
+        if value_range is None:
+            value_range = self.value_range()
+        return Terrain(
+            DisplaySource(self, value_range),
+            path=self.path,
+            band=self.band,
+            tile_size=self.tile_size,
+            transform=self.transform,
+            **kwargs
+            )
+
+    @property
+    def num_levels(self):
+        """Number of levels until the whole raster fits in one tile."""
+        size = max(self.shape)
+        return max(1, int(np.ceil(np.log2(max(size / self.tile_size, 1)))) + 1)
+
+    def level_for(self, factor):
+        """Coarsest level with at most `factor` full resolution pixels per pixel."""
+        level = int(np.floor(np.log2(max(factor, 1))))
+        return min(level, self.num_levels - 1)
+
+    def value_range(self):
+        """
+        Range of values to map onto black to white for display:
+        the full range of integer types,
+        the range of the coarsest level for floats.
+        """
+        if np.issubdtype(self.dtype, np.integer):
+            info = np.iinfo(self.dtype)
+            return info.min, info.max
+        overview = self.read(level=self.num_levels - 1)
+        return np.nanmin(overview), np.nanmax(overview)
+
+    def level_shape(self, level):
+        factor = 2 ** level
+        return tuple(-(-n // factor) for n in self.shape)
+
+    def tile(self, level, ty, tx):
+        """Return tile (`ty`, `tx`) of `level`, reading it if necessary."""
+        key = (self, level, ty, tx)
+        tile = self.cache.get(key)
+        if tile is None:
+            factor = 2 ** level
+            span = self.tile_size * factor
+            rows = slice(ty * span, min((ty + 1) * span, self.shape[0]))
+            cols = slice(tx * span, min((tx + 1) * span, self.shape[1]))
+            tile = self.source.read(rows, cols, factor)
+            self.cache.put(key, tile)
+        return tile
+
+    def read(self, rows=None, cols=None, level=0):
+        """
+        Read a window of `level`.
+
+        `rows` and `cols` are slices in pixels of that level,
+        clipped to the raster. Defaults to everything.
+        """
+        height, width = self.level_shape(level)
+        r0, r1, _ = (rows or slice(None)).indices(height)
+        c0, c1, _ = (cols or slice(None)).indices(width)
+        out = np.empty((max(r1 - r0, 0), max(c1 - c0, 0)), dtype=self.dtype)
+
+        size = self.tile_size
+        for ty in range(r0 // size, -(-r1 // size)):
+            for tx in range(c0 // size, -(-c1 // size)):
+                tile = self.tile(level, ty, tx)
+                # Overlap of the tile and the window, in level pixels
+                y0, y1 = max(r0, ty * size), min(r1, (ty + 1) * size)
+                x0, x1 = max(c0, tx * size), min(c1, (tx + 1) * size)
+                out[y0 - r0:y1 - r0, x0 - c0:x1 - c0] = tile[
+                    y0 - ty * size:y1 - ty * size,
+                    x0 - tx * size:x1 - tx * size,
+                    ]
+        return out
+
+    def sample(self, rows, cols, level=0, fill=0.0):
+        """
+        Return the values at integer pixels (`rows`, `cols`) of `level`
+        as float32, `fill` for pixels outside the raster.
+
+        Pixels are fetched tile by tile,
+        so only the tiles that are hit are ever read.
+        """
+        rows = np.asarray(rows, dtype=np.intp)
+        cols = np.asarray(cols, dtype=np.intp)
+        out = np.full(rows.shape, fill, dtype=np.float32)
+        height, width = self.level_shape(level)
+        inside = (rows >= 0) & (rows < height) & (cols >= 0) & (cols < width)
+        rows = rows[inside]
+        cols = cols[inside]
+
+        if level == 0 and isinstance(self.source, ArraySource):
+            # Already in memory or memory mapped, no need for tiles
+            out[inside] = self.source.array[rows, cols]
+            return out
+
+        size = self.tile_size
+        tiles_across = -(-width // size)
+        tile_ids = (rows // size) * tiles_across + cols // size
+        order = np.argsort(tile_ids, kind='stable')
+        tile_ids = tile_ids[order]
+        bounds = np.flatnonzero(np.diff(tile_ids)) + 1
+        values = np.empty(len(rows), dtype=np.float32)
+        for first, group in zip(
+                np.concatenate(([0], bounds)), np.split(order, bounds)):
+            if not len(group):
+                continue
+            ty, tx = divmod(int(tile_ids[first]), tiles_across)
+            tile = self.tile(level, ty, tx)
+            values[group] = tile[
+                rows[group] - ty * size, cols[group] - tx * size]
+        out[inside] = values
+        return out
+
+    def interpolate(self, cols, rows, level=0, fill=0.0, gradient=False):
+        """
+        Bilinearly interpolate `level` at continuous pixel coordinates
+        (`cols`, `rows`) into float32, `fill` outside the raster.
+        Pixel values sit at pixel centres,
+        the half pixel along the edges extends the border values.
+
+        With `gradient`, also return the derivatives
+        along columns and rows, in value units per pixel.
+        """
+        cols = np.asarray(cols, dtype=float)
+        rows = np.asarray(rows, dtype=float)
+        height, width = self.level_shape(level)
+
+        u = cols - 0.5
+        v = rows - 0.5
+        c0 = np.floor(u)
+        r0 = np.floor(v)
+        fx = (u - c0).astype(np.float32)
+        fy = (v - r0).astype(np.float32)
+        c0 = c0.astype(np.intp)
+        r0 = r0.astype(np.intp)
+        c1 = np.clip(c0 + 1, 0, width - 1)
+        r1 = np.clip(r0 + 1, 0, height - 1)
+        np.clip(c0, 0, width - 1, out=c0)
+        np.clip(r0, 0, height - 1, out=r0)
+
+        # All four corners in one gather, so every tile is fetched once
+        z00, z01, z10, z11 = self.sample(
+            np.concatenate((r0, r0, r1, r1)),
+            np.concatenate((c0, c1, c0, c1)),
+            level,
+            ).reshape(4, -1)
+        top = z01 - z00
+        top *= fx
+        top += z00
+        bottom = z11 - z10
+        bottom *= fx
+        bottom += z10
+        value = bottom - top
+        value *= fy
+        value += top
+
+        outside = ~((cols >= 0) & (cols < width) & (rows >= 0) & (rows < height))
+        value[outside] = fill
+        if not gradient:
+            return value
+        d_col = (z01 - z00) * (1 - fy) + (z11 - z10) * fy
+        d_row = bottom - top
+        d_col[outside] = fill
+        d_row[outside] = fill
+        return value, d_col, d_row
+
+    def elevation(self, pos, fill=0.0, gradient=False):
+        """
+        Bilinear value of the full resolution raster
+        at world positions `pos`, see `interpolate`.
+        """
+        pix = self.transform.to_pixel(pos).reshape(-1, 2)
+        return self.interpolate(pix[:, 0], pix[:, 1], fill=fill, gradient=gradient)
+
+    def slope(self, pos, fill=np.nan):
+        """
+        Slope in degrees at world positions `pos`,
+        with elevation units per pixel as horizontal scale,
+        like the hillshade. `fill` outside the raster.
+        """
+        _, d_col, d_row = self.elevation(pos, fill=fill, gradient=True)
+        return np.degrees(np.arctan(np.hypot(d_col, d_row)))
+
+    def __array__(self, dtype=None, copy=None):
+        """The whole raster at full resolution, read through the tiles."""
+        array = self.read()
+        return array if dtype is None else array.astype(dtype)
+
+
+def to_uint8(array, lo, hi):
+    """Map `lo`..`hi` onto 0..255, NaN to 0."""
+    scaled = (np.asarray(array, dtype=np.float32) - lo) * (255 / max(hi - lo, 1e-12))
+    return np.nan_to_num(np.clip(scaled, 0, 255)).astype(np.uint8)
@@ -0,0 +1,55 @@
+"""
+unionfind.py: disjoint-set forest for incremental connectivity.
+"""
+
+
+class UnionFind:
+    """
+    Disjoint sets over the integers `0..n-1`.
+
+    Uses union by size and path halving.
+    Parents and sizes are kept in plain lists,
+    which is much faster than numpy for single-element access.
+
+    Attributes
+    ----------
+
+    num_sets
+        Current number of disjoint sets.
+
+    largest
+        Size of the largest set.
+
+    """
+    def __init__(self, n: int):
+        self.parent = list(range(n))
+        self.size = [1] * n
+        self.num_sets = n
+        self.largest = 1 if n else 0
+
+    def find(self, x: int) -> int:
+        parent = self.parent
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    def union(self, a: int, b: int) -> bool:
+        """Merge the sets of `a` and `b`, return whether they were distinct."""
+        a = self.find(a)
+        b = self.find(b)
+        if a == b:
+            return False
+
+        if self.size[a] < self.size[b]:
+            a, b = b, a
+        self.parent[b] = a
+        self.size[a] += self.size[b]
+        self.num_sets -= 1
+        if self.size[a] > self.largest:
+            self.largest = self.size[a]
+        return True
+
+    def set_size(self, x: int) -> int:
+        """Return the size of the set containing `x`."""
+        return self.size[self.find(x)]
@@ -0,0 +1,88 @@
+"""
+view.py: mapping between world coordinates and canvas pixels.
+"""
+
+import numpy as np
+
+# The original fixed canvas transform,
+# which is also how terrain pixels are placed in the world:
+# pixel = world * PX_PER_UNIT + ORIGIN_PX
+PX_PER_UNIT = 50
+ORIGIN_PX = 200
+
+
+class View:
+    """
+    Pan and zoom state of the canvas.
+
+    Attributes
+    ----------
+
+    origin
+        World coordinates of the top left canvas pixel.
+
+    scale
+        Canvas pixels per world unit.
+
+    width, height
+        Size of the canvas in pixels.
+
+    """
+    min_scale = 1e-4
+    max_scale = 1e5
+
+    def __init__(self, width, height, scale=PX_PER_UNIT, origin=None):
+        self.width = width
+        self.height = height
+        self.scale = scale
+        if origin is None:
+            origin = (-ORIGIN_PX / PX_PER_UNIT, -ORIGIN_PX / PX_PER_UNIT)
+        self.origin = np.array(origin, dtype=float)
+
+    @property
+    def shape(self):
+        """Canvas shape as (rows, columns), like an image."""
+        return self.height, self.width
+
+    @property
+    def bounds(self):
+        """World coordinates of the top left and bottom right corners."""
+        return self.origin, self.origin + np.array(
+            (self.width, self.height)) / self.scale
+
+    def to_screen(self, pos):
+        """World coordinates to canvas pixels, works on (n, 2) arrays."""
+        return (np.asarray(pos) - self.origin) * self.scale
+
+    def to_world(self, cpair):
+        """Canvas pixels to world coordinates."""
+        x, y = self.origin + np.asarray(cpair, dtype=float) / self.scale
+        return x, y
+
+    def contains(self, pos):
+        """Mask of the positions in `pos` that are inside the view."""
+        lo, hi = self.bounds
+        return ((pos >= lo) & (pos <= hi)).all(axis=1)
+
+    def pan(self, dx, dy):
+        """Move the picture by (`dx`, `dy`) pixels."""
+        self.origin -= np.array((dx, dy)) / self.scale
+
+    def zoom(self, factor, about=None):
+        """
+        Zoom in by `factor` (out if below 1),
+        keeping the world point under canvas pixel `about` in place.
+        `about` defaults to the centre of the canvas.
+        """
+        if about is None:
+            about = (self.width / 2, self.height / 2)
+        fixed = self.to_world(about)
+        self.scale = float(np.clip(
+            self.scale * factor, self.min_scale, self.max_scale))
+        self.origin = np.array(fixed) - np.asarray(about) / self.scale
+
+    def pixel_centres(self):
+        """World x coordinates of every column, y of every row."""
+        xs = self.origin[0] + (np.arange(self.width) + 0.5) / self.scale
+        ys = self.origin[1] + (np.arange(self.height) + 0.5) / self.scale
+        return xs, ys
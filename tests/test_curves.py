@@ -0,0 +1,117 @@
+"""
+Connectivity curves must match a `make_graph` at every range,
+and shower curves a `make_graph` after the impacts of every step.
+"""
+
+import copy
+
+import numpy as np
+import pytest
+
+from bapmesim_tk.sim import Sim
+
+
+def graph_stats(sim, node_range):
+    sim.make_graph(node_range)
+    alive = sim.components >= 0
+    sizes = np.bincount(sim.components[alive])
+    return (
+        np.count_nonzero(sim.path_lengths >= 0),
+        sim.num_components,
+        sizes.max(initial=0),
+        )
+
+
+def check_curve(sim, ranges):
+    curve = sim.connectivity_curve(ranges)
+    for i, node_range in enumerate(curve.ranges):
+        assert graph_stats(sim, node_range) == (
+            curve.root_size[i], curve.num_components[i], curve.largest[i])
+
+    if np.isfinite(curve.critical_range):
+        assert graph_stats(sim, curve.critical_range)[0] == sim.num_nodes
+        below = np.nextafter(curve.critical_range, 0)
+        assert graph_stats(sim, below)[0] < sim.num_nodes
+
+
+def edge_lengths(sim, node_range):
+    pairs = sim.query_pairs(node_range)
+    pos = sim.nodes_pos
+    return np.linalg.norm(pos[pairs[:, 0]] - pos[pairs[:, 1]], axis=1)
+
+
+@pytest.mark.parametrize('seed', range(4))
+def test_random_layout(seed):
+    rng = np.random.default_rng(seed)
+    sim = Sim(rng=seed)
+    sim.scatter_nodes(150, (0, 0), 1)
+    sim.scatter_nodes(60, (2, 1), 0.5)
+    sim.strike(sim.random_impacts(3), 0.3)
+    # Ranges right on edge lengths, and in between
+    lengths = edge_lengths(sim, 0.6)
+    ranges = np.concatenate((
+        rng.choice(lengths, 20), np.linspace(0, 1.5, 31)))
+    check_curve(sim, ranges)
+
+
+def test_ties_on_rings():
+    # Nodes on rings are spaced at equal distances,
+    # so many pairs sit exactly at the same range
+    sim = Sim(rng=0)
+    sim.circles([0.5, 1], [6, 12], (0, 0))
+    check_curve(sim, np.concatenate((
+        [0.5, 1.0], edge_lengths(sim, 2), np.linspace(0, 2, 41))))
+
+
+def test_ties_on_grid():
+    sim = Sim(rng=0)
+    sim.deploy('square_grid', (0, 0), 0.25, (8, 8))
+    check_curve(sim, [0.25, np.hypot(0.25, 0.25), 0.5, 0.2])
+
+
+def test_empty():
+    curve = Sim().connectivity_curve([0.5, 1])
+    assert curve.critical_range == np.inf
+    assert not curve.num_components.any()
+
+
+def check_shower(sim, times, locs, sizes, node_range, steps=None):
+    curve = sim.shower_curve(times, locs, sizes, node_range, steps)
+    sizes = np.broadcast_to(sizes, len(locs))
+    for i, step in enumerate(curve.steps):
+        struck = copy.deepcopy(sim)
+        # Keep the slots put, to compare death times
+        struck.nodes.compact_threshold = np.inf
+        hit = times <= step
+        struck.strike(locs[hit], sizes[hit])
+        np.testing.assert_array_equal(
+            struck.alive, curve.death_times > step)
+        struck.make_graph(node_range)
+        assert curve.num_nodes[i] == struck.num_nodes
+        assert curve.num_connected[i] == np.count_nonzero(
+            struck.path_lengths >= 0)
+
+
+@pytest.mark.parametrize('seed', range(4))
+def test_shower(seed):
+    rng = np.random.default_rng(seed)
+    sim = Sim(rng=seed)
+    sim.scatter_nodes(150, (0, 0), 1)
+    sim.scatter_nodes(60, (2, 1), 0.5)
+    sim.strike(sim.random_impacts(2), 0.3)
+    num = 12
+    # Repeated times hit at the same step
+    times = rng.integers(0, 6, num).astype(float)
+    check_shower(
+        sim, times, sim.random_impacts(num), rng.uniform(0.1, 0.6, num), 0.4)
+
+
+def test_shower_steps():
+    sim = Sim(rng=1)
+    sim.scatter_nodes(120, (0, 0), 1)
+    times = np.array([1.0, 2.0, 3.0])
+    # Steps before, between, on and after the impacts,
+    # and the root is the first to go
+    locs = np.concatenate((sim.nodes_pos[:1], sim.random_impacts(2)))
+    check_shower(
+        sim, times, locs, 0.5, 0.4, steps=[0, 0.5, 1, 1.5, 2, 3, 10])
@@ -0,0 +1,90 @@
+"""
+Array graph results must match networkx on small random layouts.
+"""
+
+import networkx as nx
+import numpy as np
+import pytest
+
+from bapmesim_tk import resilience
+from bapmesim_tk.sim import Sim
+
+NODE_RANGE = 0.6
+
+
+def struck_sim(seed, **kwargs):
+    sim = Sim(rng=seed, **kwargs)
+    for center in sim.rng.uniform(-2, 2, size=(3, 2)):
+        sim.scatter_nodes(50, center, 0.8)
+    sim.strike(sim.random_impacts(3), [0.4, 0.6, 0.8])
+    sim.make_graph(NODE_RANGE)
+    return sim
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_to_networkx(seed):
+    sim = struck_sim(seed)
+    nx_sim = struck_sim(seed, graph_engine='networkx')
+    exported = sim.to_networkx()
+    assert sorted(exported.nodes) == np.flatnonzero(sim.alive).tolist()
+    assert nx.utils.graphs_equal(
+        nx.Graph(exported.edges), nx.Graph(nx_sim.graph.edges))
+    assert exported.number_of_nodes() == nx_sim.graph.number_of_nodes()
+
+
+@pytest.mark.parametrize('seed', range(4))
+def test_articulation_points_and_bridges(seed):
+    sim = struck_sim(seed)
+    G = sim.to_networkx()
+    points, bridges = resilience.articulation_points_and_bridges(
+        sim.adjacency)
+    assert points.tolist() == sorted(nx.articulation_points(G))
+    assert set(map(frozenset, bridges.tolist())) \
+        == set(map(frozenset, nx.bridges(G)))
+
+
+@pytest.mark.parametrize('seed', range(2))
+def test_betweenness_exact(seed):
+    sim = struck_sim(seed)
+    # Small enough an error that every node is a source
+    result = resilience.betweenness(sim.adjacency, epsilon=1e-3, workers=0)
+    assert result.epsilon == 0
+
+    G = sim.to_networkx()
+    G.remove_nodes_from(list(nx.isolates(G)))
+    exact = nx.betweenness_centrality(G)
+    nodes = sorted(exact)
+    np.testing.assert_allclose(
+        result.values[nodes], [exact[v] for v in nodes], atol=1e-12)
+    isolated = np.ones(sim.nodes.size, dtype=bool)
+    isolated[nodes] = False
+    assert not result.values[isolated].any()
+
+
+def test_betweenness_within_bound():
+    sim = struck_sim(5)
+    result = resilience.betweenness(
+        sim.adjacency, epsilon=0.2, delta=0.01, workers=0, rng=0)
+    assert 0 < result.samples < sim.nodes.num_alive
+    assert result.epsilon <= 0.2
+
+    G = sim.to_networkx()
+    G.remove_nodes_from(list(nx.isolates(G)))
+    exact = nx.betweenness_centrality(G)
+    nodes = sorted(exact)
+    error = np.abs(result.values[nodes] - [exact[v] for v in nodes])
+    assert error.max() <= result.epsilon
+
+
+@pytest.mark.parametrize('seed', range(4))
+def test_node_connectivity_bound(seed):
+    sim = Sim(rng=seed)
+    sim.scatter_nodes(60, (0, 0), 0.6)
+    sim.make_graph(NODE_RANGE)
+    result = resilience.node_connectivity(sim.adjacency, pairs=64, rng=seed)
+
+    G = sim.to_networkx()
+    largest = G.subgraph(max(nx.connected_components(G), key=len))
+    assert result.bound >= nx.node_connectivity(largest)
+    assert result.bound <= result.min_degree \
+        == min(degree for _, degree in largest.degree)
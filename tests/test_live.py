@@ -0,0 +1,110 @@
+"""
+The live graph must match a full `make_graph` after any edits.
+"""
+
+import copy
+
+import numpy as np
+import pytest
+
+from bapmesim_tk.los import LineOfSight
+from bapmesim_tk.sim import Sim
+from bapmesim_tk.terrain import PixelTransform, Terrain
+
+NODE_RANGE = 0.6
+
+
+def snapshot(sim):
+    return (
+        sim.adjacency.copy(),
+        sim.components.copy(),
+        sim.num_components,
+        sim.path_lengths.copy(),
+        )
+
+
+def assert_same_graph(live, full):
+    adj, components, num_components, path_lengths = live
+    full_adj, full_components, full_num, full_paths = full
+
+    assert adj.shape == full_adj.shape
+    assert (adj != full_adj).nnz == 0
+    np.testing.assert_array_equal(path_lengths, full_paths)
+    assert num_components == full_num
+
+    # Same partition, whatever the labels
+    alive = full_components >= 0
+    np.testing.assert_array_equal(components >= 0, alive)
+    assert len(np.unique(components[alive])) == full_num
+    assert len(np.unique(np.column_stack(
+        (components[alive], full_components[alive])), axis=0)) == full_num
+
+
+def check_against_make_graph(sim, link_model='range'):
+    """Compare with a full rebuild of a copy, leaving `sim` alone."""
+    full = copy.deepcopy(sim)
+    full.untrack()
+    if full.los is not None:
+        full.los.clear()
+    full.make_graph(NODE_RANGE, link_model)
+    assert_same_graph(snapshot(sim), snapshot(full))
+
+
+def random_edits(sim, rng, num_edits, check):
+    for _ in range(num_edits):
+        if rng.random() < 0.5 or not sim.nodes.num_alive:
+            sim.scatter_nodes(
+                int(rng.integers(1, 60)), rng.uniform(-4, 4, 2),
+                rng.uniform(0.2, 2))
+        else:
+            sim.strike(
+                sim.random_impacts(int(rng.integers(1, 4))),
+                rng.uniform(0.1, 1.5, 1))
+        check()
+
+
+@pytest.mark.parametrize('index', ['kdtree', 'grid'])
+@pytest.mark.parametrize('seed', range(4))
+def test_edits_match_make_graph(index, seed):
+    rng = np.random.default_rng(seed)
+    sim = Sim(index=index, rng=seed)
+    sim.scatter_nodes(100, (0, 0), 1.5)
+    sim.track(NODE_RANGE)
+    random_edits(sim, rng, 60, lambda: check_against_make_graph(sim))
+
+
+def test_batched_edits_match_make_graph():
+    rng = np.random.default_rng(7)
+    sim = Sim(rng=7)
+    sim.track(NODE_RANGE)
+    for _ in range(10):
+        with sim.batch():
+            random_edits(sim, rng, 8, lambda: None)
+        check_against_make_graph(sim)
+
+
+def test_los_edits_match_make_graph():
+    rng = np.random.default_rng(3)
+    sim = Sim(rng=3)
+    sim.terrain = Terrain.from_array(
+        rng.uniform(0, 2, (90, 90)).astype(np.float32),
+        transform=PixelTransform((10, 10), (45, 45)))
+    # Small enough for the cache to have to forget pairs
+    sim.los = LineOfSight(sim.terrain, mast_height=1.5, max_pairs=500)
+    sim.scatter_nodes(150, (0, 0), 1.5)
+    sim.track(NODE_RANGE, 'los')
+    random_edits(sim, rng, 40, lambda: check_against_make_graph(sim, 'los'))
+    assert len(sim.los) <= sim.los.max_pairs
+
+
+def test_reset_keeps_link_model():
+    rng = np.random.default_rng(4)
+    sim = Sim(rng=4)
+    sim.terrain = Terrain.from_array(
+        rng.uniform(0, 2, (90, 90)).astype(np.float32),
+        transform=PixelTransform((10, 10), (45, 45)))
+    sim.los = LineOfSight(sim.terrain, mast_height=1.5)
+    sim.track(NODE_RANGE, 'los')
+    sim.reset()
+    sim.scatter_nodes(150, (0, 0), 1.5)
+    check_against_make_graph(sim, 'los')
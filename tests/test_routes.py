@@ -0,0 +1,105 @@
+"""
+Gateway routes must match a search from every gateway on its own.
+"""
+
+import networkx as nx
+import numpy as np
+import pytest
+
+from bapmesim_tk.sim import Sim
+
+NODE_RANGE = 0.6
+
+
+def check_routes(sim, gateways=None):
+    routes = sim.gateway_routes(gateways)
+    G = sim.to_networkx()
+    hops = np.full(sim.nodes.size, -1)
+    nearest = np.full(sim.nodes.size, -1)
+    for gateway in routes.gateways.tolist():
+        if gateway not in G:
+            continue
+        for node, dist in nx.single_source_shortest_path_length(
+                G, gateway).items():
+            # Ties go to the first gateway
+            if hops[node] < 0 or dist < hops[node]:
+                hops[node] = dist
+                nearest[node] = gateway
+    np.testing.assert_array_equal(routes.hops, hops)
+    np.testing.assert_array_equal(routes.nearest, nearest)
+
+    first = {}
+    for i, gateway in enumerate(routes.gateways.tolist()):
+        first.setdefault(gateway, i)
+    load = np.zeros(len(routes.gateways), dtype=int)
+    served, counts = np.unique(nearest[nearest >= 0], return_counts=True)
+    for gateway, num in zip(served.tolist(), counts):
+        load[first[gateway]] = num
+    np.testing.assert_array_equal(routes.load, load)
+
+
+def clustered_sim(seed):
+    sim = Sim(rng=seed)
+    for center in sim.rng.uniform(-2, 2, size=(4, 2)):
+        sim.scatter_nodes(40, center, 0.7)
+    return sim
+
+
+@pytest.mark.parametrize('seed', range(4))
+def test_routes_match_search(seed):
+    sim = clustered_sim(seed)
+    sim.make_graph(NODE_RANGE)
+    check_routes(sim)
+    # Strikes after the graph was built, dead gateways and duplicates
+    sim.strike(sim.random_impacts(3), [0.3, 0.5, 0.7])
+    check_routes(sim)
+    rng = np.random.default_rng(seed)
+    gateways = rng.choice(sim.nodes.size, 8)
+    check_routes(sim, np.concatenate((gateways, gateways[:2])))
+
+
+@pytest.mark.parametrize('seed', range(2))
+def test_tracked_routes_match_search(seed):
+    sim = clustered_sim(seed)
+    sim.track(NODE_RANGE)
+    sim.scatter_nodes(40, (0, 0), 1.0)
+    sim.strike(sim.random_impacts(2), 0.5)
+    check_routes(sim)
+
+
+def test_stale_graph_is_refused():
+    sim = Sim(rng=5)
+    sim.scatter_nodes(100, (0, 0), 1.0)
+    sim.make_graph(NODE_RANGE)
+    size = sim.nodes.size
+
+    # Same number of slots again, but renumbered
+    sim.scatter_nodes(50, (3, 0), 0.5)
+    sim.strike([[3, 0]], [10.0])
+    sim.scatter_nodes(size, (0, 0), 1.0)
+    sim.compact()
+    assert sim.nodes.size == size
+    with pytest.raises(ValueError):
+        sim.gateway_routes()
+
+    sim.make_graph(NODE_RANGE)
+    sim.gateway_routes()
+
+
+def test_graph_follows_compaction():
+    sim = Sim(rng=6)
+    sim.scatter_nodes(200, (0, 0), 1.0)
+    sim.make_graph(NODE_RANGE)
+    sim.strike([[0.5, 0.5]], [0.5])
+    before = sim.gateway_routes()
+    alive = sim.alive.copy()
+    ids = sim.nodes.ids.copy()
+
+    sim.compact()
+    after = sim.gateway_routes()
+    np.testing.assert_array_equal(after.hops, before.hops[alive])
+    reached = after.nearest >= 0
+    np.testing.assert_array_equal(reached, before.nearest[alive] >= 0)
+    np.testing.assert_array_equal(
+        sim.nodes.ids[after.nearest[reached]],
+        ids[before.nearest[alive][reached]])
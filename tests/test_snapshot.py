@@ -0,0 +1,134 @@
+"""
+Sims on top of shared snapshots and checkpoints
+must behave like the sim they were made from.
+"""
+
+import copy
+
+import numpy as np
+import pytest
+
+from bapmesim_tk.sim import Sim
+from bapmesim_tk.snapshot import Snapshot
+
+NODE_RANGE = 0.6
+
+
+def make_sim(index):
+    sim = Sim(index=index, cell_size=NODE_RANGE, rng=7)
+    for center in sim.rng.uniform(-3, 3, size=(5, 2)):
+        sim.scatter_nodes(60, center, 1.0)
+    sim.make_graph(NODE_RANGE)
+    return sim
+
+
+def assert_same_sim(sim, other):
+    for name in ('pos', 'cluster', 'ids', 'alive'):
+        np.testing.assert_array_equal(
+            getattr(other.nodes, name), getattr(sim.nodes, name))
+    assert other.nodes.next_id == sim.nodes.next_id
+    for name in ('starts', 'heads', 'counts'):
+        np.testing.assert_array_equal(
+            getattr(other.clusters, name), getattr(sim.clusters, name))
+    assert other.clusters.end == sim.clusters.end
+
+    assert (other.adjacency != sim.adjacency).nnz == 0
+    np.testing.assert_array_equal(other.path_lengths, sim.path_lengths)
+    np.testing.assert_array_equal(other.components, sim.components)
+    np.testing.assert_array_equal(
+        other.query_pairs(NODE_RANGE), sim.query_pairs(NODE_RANGE))
+    for lo, hi in [((-1, -1), (1, 1)), ((-9, -9), (9, 2))]:
+        np.testing.assert_array_equal(
+            other.nodes_in_box(lo, hi), sim.nodes_in_box(lo, hi))
+
+
+def same_edits(*sims):
+    """Strike, add and rebuild the same way on every sim."""
+    locs = sims[0].random_impacts(3)
+    pos = np.random.default_rng(1).normal(0, 1, (40, 2))
+    for sim in sims:
+        sim.strike(locs, [0.5, 1.0, 1.5])
+        sim.add_cluster(pos)
+        sim.make_graph(NODE_RANGE)
+        sim.compact()
+        sim.gateway_routes()
+
+
+@pytest.mark.parametrize('index', ['grid', 'kdtree'])
+def test_state_round_trip(index):
+    sim = make_sim(index)
+    sim.strike(sim.random_impacts(2), 0.5)
+    arrays, meta = sim.state()
+    # `from_state` uses the arrays without copying
+    other = Sim.from_state(
+        {key: array.copy() for key, array in arrays.items()}, meta)
+    assert_same_sim(sim, other)
+    # The random state goes along
+    np.testing.assert_array_equal(
+        other.random_impacts(4), sim.random_impacts(4))
+    same_edits(sim, other)
+    assert_same_sim(sim, other)
+
+
+@pytest.mark.parametrize('index', ['grid', 'kdtree'])
+def test_checkpoint_round_trip(index, tmp_path):
+    sim = make_sim(index)
+    sim.strike(sim.random_impacts(2), 0.5)
+    path = tmp_path / 'sim.npz'
+    sim.save(path)
+    saved = copy.deepcopy(sim)
+    loaded = Sim.load(path)
+    assert_same_sim(sim, loaded)
+    same_edits(sim, loaded)
+    assert_same_sim(sim, loaded)
+
+    # Edits never reach the file
+    assert_same_sim(saved, Sim.load(path))
+
+
+def test_checkpoint_without_graph(tmp_path):
+    sim = make_sim('grid')
+    path = tmp_path / 'sim.npz'
+    sim.save(path, graph=False)
+    loaded = Sim.load(path)
+    assert getattr(loaded, 'adjacency', None) is None
+    with pytest.raises(ValueError):
+        loaded.gateway_routes()
+    loaded.make_graph(NODE_RANGE)
+    assert_same_sim(sim, loaded)
+
+
+@pytest.mark.parametrize('index', ['grid', 'kdtree'])
+def test_snapshot_round_trip(index):
+    sim = make_sim(index)
+    sim.strike(sim.random_impacts(2), 0.5)
+    with sim.publish() as snap:
+        attached = Snapshot.attach(snap.name)
+        shared = attached.sim(rng=0)
+        assert_same_sim(sim, shared)
+        sim.rng = np.random.default_rng(0)
+        same_edits(sim, shared)
+        assert_same_sim(sim, shared)
+        del shared
+        attached.close()
+
+
+@pytest.mark.parametrize('index', ['grid', 'kdtree'])
+def test_compact_snapshot(index):
+    sim = make_sim(index)
+    with sim.publish() as snap:
+        shared = snap.sim()
+        shared.strike([[0, 0]], [1.5])
+        expected = shared.nodes_pos[shared.alive]
+        ids = shared.nodes.ids[shared.alive]
+
+        shared.compact()
+        np.testing.assert_array_equal(shared.nodes_pos, expected)
+        np.testing.assert_array_equal(shared.nodes.ids, ids)
+        assert shared.alive.all()
+
+        # The snapshot itself is left alone
+        np.testing.assert_array_equal(snap.arrays['pos'], sim.nodes_pos)
+
+        shared.make_graph(NODE_RANGE)
+        del shared
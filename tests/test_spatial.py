@@ -0,0 +1,113 @@
+"""
+The grid index must find exactly what the KDTree index
+and a brute force search find, through any edits.
+"""
+
+import numpy as np
+import pytest
+
+from bapmesim_tk.sim import Sim
+
+CELL_SIZE = 0.25
+
+
+def sorted_pairs(pairs):
+    pairs = np.sort(np.asarray(pairs).reshape(-1, 2), axis=1)
+    return pairs[np.lexsort((pairs[:, 1], pairs[:, 0]))]
+
+
+def brute_pairs(sim, r):
+    alive = np.flatnonzero(sim.alive)
+    pos = sim.nodes_pos[alive]
+    dist2 = ((pos[:, None] - pos[None]) ** 2).sum(axis=2)
+    i, j = np.nonzero(np.triu(dist2 <= r ** 2, k=1))
+    return sorted_pairs(np.column_stack((alive[i], alive[j])))
+
+
+def brute_ball(sim, locs, sizes):
+    dist2 = ((locs[:, None] - sim.nodes_pos[None]) ** 2).sum(axis=2)
+    owners, slots = np.nonzero(
+        (dist2 <= np.asarray(sizes)[:, None] ** 2) & sim.alive)
+    return sorted_pairs(np.column_stack((owners, slots)))
+
+
+def brute_box(sim, lo, hi, dead):
+    inside = ((sim.nodes_pos >= lo) & (sim.nodes_pos <= hi)).all(axis=1)
+    return np.flatnonzero(inside if dead else inside & sim.alive)
+
+
+def check_queries(sims, rng):
+    grid, kdtree = sims
+    # Ranges within and beyond the grid's reach,
+    # and exactly on a pair's distance
+    pos = grid.nodes_pos
+    on_pair = float(np.sqrt(((pos[0] - pos[-1]) ** 2).sum()))
+    for r in [0.1, CELL_SIZE, 0.6, 5 * CELL_SIZE, min(on_pair, 2.0)]:
+        expected = brute_pairs(grid, r)
+        for sim in sims:
+            np.testing.assert_array_equal(
+                sorted_pairs(sim.query_pairs(r)), expected)
+
+    locs = grid.random_impacts(5)
+    sizes = rng.uniform(0, 1.5, 5)
+    expected = brute_ball(grid, locs, sizes)
+    for sim in sims:
+        np.testing.assert_array_equal(
+            sorted_pairs(np.column_stack(sim.query_ball(locs, sizes))),
+            expected)
+
+    # Small boxes go through the index, large ones through a mask
+    center = grid.random_impacts(1)[0]
+    for half in [0.05, 0.3, 1.0, 3.0]:
+        lo, hi = center - half, center + half
+        for dead in [False, True]:
+            expected = brute_box(grid, lo, hi, dead)
+            for sim in sims:
+                np.testing.assert_array_equal(
+                    sim.nodes_in_box(lo, hi, dead), expected)
+
+
+@pytest.mark.parametrize('seed', range(4))
+def test_grid_matches_kdtree(seed):
+    rng = np.random.default_rng(seed)
+    sims = [
+        Sim(index='grid', cell_size=CELL_SIZE, rng=seed),
+        Sim(index='kdtree', rng=seed),
+        ]
+    for _ in range(16):
+        edit = rng.random()
+        if edit < 0.5 or not sims[0].nodes.num_alive:
+            pos = rng.normal(
+                rng.uniform(-2, 2, 2), rng.uniform(0.2, 1), (40, 2))
+            # Some nodes exactly on cell borders
+            pos[:5] = np.round(pos[:5] / CELL_SIZE) * CELL_SIZE
+            for sim in sims:
+                sim.add_cluster(pos)
+        elif edit < 0.85:
+            locs = sims[0].random_impacts(2)
+            sizes = rng.uniform(0.2, 1.0, 2)
+            for sim in sims:
+                sim.strike(locs, sizes)
+        else:
+            for sim in sims:
+                sim.compact()
+        for sim in sims[1:]:
+            np.testing.assert_array_equal(sim.alive, sims[0].alive)
+        if sims[0].nodes.num_alive:
+            check_queries(sims, rng)
+
+
+def test_batched_inserts():
+    rng = np.random.default_rng(9)
+    sims = [
+        Sim(index='grid', cell_size=CELL_SIZE, rng=9),
+        Sim(index='kdtree', rng=9),
+        ]
+    for sim in sims:
+        with sim.batch():
+            for center in [(0, 0), (1, 1), (-1, 2)]:
+                sim.add_cluster(
+                    np.random.default_rng(1).normal(center, 0.5, (30, 2)))
+            # Queries inside the batch see the pending inserts
+            assert len(sim.query_pairs(0.3)) == len(brute_pairs(sim, 0.3))
+    check_queries(sims, rng)